@@ -11,6 +11,7 @@ from dotenv import load_dotenv
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app.database.catalogue import bump_catalogue_version
 from app.database.models import async_session, Server
 from sqlalchemy import select
 
@@ -60,6 +61,7 @@ async def add_server():
             max_clients=max_clients
         )
         session.add(server)
+        await bump_catalogue_version(session)
         await session.commit()
 
         logger.info(f"✅ Сервер добавлен: {server_name} ({location})")
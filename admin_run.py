@@ -9,11 +9,19 @@ import sys
 
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from app.database.models import create_tables
+from app.api.pool import client_pool
+from app.database.fsm_storage import (
+    FSM_PURGE_INTERVAL,
+    DatabaseStorage,
+    create_fsm_storage,
+)
+from app.database.migrations import ensure_schema
 from app.handlers.admin import router as admin_router
-from app.middlewares.admin_auth import AdminAuthMiddleware
+from app.middlewares import AdminAuthMiddleware, DbSessionMiddleware
+from app.services.broadcast import broadcasts
+from app.utils.sender import SEND_STATS_INTERVAL, outbound
+from app.utils.tasks import start_periodic, stop_background_tasks
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -27,17 +35,41 @@ if not TOKEN:
 
 # Инициализация бота и диспетчера
 bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# Все запросы к Telegram проходят через планировщик с лимитами
+bot.session.middleware(outbound)
+fsm_storage = create_fsm_storage()
+dp = Dispatcher(storage=fsm_storage)
 
 # Подключаем роутер админ-бота
 dp.include_router(admin_router)
 
+# Одна сессия БД на апдейт
+dp.update.outer_middleware(DbSessionMiddleware())
+
 # Добавляем middleware для проверки прав администратора
 # Применяем после include_router для правильной работы
 dp.message.middleware(AdminAuthMiddleware())
 dp.callback_query.middleware(AdminAuthMiddleware())
 
 
+async def on_startup(bot: Bot) -> None:
+    """Запуск фоновых задач и продолжение прерванных рассылок."""
+    start_periodic(outbound.log_stats, SEND_STATS_INTERVAL, "send_stats")
+    if isinstance(fsm_storage, DatabaseStorage):
+        start_periodic(fsm_storage.purge_expired, FSM_PURGE_INTERVAL, "fsm_purge")
+    await broadcasts.resume(bot)
+
+
+dp.startup.register(on_startup)
+
+# Сохранение курсора рассылок, остановка фоновых задач, отложенные удаления
+# и закрытие сессий 3x-ui
+dp.shutdown.register(broadcasts.close)
+dp.shutdown.register(stop_background_tasks)
+dp.shutdown.register(outbound.close)
+dp.shutdown.register(client_pool.close_all)
+
+
 async def main() -> None:
     """Основная функция запуска админ-бота."""
     # Настройка логирования
@@ -50,7 +82,7 @@ async def main() -> None:
     logging.info("Starting VPN Admin Bot...")
     logging.info(f"Log level: {LOG_LEVEL}")
 
-    await create_tables()
+    await ensure_schema()
 
     bot_info = await bot.get_me()
     logging.info(f"Admin bot started as @{bot_info.username}")
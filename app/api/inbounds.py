@@ -0,0 +1,148 @@
+"""
+Кэш метаданных inbound'ов 3x-ui.
+
+Список inbound'ов панели содержит настройки всех клиентов и растёт линейно
+с числом пользователей. Для выдачи ключей нужны только id, порт, протокол
+и streamSettings, поэтому храним их по серверу с TTL.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from app.api.pool import client_pool
+from app.utils.vpn import VlessLinkTemplate, extract_base_host
+
+if TYPE_CHECKING:
+    from app.database.models import Server
+
+logger = logging.getLogger(__name__)
+
+INBOUND_CACHE_TTL = float(os.getenv("INBOUND_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class InboundInfo:
+    """Метаданные inbound'а без списка клиентов."""
+
+    id: int
+    port: int
+    protocol: str
+    tag: str
+    remark: str
+    enable: bool
+    stream_settings_raw: str
+    stream_settings: Dict[str, Any] = field(default_factory=dict)
+    link_template: Optional[VlessLinkTemplate] = None
+
+    @classmethod
+    def from_panel(cls, inbound: Dict[str, Any], base_host: str) -> "InboundInfo":
+        """Собрать метаданные из ответа /panel/api/inbounds/list."""
+        raw = inbound.get("streamSettings") or "{}"
+        try:
+            stream_settings = json.loads(raw)
+        except (TypeError, ValueError):
+            stream_settings = {}
+        return cls(
+            id=inbound["id"],
+            port=inbound.get("port", 0),
+            protocol=inbound.get("protocol", ""),
+            tag=inbound.get("tag", ""),
+            remark=inbound.get("remark", ""),
+            enable=inbound.get("enable", True),
+            stream_settings_raw=raw,
+            stream_settings=stream_settings,
+            link_template=VlessLinkTemplate.build(base_host, stream_settings),
+        )
+
+
+class InboundCatalogue:
+    """Кэш inbound'ов по серверам с TTL и ручной инвалидацией."""
+
+    def __init__(self, ttl: float = INBOUND_CACHE_TTL) -> None:
+        self.ttl = ttl
+        # server_id -> (api_url, fetched_at, inbounds)
+        self._entries: Dict[int, Tuple[str, float, List[InboundInfo]]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _is_fresh(self, server: "Server") -> bool:
+        entry = self._entries.get(server.id)
+        return (
+            entry is not None
+            and entry[0] == server.api_url
+            and time.monotonic() - entry[1] < self.ttl
+        )
+
+    async def get_inbounds(
+        self, server: "Server", force: bool = False
+    ) -> Optional[List[InboundInfo]]:
+        """
+        Получить inbound'ы сервера из кэша или из панели.
+
+        Args:
+            server: Сервер 3x-ui
+            force: Игнорировать TTL и перечитать список из панели
+
+        Returns:
+            Список InboundInfo или None, если панель недоступна и кэша нет
+        """
+        if not force and self._is_fresh(server):
+            return self._entries[server.id][2]
+
+        lock = self._locks.setdefault(server.id, asyncio.Lock())
+        async with lock:
+            # Пока ждали блокировку, список мог обновить другой запрос
+            if not force and self._is_fresh(server):
+                return self._entries[server.id][2]
+
+            inbounds = await self._fetch(server)
+            if inbounds is None:
+                stale = self._entries.get(server.id)
+                if stale and stale[0] == server.api_url:
+                    logger.warning(
+                        f"Панель {server.name} недоступна, используем кэш inbounds"
+                    )
+                    return stale[2]
+                return None
+
+            self._entries[server.id] = (server.api_url, time.monotonic(), inbounds)
+            return inbounds
+
+    async def get_default_inbound(
+        self, server: "Server", force: bool = False
+    ) -> Optional[InboundInfo]:
+        """Inbound для выдачи новых ключей (первый в списке панели)."""
+        inbounds = await self.get_inbounds(server, force=force)
+        return inbounds[0] if inbounds else None
+
+    def invalidate(self, server_id: Optional[int] = None) -> None:
+        """Сбросить кэш одного сервера или всех серверов."""
+        if server_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(server_id, None)
+
+    @staticmethod
+    async def _fetch(server: "Server") -> Optional[List[InboundInfo]]:
+        client = await client_pool.acquire(server)
+        if not client:
+            return None
+
+        resp = await client.get_inbounds()
+        if not resp.get("success"):
+            logger.error(f"Не удалось получить inbounds {server.name}: {resp}")
+            return None
+
+        base_host = extract_base_host(server.api_url)
+        return [
+            InboundInfo.from_panel(inbound, base_host)
+            for inbound in resp.get("obj") or []
+        ]
+
+
+# Общий кэш на процесс
+inbound_catalogue = InboundCatalogue()
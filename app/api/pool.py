@@ -0,0 +1,80 @@
+"""
+Реестр долгоживущих клиентов 3x-ui.
+
+Один авторизованный клиент (и одна aiohttp-сессия с keep-alive) на сервер,
+вместо login/close на каждую операцию.
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from app.api.three_x_ui import ThreeXUIClient
+
+if TYPE_CHECKING:
+    from app.database.models import Server
+
+logger = logging.getLogger(__name__)
+
+
+class ThreeXUIClientPool:
+    """Процессный реестр клиентов 3x-ui, ключ — Server.id."""
+
+    def __init__(self) -> None:
+        # server_id -> ((api_url, username, password), client)
+        self._clients: Dict[int, Tuple[Tuple[str, str, str], ThreeXUIClient]] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, server: "Server") -> Optional[ThreeXUIClient]:
+        """
+        Получить авторизованный клиент для сервера.
+
+        Клиент не нужно закрывать после использования — сессия переиспользуется.
+
+        Args:
+            server: Сервер 3x-ui
+
+        Returns:
+            ThreeXUIClient или None, если авторизация не удалась
+        """
+        credentials = (server.api_url, server.username, server.password)
+        stale: Optional[ThreeXUIClient] = None
+
+        async with self._lock:
+            entry = self._clients.get(server.id)
+            if entry and entry[0] != credentials:
+                # Данные сервера изменились в админке — пересоздаём клиента
+                stale = entry[1]
+                entry = None
+            if not entry:
+                entry = (credentials, ThreeXUIClient(*credentials))
+                self._clients[server.id] = entry
+
+        if stale:
+            await stale.close()
+
+        client = entry[1]
+        if not await client.ensure_login():
+            logger.error(f"Не удалось авторизоваться на сервере {server.name}")
+            return None
+        return client
+
+    async def invalidate(self, server_id: int) -> None:
+        """Закрыть и забыть клиента сервера (например, после удаления сервера)."""
+        async with self._lock:
+            entry = self._clients.pop(server_id, None)
+        if entry:
+            await entry[1].close()
+
+    async def close_all(self) -> None:
+        """Закрыть все сессии (вызывается при остановке диспетчера)."""
+        async with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+        for _, client in entries:
+            await client.close()
+        logger.info(f"Закрыто сессий 3x-ui: {len(entries)}")
+
+
+# Общий реестр на процесс
+client_pool = ThreeXUIClientPool()
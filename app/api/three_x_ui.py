@@ -1,7 +1,47 @@
+import asyncio
 import aiohttp
 import json
+import logging
+import os
 import uuid
-from typing import Optional, Dict, Any, Tuple
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Connection tuning for long-lived panel sessions
+XUI_CONNECTIONS_PER_HOST = int(os.getenv("XUI_CONNECTIONS_PER_HOST", "10"))
+XUI_KEEPALIVE_TIMEOUT = float(os.getenv("XUI_KEEPALIVE_TIMEOUT", "60"))
+XUI_REQUEST_TIMEOUT = float(os.getenv("XUI_REQUEST_TIMEOUT", "30"))
+# Clients per addClient request in add_clients()
+XUI_ADD_CLIENTS_CHUNK = int(os.getenv("XUI_ADD_CLIENTS_CHUNK", "100"))
+
+
+class PanelAuthError(Exception):
+    """The panel session expired and logging in again failed."""
+
+
+@dataclass
+class ClientSpec:
+    """Client to be created by ThreeXUIClient.add_clients()."""
+
+    email: str
+    total_gb: int = 0
+    expiry_time: int = 0
+    enable: bool = True
+    sub_id: str = ""
+    uuid: str = field(default_factory=lambda: str(uuid.uuid4()))
+
+
+@dataclass
+class ClientResult:
+    """Outcome of creating one client."""
+
+    email: str
+    uuid: str
+    success: bool
+    msg: str = ""
 
 
 class ThreeXUIClient:
@@ -10,12 +50,25 @@ class ThreeXUIClient:
         self.username = username
         self.password = password
         self.session: Optional[aiohttp.ClientSession] = None
+        self.is_authenticated = False
+        # Generation counter lets concurrent callers share a single re-login
+        self._auth_generation = 0
+        self._login_lock = asyncio.Lock()
 
     async def _ensure_session(self):
-        if not self.session:
+        if not self.session or self.session.closed:
             # Use unsafe=True to accept cookies from IP addresses
             jar = aiohttp.CookieJar(unsafe=True)
-            self.session = aiohttp.ClientSession(cookie_jar=jar)
+            connector = aiohttp.TCPConnector(
+                limit_per_host=XUI_CONNECTIONS_PER_HOST,
+                keepalive_timeout=XUI_KEEPALIVE_TIMEOUT,
+            )
+            self.session = aiohttp.ClientSession(
+                cookie_jar=jar,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=XUI_REQUEST_TIMEOUT),
+            )
+            self.is_authenticated = False
 
     async def login(self) -> bool:
         """
@@ -32,19 +85,81 @@ class ThreeXUIClient:
                     try:
                         data = await resp.json()
                         if data.get("success"):
+                            self._mark_authenticated()
                             return True
                     except aiohttp.ContentTypeError:
                         pass
 
                     cookies = self.session.cookie_jar.filter_cookies(self.base_url)
                     if len(cookies) > 0:
+                        self._mark_authenticated()
                         return True
 
+                self.is_authenticated = False
                 return False
-        except Exception as e:
-            print(f"Login exception: {e}")
+        except Exception:
+            logger.exception(f"Login to {self.base_url} failed")
+            self.is_authenticated = False
             return False
 
+    def _mark_authenticated(self) -> None:
+        self.is_authenticated = True
+        self._auth_generation += 1
+
+    async def ensure_login(self) -> bool:
+        """
+        Log in only if the session is not authenticated yet.
+        Concurrent callers wait for a single login attempt.
+        """
+        if self.is_authenticated:
+            return True
+        async with self._login_lock:
+            if self.is_authenticated:
+                return True
+            return await self.login()
+
+    async def _relogin(self, generation: int) -> bool:
+        """Re-login after the panel dropped our session (once per generation)."""
+        async with self._login_lock:
+            if self._auth_generation != generation and self.is_authenticated:
+                return True
+            self.is_authenticated = False
+            return await self.login()
+
+    def _is_login_page(self, url: Any) -> bool:
+        """The login page is served at the panel base path or {base}/login."""
+        base_path = urlparse(self.base_url).path.rstrip("/")
+        path = urlparse(str(url)).path.rstrip("/")
+        return path in (base_path, f"{base_path}/login")
+
+    def _is_auth_failure(self, resp: aiohttp.ClientResponse) -> bool:
+        """
+        The panel answers an expired session with 401/403 or a redirect
+        to the login page (HTML instead of JSON).
+        Other redirects (e.g. http -> https) are not auth failures.
+        """
+        if resp.status in (401, 403):
+            return True
+        if resp.history:
+            return self._is_login_page(resp.url)
+        return resp.status == 200 and resp.content_type == "text/html"
+
+    async def _request(self, method: str, url: str, **kwargs) -> aiohttp.ClientResponse:
+        """
+        Perform a request on the shared session.
+        Transparently re-logs in once if the panel session has expired.
+        Raises PanelAuthError if logging in again fails.
+        """
+        await self._ensure_session()
+        generation = self._auth_generation
+        resp = await self.session.request(method, url, **kwargs)
+        if self._is_auth_failure(resp):
+            resp.release()
+            if not await self._relogin(generation):
+                raise PanelAuthError(f"Login to {self.base_url} failed")
+            resp = await self.session.request(method, url, **kwargs)
+        return resp
+
     async def get_inbounds(self) -> Dict[str, Any]:
         """
         Fetch list of inbounds.
@@ -53,7 +168,11 @@ class ThreeXUIClient:
         # Correct path found via debugging: /panel/api/inbounds/list (plural 'inbounds')
         url = f"{self.base_url}/panel/api/inbounds/list"
 
-        async with self.session.get(url) as resp:
+        try:
+            resp = await self._request("GET", url)
+        except PanelAuthError as e:
+            return {"success": False, "msg": str(e)}
+        async with resp:
             try:
                 if resp.status != 200:
                     return {"success": False, "msg": f"Status {resp.status}"}
@@ -64,25 +183,37 @@ class ThreeXUIClient:
                     "msg": f"Invalid Content-Type at {url}. Status: {resp.status}",
                 }
 
-    async def add_client(
-        self,
-        inbound_id: int,
-        email: str,
-        total_gb: int = 0,
-        expiry_time: int = 0,
-        enable: bool = True,
-        sub_id: str = "",
-    ) -> Tuple[bool, str, str]:
+    async def get_online_clients(self) -> Optional[List[str]]:
         """
-        Add a new client to the specified inbound.
-        Refined in debug: The main path is /panel/api/inbounds/addClient (plural 'inbounds')
+        Fetch emails of clients currently online.
+        Path: /panel/api/inbounds/onlines
+        Returns None if the panel did not answer.
         """
         await self._ensure_session()
 
-        client_uuid = str(uuid.uuid4())
+        url = f"{self.base_url}/panel/api/inbounds/onlines"
+        try:
+            async with await self._request("POST", url) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    if data.get("success"):
+                        return data.get("obj") or []
+        except Exception:
+            logger.exception(f"Fetching online clients from {self.base_url} failed")
+
+        return None
 
-        # 3x-ui client structure
-        client_data = {
+    @staticmethod
+    def _build_client_data(
+        client_uuid: str,
+        email: str,
+        total_gb: int,
+        expiry_time: int,
+        enable: bool,
+        sub_id: str,
+    ) -> Dict[str, Any]:
+        """3x-ui client structure."""
+        return {
             "id": client_uuid,
             "flow": "xtls-rprx-vision",
             "email": email,
@@ -94,7 +225,14 @@ class ThreeXUIClient:
             "subId": sub_id,
         }
 
-        settings = json.dumps({"clients": [client_data]})
+    async def _post_clients(
+        self, inbound_id: int, clients: List[Dict[str, Any]]
+    ) -> Tuple[bool, str]:
+        """
+        POST a list of clients to addClient in a single request.
+        The panel validates the whole list first, so the call is all-or-nothing.
+        """
+        settings = json.dumps({"clients": clients})
 
         payload = {"id": inbound_id, "settings": settings}
 
@@ -102,31 +240,95 @@ class ThreeXUIClient:
         url = f"{self.base_url}/panel/api/inbounds/addClient"
 
         try:
-            async with self.session.post(url, json=payload) as resp:
+            async with await self._request("POST", url, json=payload) as resp:
                 if resp.status == 404:
                     # Fallback to singular
                     url = f"{self.base_url}/panel/api/inbound/addClient"
-                    async with self.session.post(url, json=payload) as resp2:
+                    async with await self._request("POST", url, json=payload) as resp2:
                         try:
                             data = await resp2.json()
-                            return (
-                                data.get("success", False),
-                                data.get("msg", ""),
-                                client_uuid,
-                            )
+                            return data.get("success", False), data.get("msg", "")
                         except Exception:
-                            return False, f"Status {resp2.status} at {url}", client_uuid
+                            return False, f"Status {resp2.status} at {url}"
 
                 try:
                     data = await resp.json()
-                    success = data.get("success", False)
-                    msg = data.get("msg", "")
-                    return success, msg, client_uuid
+                    return data.get("success", False), data.get("msg", "")
                 except Exception:
-                    return False, f"Invalid JSON. Status {resp.status}", client_uuid
+                    return False, f"Invalid JSON. Status {resp.status}"
 
         except Exception as e:
-            return False, str(e), client_uuid
+            logger.exception(f"Adding clients to inbound {inbound_id} failed")
+            return False, str(e)
+
+    async def add_client(
+        self,
+        inbound_id: int,
+        email: str,
+        total_gb: int = 0,
+        expiry_time: int = 0,
+        enable: bool = True,
+        sub_id: str = "",
+        client_uuid: Optional[str] = None,
+    ) -> Tuple[bool, str, str]:
+        """
+        Add a new client to the specified inbound.
+        Refined in debug: The main path is /panel/api/inbounds/addClient (plural 'inbounds')
+        """
+        await self._ensure_session()
+
+        client_uuid = client_uuid or str(uuid.uuid4())
+
+        client_data = self._build_client_data(
+            client_uuid, email, total_gb, expiry_time, enable, sub_id
+        )
+        success, msg = await self._post_clients(inbound_id, [client_data])
+        return success, msg, client_uuid
+
+    async def add_clients(
+        self,
+        inbound_id: int,
+        clients: List["ClientSpec"],
+        chunk_size: int = XUI_ADD_CLIENTS_CHUNK,
+    ) -> List["ClientResult"]:
+        """
+        Add many clients to the inbound, chunk_size clients per addClient call.
+
+        A rejected chunk (e.g. one duplicate email) is retried client by client,
+        so every spec gets its own result.
+
+        Returns:
+            ClientResult for every spec, in the same order
+        """
+        await self._ensure_session()
+
+        results: List[ClientResult] = []
+        for start in range(0, len(clients), max(chunk_size, 1)):
+            chunk = clients[start : start + chunk_size]
+            payload = [
+                self._build_client_data(
+                    spec.uuid,
+                    spec.email,
+                    spec.total_gb,
+                    spec.expiry_time,
+                    spec.enable,
+                    spec.sub_id,
+                )
+                for spec in chunk
+            ]
+            success, msg = await self._post_clients(inbound_id, payload)
+
+            if success or len(chunk) == 1:
+                results.extend(
+                    ClientResult(spec.email, spec.uuid, success, msg) for spec in chunk
+                )
+                continue
+
+            for spec, client_data in zip(chunk, payload):
+                success, msg = await self._post_clients(inbound_id, [client_data])
+                results.append(ClientResult(spec.email, spec.uuid, success, msg))
+
+        return results
 
     async def update_client(
         self,
@@ -144,18 +346,22 @@ class ThreeXUIClient:
         """
         await self._ensure_session()
 
-        client_data = {
-            "id": client_uuid,
-            "flow": "xtls-rprx-vision",
-            "email": email,
-            "limitIp": 0,
-            "totalGB": int(total_gb * 1024 * 1024 * 1024),
-            "expiryTime": expiry_time,
-            "enable": enable,
-            "tgId": "",
-            "subId": sub_id,
-        }
+        client_data = self._build_client_data(
+            client_uuid, email, total_gb, expiry_time, enable, sub_id
+        )
+        return await self.update_client_data(inbound_id, client_data)
+
+    async def update_client_data(
+        self, inbound_id: int, client_data: Dict[str, Any]
+    ) -> bool:
+        """
+        Replace a client with the given raw 3x-ui client dict.
+        Lets callers patch a client taken from the inbound list without
+        resetting fields the bot does not manage (limitIp, tgId, flow...).
+        """
+        await self._ensure_session()
 
+        client_uuid = client_data["id"]
         settings = json.dumps({"clients": [client_data]})
 
         payload = {"id": inbound_id, "settings": settings}
@@ -163,16 +369,40 @@ class ThreeXUIClient:
         url = f"{self.base_url}/panel/api/inbounds/updateClient/{client_uuid}"
 
         try:
-            async with self.session.post(url, json=payload) as resp:
+            async with await self._request("POST", url, json=payload) as resp:
                 if resp.status == 200:
                     try:
                         data = await resp.json()
                         return data.get("success", False)
                     except Exception:
-                        pass
-        except Exception as e:
-            print(f"Update client exception: {e}")
-            pass
+                        logger.warning(f"Invalid JSON from {url}")
+        except Exception:
+            logger.exception(f"Updating client {client_uuid} failed")
+
+        return False
+
+    async def update_inbound(self, inbound: Dict[str, Any]) -> bool:
+        """
+        Replace a whole inbound, client list included, in one request.
+        Path: /panel/api/inbounds/update/{inbound_id}
+        Takes an entry from get_inbounds() with its settings rewritten;
+        clientStats are not sent, the panel keeps traffic rows itself.
+        """
+        await self._ensure_session()
+
+        payload = {k: v for k, v in inbound.items() if k != "clientStats"}
+        url = f"{self.base_url}/panel/api/inbounds/update/{inbound['id']}"
+
+        try:
+            async with await self._request("POST", url, json=payload) as resp:
+                if resp.status == 200:
+                    try:
+                        data = await resp.json()
+                        return data.get("success", False)
+                    except Exception:
+                        logger.warning(f"Invalid JSON from {url}")
+        except Exception:
+            logger.exception(f"Updating inbound {inbound['id']} failed")
 
         return False
 
@@ -186,16 +416,16 @@ class ThreeXUIClient:
         # Path 1: /panel/api/inbounds/{inbound_id}/delClient/{client_uuid}
         url = f"{self.base_url}/panel/api/inbounds/{inbound_id}/delClient/{client_uuid}"
         try:
-            async with self.session.post(url) as resp:
+            async with await self._request("POST", url) as resp:
                 if resp.status == 200:
                     try:
                         data = await resp.json()
                         if data.get("success"):
                             return True
                     except Exception:
-                        pass
+                        logger.warning(f"Invalid JSON from {url}")
         except Exception:
-            pass
+            logger.exception(f"Deleting client {client_uuid} failed")
 
         # Path 2: /panel/api/inbound/delClient/{inbound_id}/client/{client_uuid} (Some versions)
         # Not implementing complex fallback yet, usually path 1 works for 3x-ui
@@ -204,3 +434,4 @@ class ThreeXUIClient:
     async def close(self):
         if self.session:
             await self.session.close()
+        self.is_authenticated = False
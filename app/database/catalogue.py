@@ -0,0 +1,195 @@
+"""
+Кэш каталога тарифов и серверов.
+
+Тарифы и серверы меняются только из админки, а читаются почти на каждом
+апдейте пользовательского бота. Каталог держит их в памяти по id и
+перечитывает целиком, когда меняется счётчик cache_versions.catalogue.
+Запись в любом процессе увеличивает счётчик в той же транзакции, что и
+изменение данных; остальные процессы сверяют его не чаще раза в
+CATALOGUE_CHECK_INTERVAL секунд.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database.models import CacheVersion, Plan, Server, async_session
+from app.utils.locations import location_flag
+
+logger = logging.getLogger(__name__)
+
+# Как часто сверять версию каталога с БД (с)
+CATALOGUE_CHECK_INTERVAL = float(os.getenv("CATALOGUE_CHECK_INTERVAL", "5"))
+
+CATALOGUE_KEY = "catalogue"
+
+# Флаг в session.info: в транзакции менялись тарифы или серверы
+_DIRTY = "catalogue_dirty"
+
+
+async def bump_catalogue_version(session: AsyncSession) -> None:
+    """
+    Увеличить версию каталога в транзакции сессии.
+
+    После коммита кэш этого процесса сбрасывается сразу, остальные
+    процессы увидят новую версию при следующей сверке.
+
+    Args:
+        session: Сессия, в которой меняются тарифы или серверы
+    """
+    result = await session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == CATALOGUE_KEY)
+        .values(version=CacheVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(CacheVersion(name=CATALOGUE_KEY, version=1))
+    session.info[_DIRTY] = True
+
+
+class Catalogue:
+    """Тарифы и серверы по id с проверкой версии в БД."""
+
+    def __init__(self, check_interval: float = CATALOGUE_CHECK_INTERVAL) -> None:
+        self.check_interval = check_interval
+        self._plans: Dict[int, Plan] = {}
+        self._servers: Dict[int, Server] = {}
+        # server_id -> флаг локации, вычисляется при загрузке
+        self._flags: Dict[int, str] = {}
+        # None — каталог не загружен или сброшен
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        # Растёт при каждом сбросе: загрузка, начатая до сброса, не считается свежей
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        """Версия загруженного каталога (ключ для производных кэшей)."""
+        return self._version or 0
+
+    def mark_stale(self) -> None:
+        """Сбросить каталог: следующее обращение перечитает его из БД."""
+        self._version = None
+        self._generation += 1
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._version is not None
+            and time.monotonic() - self._checked_at < self.check_interval
+        )
+
+    async def refresh(self) -> None:
+        """Сверить версию с БД и при расхождении перечитать каталог."""
+        if self._is_fresh():
+            return
+
+        async with self._lock:
+            if self._is_fresh():
+                return
+
+            generation = self._generation
+            async with async_session() as session:
+                # Версию читаем первой: данные после неё не старше её
+                version = (
+                    await session.scalar(
+                        select(CacheVersion.version).where(
+                            CacheVersion.name == CATALOGUE_KEY
+                        )
+                    )
+                    or 0
+                )
+                if version != self._version:
+                    plans = await session.scalars(
+                        select(Plan).order_by(Plan.price, Plan.id)
+                    )
+                    servers = await session.scalars(
+                        select(Server).order_by(Server.name)
+                    )
+                    self._plans = {plan.id: plan for plan in plans}
+                    self._servers = {server.id: server for server in servers}
+                    self._flags = {
+                        server.id: location_flag(server.location)
+                        for server in self._servers.values()
+                    }
+                    logger.info(
+                        f"Каталог загружен (версия {version}): "
+                        f"тарифов {len(self._plans)}, серверов {len(self._servers)}"
+                    )
+
+            if generation == self._generation:
+                self._version = version
+                self._checked_at = time.monotonic()
+
+    # --- Тарифы --------------------------------------------------------------
+
+    async def get_plans(self) -> List[Plan]:
+        """Все тарифы по возрастанию цены."""
+        await self.refresh()
+        return list(self._plans.values())
+
+    async def get_paid_plans(self) -> List[Plan]:
+        """Платные тарифы по возрастанию цены."""
+        return [plan for plan in await self.get_plans() if plan.price > 0]
+
+    async def get_plan(self, plan_id: Optional[int]) -> Optional[Plan]:
+        """Тариф по id."""
+        await self.refresh()
+        return self._plans.get(plan_id) if plan_id is not None else None
+
+    async def get_trial_plan(self) -> Optional[Plan]:
+        """Бесплатный тариф для пробного периода."""
+        return next((plan for plan in await self.get_plans() if plan.price == 0), None)
+
+    # --- Серверы -------------------------------------------------------------
+
+    async def get_servers(self) -> List[Server]:
+        """Все серверы по имени."""
+        await self.refresh()
+        return list(self._servers.values())
+
+    async def get_active_servers(self) -> List[Server]:
+        """Включённые серверы по имени."""
+        return [server for server in await self.get_servers() if server.is_active]
+
+    async def get_server(self, server_id: Optional[int]) -> Optional[Server]:
+        """Сервер по id."""
+        await self.refresh()
+        return self._servers.get(server_id) if server_id is not None else None
+
+    def get_location_flag(self, server: Server) -> str:
+        """Флаг локации сервера (для серверов вне каталога вычисляется на месте)."""
+        flag = self._flags.get(server.id)
+        return flag if flag is not None else location_flag(server.location)
+
+    async def get_active_server(self) -> Optional[Server]:
+        """Первый включённый сервер."""
+        await self.refresh()
+        return next(
+            (
+                self._servers[server_id]
+                for server_id in sorted(self._servers)
+                if self._servers[server_id].is_active
+            ),
+            None,
+        )
+
+
+catalogue = Catalogue()
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_after_commit(session: Session) -> None:
+    if session.info.pop(_DIRTY, False):
+        catalogue.mark_stale()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY, None)
@@ -0,0 +1,28 @@
+"""
+FSM-хранилище в Redis со сроком жизни по состоянию.
+
+Импортируется только при FSM_STORAGE=redis: требует пакет redis.
+Подходит любой Redis-совместимый сервер (Valkey, KeyDB, локальная заглушка).
+"""
+
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from app.database.fsm_storage import state_name, state_ttl
+
+
+class TtlRedisStorage(RedisStorage):
+    """RedisStorage, у которого TTL состояния берётся из STATE_TTLS."""
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = state_name(state)
+        if name is None:
+            await self.redis.delete(self.key_builder.build(key, "state"))
+            return
+
+        ttl = int(state_ttl(name))
+        await self.redis.set(self.key_builder.build(key, "state"), name, ex=ttl)
+        # Данные диалога живут не меньше его состояния
+        data_key = self.key_builder.build(key, "data")
+        if self.data_ttl is not None and ttl > int(self.data_ttl):
+            await self.redis.expire(data_key, ttl)
@@ -0,0 +1,289 @@
+"""
+Хранилище FSM aiogram в базе данных бота.
+
+Состояние и данные диалога лежат в таблице fsm_states, поэтому
+незавершённые сценарии переживают перезапуск и работают при нескольких
+репликах. У каждого состояния свой срок жизни (STATE_TTLS): запись
+продлевается при смене состояния, просроченная читается как пустая и
+удаляется фоновой очисткой. datetime в данных сериализуются компактно:
+{"$dt": "2026-01-31T12:00:00"}.
+
+Смена состояния внутри апдейта не пишется в его транзакцию: она
+копится в сессии апдейта (чтения хендлера её видят) и записывается своей
+короткой транзакцией, когда транзакция апдейта закончится — коммитом или
+откатом. Так запись в fsm_states не ждёт блокировку SQLite, которую держат
+записи апдейта, и не продлевает её. Вне апдейта запись идёт сразу.
+
+При FSM_STORAGE=redis используется Redis-совместимый сервер по
+FSM_REDIS_URL (нужен пакет redis) с теми же сроками и сериализацией.
+"""
+
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.models import FsmRecord, async_session, engine
+from app.database.unit_of_work import (
+    current_session,
+    in_unit_of_work,
+    on_commit,
+    on_rollback,
+)
+
+logger = logging.getLogger(__name__)
+
+# db — таблица fsm_states, redis — Redis-совместимый сервер, memory — в памяти
+FSM_STORAGE = os.getenv("FSM_STORAGE", "db").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+
+# Срок жизни данных без состояния (например, выбранный тариф) (с)
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))
+# Срок жизни мастеров админ-бота (с)
+FSM_ADMIN_STATE_TTL = float(os.getenv("FSM_ADMIN_STATE_TTL", "3600"))
+# Период удаления просроченных записей (с), 0 — отключить
+FSM_PURGE_INTERVAL = float(os.getenv("FSM_PURGE_INTERVAL", "3600"))
+
+# Ключ session.info: отложенные записи FSM апдейта
+_FSM_PENDING = "fsm_pending"
+
+# Сроки жизни по префиксу имени состояния, побеждает самый длинный префикс
+STATE_TTLS: Dict[str, float] = {
+    "admin_": FSM_ADMIN_STATE_TTL,
+    # В данных мастера лежит пароль панели — не держим его долго
+    "admin_add_server_": 900,
+}
+
+
+def state_ttl(state: Optional[str]) -> float:
+    """
+    Срок жизни записи в состоянии state.
+
+    Args:
+        state: Имя состояния (None — данные без состояния)
+
+    Returns:
+        Время жизни в секундах
+    """
+    if state:
+        for prefix in sorted(STATE_TTLS, key=len, reverse=True):
+            if state.startswith(prefix):
+                return STATE_TTLS[prefix]
+    return FSM_STATE_TTL
+
+
+def state_name(state: StateType) -> Optional[str]:
+    """Имя состояния из State или строки."""
+    return state.state if isinstance(state, State) else state
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в FSM")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        if "$d" in obj:
+            return date.fromisoformat(obj["$d"])
+    return obj
+
+
+json_dumps = partial(
+    json.dumps, default=_encode, ensure_ascii=False, separators=(",", ":")
+)
+json_loads = partial(json.loads, object_hook=_decode)
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states."""
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None) -> None:
+        """
+        Инициализация хранилища.
+
+        Args:
+            key_builder: Построитель ключей; по умолчанию с bot_id,
+                так как оба бота пишут в одну таблицу
+        """
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+        self._insert = (
+            pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+        )
+
+    async def _write(self, key: str, stmt: Any, **values: Any) -> None:
+        session = current_session.get()
+        if not in_unit_of_work(session):
+            await self._execute([stmt])
+            return
+        pending = session.info.get(_FSM_PENDING)
+        if pending is None:
+            pending = session.info[_FSM_PENDING] = {}
+
+            async def flush() -> None:
+                writes = session.info.pop(_FSM_PENDING, {})
+                await self._execute(
+                    [stmt for entry in writes.values() for stmt in entry["stmts"]]
+                )
+
+            await on_commit(flush, session)
+            on_rollback(flush, session)
+        entry = pending.setdefault(key, {"stmts": []})
+        entry["stmts"].append(stmt)
+        entry.update(values)
+
+    @staticmethod
+    async def _execute(stmts: List[Any]) -> None:
+        if not stmts:
+            return
+        async with async_session() as session:
+            for stmt in stmts:
+                await session.execute(stmt)
+            await session.commit()
+
+    @staticmethod
+    def _pending(key: str) -> Dict[str, Any]:
+        session = current_session.get()
+        if not in_unit_of_work(session):
+            return {}
+        return session.info.get(_FSM_PENDING, {}).get(key, {})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = state_name(state)
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=state_ttl(name))
+        record_key = self.key_builder.build(key)
+        table = FsmRecord.__table__
+        stmt = self._insert(table).values(
+            key=record_key,
+            state=name,
+            data="{}",
+            expires_at=expires_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "state": name,
+                # Данные просроченной записи не наследуются новым состоянием
+                "data": case((table.c.expires_at <= now, "{}"), else_=table.c.data),
+                "expires_at": expires_at,
+            },
+        )
+        await self._write(record_key, stmt, state=name)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        pending = self._pending(self.key_builder.build(key))
+        if "state" in pending:
+            return pending["state"]
+        record = await self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        now = datetime.now()
+        payload = json_dumps(dict(data))
+        record_key = self.key_builder.build(key)
+        table = FsmRecord.__table__
+        stmt = self._insert(table).values(
+            key=record_key,
+            state=None,
+            data=payload,
+            expires_at=now + timedelta(seconds=FSM_STATE_TTL),
+        )
+        expired = table.c.expires_at <= now
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "data": payload,
+                # Срок задаёт состояние; просроченная запись начинается заново
+                "state": case((expired, None), else_=table.c.state),
+                "expires_at": case(
+                    (expired, stmt.excluded.expires_at), else_=table.c.expires_at
+                ),
+            },
+        )
+        await self._write(record_key, stmt, data=payload)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        pending = self._pending(self.key_builder.build(key))
+        if "data" in pending:
+            return json_loads(pending["data"])
+        record = await self._get(key)
+        return json_loads(record.data) if record else {}
+
+    async def _get(self, key: StorageKey) -> Optional[Any]:
+        async with async_session() as session:
+            result = await session.execute(
+                select(FsmRecord.state, FsmRecord.data).where(
+                    FsmRecord.key == self.key_builder.build(key),
+                    FsmRecord.expires_at > datetime.now(),
+                )
+            )
+            return result.first()
+
+    async def purge_expired(self) -> int:
+        """
+        Удалить просроченные записи.
+
+        Returns:
+            Количество удалённых записей
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FsmRecord).where(FsmRecord.expires_at <= datetime.now())
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"FSM: удалено просроченных записей: {result.rowcount}")
+        return result.rowcount
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Создать хранилище FSM по FSM_STORAGE.
+
+    Returns:
+        Экземпляр BaseStorage
+    """
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+
+    if FSM_STORAGE == "redis":
+        try:
+            from app.database.fsm_redis import TtlRedisStorage
+        except ImportError:
+            logger.error("FSM_STORAGE=redis, но пакет redis не установлен")
+        else:
+            logger.info("FSM: состояния хранятся в Redis")
+            return TtlRedisStorage.from_url(
+                FSM_REDIS_URL,
+                key_builder=DefaultKeyBuilder(with_bot_id=True),
+                data_ttl=int(FSM_STATE_TTL),
+                json_loads=json_loads,
+                json_dumps=json_dumps,
+            )
+
+    logger.info("FSM: состояния хранятся в БД")
+    return DatabaseStorage()
@@ -0,0 +1,328 @@
+"""
+Версионные миграции схемы БД.
+
+Применённые ревизии хранятся в таблице schema_migrations. Каждая ревизия
+идемпотентна: первая создаёт схему по моделям, поэтому на новой базе
+последующие ревизии ничего не меняют, а на старой — доводят её до
+текущего состояния. Новые изменения схемы добавляются в конец MIGRATIONS.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Set
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.database.models import (
+    Base,
+    Broadcast,
+    CacheVersion,
+    FsmRecord,
+    SubscriptionReminder,
+    TrafficSnapshot,
+    engine,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL: боты не мигрируют базу одновременно
+# (в SQLite ту же роль играет BEGIN IMMEDIATE)
+MIGRATION_LOCK_KEY = 0x33584955
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Ревизия схемы."""
+
+    version: int
+    name: str
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+    # False — ревизия выполняется вне транзакции (CREATE INDEX CONCURRENTLY)
+    transactional: bool = True
+
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+async def _columns(conn: AsyncConnection, table: str) -> Set[str]:
+    return await conn.run_sync(
+        lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table)}
+    )
+
+
+async def create_index(
+    conn: AsyncConnection, name: str, table: str, columns: str
+) -> None:
+    """Создать индекс, если его нет (на PostgreSQL — без блокировки записи)."""
+    if not _is_postgres():
+        await conn.execute(
+            text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        )
+        return
+
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет индекс INVALID, который
+    # IF NOT EXISTS молча пропустил бы: такой индекс пересоздаётся
+    valid = await conn.scalar(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": name},
+    )
+    if valid is False:
+        logger.warning(f"Индекс {name} невалиден, пересоздаём")
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    try:
+        await conn.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+        )
+    except DBAPIError:
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        raise
+
+
+# --- Ревизии ---------------------------------------------------------------
+
+
+async def _initial_schema(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all)
+
+
+async def _users_received_bonus(conn: AsyncConnection) -> None:
+    if "received_bonus" not in await _columns(conn, "users"):
+        await conn.execute(
+            text("ALTER TABLE users ADD COLUMN received_bonus BOOLEAN DEFAULT FALSE")
+        )
+
+
+async def _query_indexes(conn: AsyncConnection) -> None:
+    await create_index(
+        conn,
+        "ix_subscriptions_user_status_expires",
+        "subscriptions",
+        "user_id, status, expires_at",
+    )
+    await create_index(
+        conn, "ix_subscriptions_server_status", "subscriptions", "server_id, status"
+    )
+    await create_index(
+        conn, "ix_subscriptions_created_at", "subscriptions", "created_at"
+    )
+    await create_index(conn, "ix_users_referrer_id", "users", "referrer_id")
+
+
+async def _cache_versions(conn: AsyncConnection) -> None:
+    await conn.run_sync(
+        lambda sync_conn: CacheVersion.__table__.create(sync_conn, checkfirst=True)
+    )
+    exists = await conn.scalar(
+        select(CacheVersion.name).where(CacheVersion.name == "catalogue")
+    )
+    if not exists:
+        await conn.execute(
+            CacheVersion.__table__.insert().values(name="catalogue", version=0)
+        )
+
+
+async def _fsm_states(conn: AsyncConnection) -> None:
+    await conn.run_sync(
+        lambda sync_conn: FsmRecord.__table__.create(sync_conn, checkfirst=True)
+    )
+
+
+async def _broadcasts(conn: AsyncConnection) -> None:
+    await conn.run_sync(
+        lambda sync_conn: Broadcast.__table__.create(sync_conn, checkfirst=True)
+    )
+
+
+async def _users_browse_indexes(conn: AsyncConnection) -> None:
+    await create_index(conn, "ix_users_created_at_id", "users", "created_at, id")
+    await create_index(conn, "ix_users_username", "users", "username")
+    await create_index(conn, "ix_users_full_name", "users", "full_name")
+
+
+async def _subscriptions_expiry_index(conn: AsyncConnection) -> None:
+    await create_index(
+        conn,
+        "ix_subscriptions_status_expires",
+        "subscriptions",
+        "status, expires_at, id",
+    )
+
+
+async def _subscription_reminders(conn: AsyncConnection) -> None:
+    await conn.run_sync(
+        lambda sync_conn: SubscriptionReminder.__table__.create(
+            sync_conn, checkfirst=True
+        )
+    )
+
+
+async def _traffic_snapshots(conn: AsyncConnection) -> None:
+    await conn.run_sync(
+        lambda sync_conn: TrafficSnapshot.__table__.create(sync_conn, checkfirst=True)
+    )
+
+
+async def _users_prefix_indexes(conn: AsyncConnection) -> None:
+    # В SQLite поиск по префиксу идёт диапазоном по обычным индексам
+    if not _is_postgres():
+        return
+    await create_index(
+        conn, "ix_users_username_pattern", "users", "username varchar_pattern_ops"
+    )
+    await create_index(
+        conn, "ix_users_full_name_pattern", "users", "full_name varchar_pattern_ops"
+    )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial_schema", _initial_schema),
+    Migration(2, "users_received_bonus", _users_received_bonus),
+    Migration(3, "query_indexes", _query_indexes, transactional=False),
+    Migration(4, "cache_versions", _cache_versions),
+    Migration(5, "fsm_states", _fsm_states),
+    Migration(6, "broadcasts", _broadcasts),
+    Migration(7, "users_browse_indexes", _users_browse_indexes, transactional=False),
+    Migration(
+        8,
+        "subscriptions_expiry_index",
+        _subscriptions_expiry_index,
+        transactional=False,
+    ),
+    Migration(9, "subscription_reminders", _subscription_reminders),
+    Migration(10, "traffic_snapshots", _traffic_snapshots),
+    Migration(11, "users_prefix_indexes", _users_prefix_indexes, transactional=False),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+# --- Раннер ----------------------------------------------------------------
+
+
+async def get_schema_version() -> int:
+    """
+    Текущая версия схемы.
+
+    Returns:
+        Номер последней применённой ревизии (0 — база не размечена)
+    """
+    try:
+        async with engine.connect() as conn:
+            version = await conn.scalar(select(func.max(schema_migrations.c.version)))
+            return version or 0
+    except DBAPIError:
+        # Таблицы schema_migrations ещё нет
+        return 0
+
+
+async def _pending(conn: AsyncConnection) -> List[Migration]:
+    """Неприменённые ревизии; читается под блокировкой миграций."""
+    await conn.run_sync(schema_migrations.create, checkfirst=True)
+    current = await conn.scalar(select(func.max(schema_migrations.c.version)))
+    return [m for m in MIGRATIONS if m.version > (current or 0)]
+
+
+async def _apply(conn: AsyncConnection, migration: Migration) -> None:
+    logger.info(f"Миграция {migration.version}: {migration.name}")
+    await migration.upgrade(conn)
+    await conn.execute(
+        schema_migrations.insert().values(
+            version=migration.version, name=migration.name, applied_at=datetime.now()
+        )
+    )
+
+
+async def _migrate_postgres() -> int:
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.execute(
+            text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        try:
+            async with engine.begin() as conn:
+                pending = await _pending(conn)
+            for migration in pending:
+                if migration.transactional:
+                    async with engine.begin() as conn:
+                        await _apply(conn, migration)
+                    continue
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await _apply(conn, migration)
+            return len(pending)
+        finally:
+            await lock_conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+
+
+async def _migrate_sqlite() -> int:
+    # Все ревизии идут одной транзакцией на одном соединении: BEGIN IMMEDIATE
+    # сразу берёт блокировку записи, и второй процесс ждёт её (busy_timeout),
+    # а затем видит уже обновлённую версию
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            pending = await _pending(conn)
+            for migration in pending:
+                await _apply(conn, migration)
+        except BaseException:
+            await conn.exec_driver_sql("ROLLBACK")
+            raise
+        await conn.exec_driver_sql("COMMIT")
+        return len(pending)
+
+
+async def migrate() -> int:
+    """
+    Применить все неприменённые ревизии по порядку.
+
+    Процессы, стартующие одновременно (бот и админ-бот), сериализуются:
+    версия перечитывается уже под блокировкой.
+
+    Returns:
+        Количество применённых ревизий
+    """
+    if _is_postgres():
+        return await _migrate_postgres()
+    return await _migrate_sqlite()
+
+
+async def ensure_schema() -> None:
+    """
+    Довести схему до текущей версии при старте бота.
+
+    Если версия уже актуальна, обходится одним запросом без сверки метаданных.
+    """
+    if await get_schema_version() >= SCHEMA_VERSION:
+        logger.info(f"Схема БД актуальна (версия {SCHEMA_VERSION})")
+        return
+
+    applied = await migrate()
+    logger.info(f"Схема БД обновлена до версии {SCHEMA_VERSION} ({applied} ревизий)")
@@ -1,7 +1,7 @@
 import os
 from datetime import datetime
 from enum import Enum as PyEnum
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 from dotenv import load_dotenv
 from sqlalchemy import (
@@ -11,7 +11,10 @@ from sqlalchemy import (
     DateTime,
     Boolean,
     DECIMAL,
+    Index,
     Integer,
+    Text,
+    event,
     func,
 )
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
@@ -31,7 +34,49 @@ if DATABASE_URL.startswith("sqlite"):
 
         pathlib.Path(os.path.dirname(db_path)).mkdir(parents=True, exist_ok=True)
 
-engine = create_async_engine(url=DATABASE_URL)
+# Пул соединений (PostgreSQL/asyncpg)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Параметры SQLite: оба бота пишут в один файл
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # мс
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """Параметры create_async_engine в зависимости от СУБД."""
+    if url.startswith("sqlite"):
+        return {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT / 1000}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_async_engine(url=DATABASE_URL, **_engine_options(DATABASE_URL))
+
+if DATABASE_URL.startswith("sqlite"):
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        """
+        WAL позволяет читать во время записи другого процесса, а busy_timeout
+        заставляет писателя ждать блокировку вместо "database is locked".
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
 
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
@@ -54,8 +99,32 @@ class PaymentStatus(str, PyEnum):
     FAILED = "failed"
 
 
+class BroadcastStatus(str, PyEnum):
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Постраничный список в админке
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Поиск по началу username и имени
+        Index("ix_users_username", "username"),
+        Index("ix_users_full_name", "full_name"),
+        # LIKE 'префикс%' в PostgreSQL при сортировке, отличной от "C"
+        Index(
+            "ix_users_username_pattern",
+            "username",
+            postgresql_ops={"username": "varchar_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_users_full_name_pattern",
+            "full_name",
+            postgresql_ops={"full_name": "varchar_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     tg_id: Mapped[int] = mapped_column(
@@ -65,7 +134,7 @@ class User(Base):
     full_name: Mapped[str] = mapped_column(String(255), nullable=False)
     balance: Mapped[float] = mapped_column(DECIMAL(10, 2), default=0.00)
     referrer_id: Mapped[Optional[int]] = mapped_column(
-        ForeignKey("users.id"), nullable=True
+        ForeignKey("users.id"), nullable=True, index=True
     )
     received_bonus: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(
@@ -118,6 +187,18 @@ class Plan(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Активная подписка пользователя (профиль, покупка)
+        Index(
+            "ix_subscriptions_user_status_expires", "user_id", "status", "expires_at"
+        ),
+        # Заполненность сервера
+        Index("ix_subscriptions_server_status", "server_id", "status"),
+        # Истечение и напоминания: диапазон по сроку среди подписок статуса
+        Index("ix_subscriptions_status_expires", "status", "expires_at", "id"),
+        # Списки в админке
+        Index("ix_subscriptions_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -182,6 +263,65 @@ class Admin(Base):
     )
 
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Счётчики версий кэшируемых данных, общие для всех процессов ботов
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Состояния FSM обоих ботов (ключ — bot_id:chat_id:user_id)
+class FsmRecord(Base):
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+# Рассылки админ-бота; last_user_id — курсор по users.id для продолжения
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)  # HTML
+    status: Mapped[BroadcastStatus] = mapped_column(
+        String(20), default=BroadcastStatus.RUNNING, index=True
+    )
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)
+    delivered: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+# Отправленные напоминания о сроке подписки: одно на окно и срок, поэтому
+# после продления напоминания приходят снова. Без внешнего ключа — строки
+# не мешают удалению подписок и вычищаются по expires_at
+class SubscriptionReminder(Base):
+    __tablename__ = "subscription_reminders"
+
+    subscription_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # За сколько дней до срока; 0 — подписка истекла
+    days_before: Mapped[int] = mapped_column(Integer, primary_key=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    sent_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+
+# Счётчики трафика клиентов панели по интервалам: строка на подписку и
+# интервал, значения — накопленные up/down на последний опрос в интервале
+class TrafficSnapshot(Base):
+    __tablename__ = "traffic_snapshots"
+
+    subscription_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True, index=True)
+    up: Mapped[int] = mapped_column(BigInteger, default=0)
+    down: Mapped[int] = mapped_column(BigInteger, default=0)
+    # Лимит клиента на панели в байтах, 0 — без лимита
+    total: Mapped[int] = mapped_column(BigInteger, default=0)
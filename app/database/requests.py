@@ -8,15 +8,68 @@ from app.database.models import (
     Payment,
     PaymentStatus,
     Admin,
+    Broadcast,
+    BroadcastStatus,
+    SubscriptionReminder,
+    TrafficSnapshot,
+    engine,
 )
-from sqlalchemy import select, update, delete, func
+from app.database.catalogue import bump_catalogue_version
+from app.database.unit_of_work import UNIT_OF_WORK
+from app.database.views import ProfileSubscriptionView, ProfileView
+from sqlalchemy import delete, func, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 
-async def add_user(tg_id, name, surname, user_tag, referrer_id=None):
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+@asynccontextmanager
+async def session_scope(
+    session: Optional[AsyncSession] = None,
+) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для функции-запроса.
+
+    Args:
+        session: Сессия апдейта; если не передана, открывается своя
+
+    Yields:
+        AsyncSession
+    """
+    if session is not None:
+        yield session
+        return
+    async with async_session() as new_session:
+        yield new_session
+
+
+async def _commit(session: AsyncSession) -> None:
+    """
+    Зафиксировать изменения.
+
+    В сессии апдейта только отправляем их в БД (flush): транзакцию
+    целиком коммитит middleware после обработки апдейта.
+    """
+    if session.info.get(UNIT_OF_WORK):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+async def add_user(
+    tg_id,
+    name,
+    surname,
+    user_tag,
+    referrer_id=None,
+    session: Optional[AsyncSession] = None,
+):
+    async with session_scope(session) as s:
+        user = await s.scalar(select(User).where(User.tg_id == tg_id))
 
         if not user:
             new_user = User(
@@ -25,80 +78,82 @@ async def add_user(tg_id, name, surname, user_tag, referrer_id=None):
                 username=user_tag,
                 referrer_id=referrer_id,
             )
-            session.add(new_user)
-            await session.commit()
+            s.add(new_user)
+            await _commit(s)
             return True  # Created
         return False  # Exists
 
 
-async def add_balance(tg_id, amount):
-    async with async_session() as session:
-        await session.execute(
+async def add_balance(tg_id, amount, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        await s.execute(
             update(User)
             .where(User.tg_id == tg_id)
             .values(balance=User.balance + amount)
         )
-        await session.commit()
+        await _commit(s)
 
 
-async def deduct_balance(tg_id, amount):
-    async with async_session() as session:
-        await session.execute(
+async def deduct_balance(tg_id, amount, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        await s.execute(
             update(User)
             .where(User.tg_id == tg_id)
             .values(balance=User.balance - amount)
         )
-        await session.commit()
+        await _commit(s)
 
 
-async def select_user(tg_id):
-    async with async_session() as session:
-        return await session.scalar(select(User).where(User.tg_id == tg_id))
+async def select_user(tg_id, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        return await s.scalar(select(User).where(User.tg_id == tg_id))
 
 
-async def get_test_plan():
-    async with async_session() as session:
+async def get_test_plan(session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
         # Assuming plan 1 is standard or specific test plan
-        return await session.scalar(select(Plan).where(Plan.price > 0).limit(1))
+        return await s.scalar(select(Plan).where(Plan.price > 0).limit(1))
 
 
-async def get_trial_plan():
-    async with async_session() as session:
-        return await session.scalar(select(Plan).where(Plan.price == 0).limit(1))
+async def get_trial_plan(session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        return await s.scalar(select(Plan).where(Plan.price == 0).limit(1))
 
 
-async def set_user_bonus_received(user_id):
-    async with async_session() as session:
-        await session.execute(
+async def set_user_bonus_received(user_id, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        await s.execute(
             update(User).where(User.id == user_id).values(received_bonus=True)
         )
-        await session.commit()
+        await _commit(s)
 
 
-async def get_active_server():
-    async with async_session() as session:
-        return await session.scalar(select(Server).where(Server.is_active))
+async def get_active_server(session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
+        return await s.scalar(select(Server).where(Server.is_active))
 
 
-async def get_servers_with_stats() -> list:
+async def get_server_subscription_counts(
+    session: Optional[AsyncSession] = None,
+) -> Dict[int, int]:
     """
-    Получить все активные серверы с количеством подписок.
+    Получить количество активных подписок по серверам.
 
     Returns:
-        Список кортежей (server, subscriptions_count)
+        Словарь server_id -> количество подписок
     """
-    async with async_session() as session:
-        result = await session.execute(
-            select(Server, func.count(Subscription.id).label("sub_count"))
-            .outerjoin(Subscription, Server.id == Subscription.server_id)
-            .where(Server.is_active)
-            .group_by(Server.id)
-            .order_by(Server.id)
+    async with session_scope(session) as s:
+        result = await s.execute(
+            select(Subscription.server_id, func.count(Subscription.id))
+            .where(Subscription.status == SubscriptionStatus.ACTIVE)
+            .group_by(Subscription.server_id)
         )
-        return result.all()
+        return {server_id: count for server_id, count in result.all()}
 
 
-async def get_subscription_count_for_server(server_id: int) -> int:
+async def get_subscription_count_for_server(
+    server_id: int, session: Optional[AsyncSession] = None
+) -> int:
     """
     Получить количество активных подписок на сервере.
 
@@ -108,8 +163,8 @@ async def get_subscription_count_for_server(server_id: int) -> int:
     Returns:
         Количество подписок
     """
-    async with async_session() as session:
-        result = await session.execute(
+    async with session_scope(session) as s:
+        result = await s.execute(
             select(func.count(Subscription.id)).where(
                 Subscription.server_id == server_id,
                 Subscription.status == SubscriptionStatus.ACTIVE,
@@ -118,8 +173,8 @@ async def get_subscription_count_for_server(server_id: int) -> int:
         return result.scalar() or 0
 
 
-async def get_user_subscription(user_id):
-    async with async_session() as session:
+async def get_user_subscription(user_id, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
         stmt = (
             select(Subscription)
             .where(
@@ -128,25 +183,41 @@ async def get_user_subscription(user_id):
             )
             .order_by(Subscription.expires_at.desc())
         )
-        return await session.scalar(stmt)
+        return await s.scalar(stmt)
 
 
-async def extend_subscription(subscription_id, days):
-    async with async_session() as session:
-        sub = await session.get(Subscription, subscription_id)
+async def extend_subscription(
+    subscription_id, days, session: Optional[AsyncSession] = None
+):
+    async with session_scope(session) as s:
+        sub = await s.get(Subscription, subscription_id)
         if sub:
             sub.expires_at += timedelta(days=days)
-            await session.commit()
+            # Продление истёкшей подписки возвращает её в активные
+            if (
+                sub.status == SubscriptionStatus.EXPIRED
+                and sub.expires_at > datetime.now()
+            ):
+                sub.status = SubscriptionStatus.ACTIVE
+            await _commit(s)
             return True
         return False
 
 
 async def create_subscription(
-    user_id, server_id, plan_id, uuid, email, inbound_id, key_url, is_trial=False
+    user_id,
+    server_id,
+    plan_id,
+    uuid,
+    email,
+    inbound_id,
+    key_url,
+    is_trial=False,
+    session: Optional[AsyncSession] = None,
 ):
-    async with async_session() as session:
+    async with session_scope(session) as s:
         # Calculate expiry
-        plan = await session.get(Plan, plan_id)
+        plan = await s.get(Plan, plan_id)
         if not plan:
             return None
 
@@ -166,30 +237,122 @@ async def create_subscription(
             status=SubscriptionStatus.ACTIVE,
             expires_at=expires_at,
         )
-        session.add(new_sub)
-        await session.commit()
+        s.add(new_sub)
+        await _commit(s)
         return new_sub
 
 
-async def get_referrals_count(user_id):
-    async with async_session() as session:
+async def get_referrals_count(user_id, session: Optional[AsyncSession] = None):
+    async with session_scope(session) as s:
         # This count might need a proper join or backref count, doing simple way
         # Since logic changed to just simple count
         # In real scaling app, use func.count
         from sqlalchemy import func
 
-        result = await session.execute(
+        result = await s.execute(
             select(func.count(User.id)).where(User.referrer_id == user_id)
         )
         return result.scalar()
 
 
+def _latest_traffic_bucket(subscription_id):
+    """Подзапрос: интервал последнего снимка трафика подписки."""
+    snapshot = aliased(TrafficSnapshot)
+    return (
+        select(func.max(snapshot.bucket))
+        .where(snapshot.subscription_id == subscription_id)
+        .scalar_subquery()
+    )
+
+
+async def get_profile_view(
+    tg_id: int, session: Optional[AsyncSession] = None
+) -> Optional[ProfileView]:
+    """
+    Данные профиля одним запросом: пользователь, последняя активная
+    подписка с сервером и количество рефералов.
+
+    Args:
+        tg_id: Telegram ID пользователя
+        session: Сессия БД апдейта (опционально)
+
+    Returns:
+        ProfileView или None, если пользователь не найден
+    """
+    referral = aliased(User)
+    referrals_count = (
+        select(func.count(referral.id))
+        .where(referral.referrer_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    # Подписки хранят tg_id пользователя в user_id (см. create_subscription)
+    candidate = aliased(Subscription)
+    latest_sub_id = (
+        select(candidate.id)
+        .where(
+            candidate.user_id == User.tg_id,
+            candidate.status == SubscriptionStatus.ACTIVE,
+        )
+        .order_by(candidate.expires_at.desc())
+        .limit(1)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            User.tg_id,
+            User.balance,
+            referrals_count.label("referrals_count"),
+            Subscription.email,
+            Subscription.expires_at,
+            Server.location,
+            Server.api_url,
+            (TrafficSnapshot.up + TrafficSnapshot.down).label("traffic_used"),
+            TrafficSnapshot.total.label("traffic_limit"),
+        )
+        .select_from(User)
+        .outerjoin(Subscription, Subscription.id == latest_sub_id)
+        .outerjoin(Server, Server.id == Subscription.server_id)
+        .outerjoin(
+            TrafficSnapshot,
+            (TrafficSnapshot.subscription_id == Subscription.id)
+            & (TrafficSnapshot.bucket == _latest_traffic_bucket(Subscription.id)),
+        )
+        .where(User.tg_id == tg_id)
+    )
+
+    async with session_scope(session) as s:
+        row = (await s.execute(stmt)).first()
+
+    if row is None:
+        return None
+
+    subscription = None
+    if row.email is not None:
+        subscription = ProfileSubscriptionView(
+            email=row.email,
+            expires_at=row.expires_at,
+            server_location=row.location,
+            server_api_url=row.api_url,
+            traffic_used=row.traffic_used,
+            traffic_limit=row.traffic_limit,
+        )
+    return ProfileView(
+        tg_id=row.tg_id,
+        balance=row.balance,
+        referrals_count=row.referrals_count or 0,
+        subscription=subscription,
+    )
+
+
 async def create_payment(
     user_id: int,
     amount: float,
     currency: str = "RUB",
     status: PaymentStatus = PaymentStatus.SUCCEEDED,
     provider_id: str = None,
+    session: Optional[AsyncSession] = None,
 ) -> Payment:
     """
     Создание записи о платеже.
@@ -204,7 +367,7 @@ async def create_payment(
     Returns:
         Объект Payment
     """
-    async with async_session() as session:
+    async with session_scope(session) as s:
         payment = Payment(
             user_id=user_id,
             amount=amount,
@@ -212,8 +375,8 @@ async def create_payment(
             status=status,
             provider_id=provider_id,
         )
-        session.add(payment)
-        await session.commit()
+        s.add(payment)
+        await _commit(s)
         return payment
 
 
@@ -223,9 +386,11 @@ async def update_subscription_email(
     new_uuid: str,
     new_key_url: str,
     new_inbound_id: int,
+    new_server_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None,
 ) -> bool:
     """
-    Обновление данных подписки (email, uuid, key_url, inbound_id).
+    Обновление данных подписки (email, uuid, key_url, inbound_id, server_id).
 
     Args:
         subscription_id: ID подписки
@@ -233,24 +398,31 @@ async def update_subscription_email(
         new_uuid: Новый UUID
         new_key_url: Новая ссылка ключа
         new_inbound_id: Новый inbound ID
+        new_server_id: Новый сервер (None — не менять)
 
     Returns:
         True если успешно
     """
-    async with async_session() as session:
-        sub = await session.get(Subscription, subscription_id)
+    async with session_scope(session) as s:
+        sub = await s.get(Subscription, subscription_id)
         if sub:
             sub.email = new_email
             sub.uuid = new_uuid
             sub.key_url = new_key_url
             sub.inbound_id = new_inbound_id
-            await session.commit()
+            if new_server_id is not None:
+                sub.server_id = new_server_id
+            await _commit(s)
             return True
         return False
 
 
 async def update_subscription_plan(
-    subscription_id: int, plan_id: int, duration_days: int, data_limit_gb: int
+    subscription_id: int,
+    plan_id: int,
+    duration_days: int,
+    data_limit_gb: int,
+    session: Optional[AsyncSession] = None,
 ) -> bool:
     """
     Обновление плана подписки с продлением срока.
@@ -264,13 +436,13 @@ async def update_subscription_plan(
     Returns:
         True если успешно
     """
-    async with async_session() as session:
-        sub = await session.get(Subscription, subscription_id)
+    async with session_scope(session) as s:
+        sub = await s.get(Subscription, subscription_id)
         if sub:
             sub.plan_id = plan_id
             # Продлеваем с текущего момента, а не от старого срока
             sub.expires_at = datetime.now() + timedelta(days=duration_days)
-            await session.commit()
+            await _commit(s)
             return True
         return False
 
@@ -278,74 +450,84 @@ async def update_subscription_plan(
 # ==================== Admin Functions ====================
 
 
-async def get_admin_by_tg_id(tg_id: int) -> Optional[Admin]:
+async def get_admin_by_tg_id(
+    tg_id: int, session: Optional[AsyncSession] = None
+) -> Optional[Admin]:
     """Получить администратора по Telegram ID."""
-    async with async_session() as session:
-        return await session.scalar(select(Admin).where(Admin.tg_id == tg_id))
+    async with session_scope(session) as s:
+        return await s.scalar(select(Admin).where(Admin.tg_id == tg_id))
 
 
-async def add_admin(tg_id: int, username: Optional[str] = None) -> Optional[Admin]:
+async def add_admin(
+    tg_id: int, username: Optional[str] = None, session: Optional[AsyncSession] = None
+) -> Optional[Admin]:
     """Добавить нового администратора."""
-    async with async_session() as session:
+    async with session_scope(session) as s:
         # Проверяем, существует ли уже
-        existing = await session.scalar(select(Admin).where(Admin.tg_id == tg_id))
+        existing = await s.scalar(select(Admin).where(Admin.tg_id == tg_id))
         if existing:
             return existing
 
         new_admin = Admin(tg_id=tg_id, username=username)
-        session.add(new_admin)
-        await session.commit()
+        s.add(new_admin)
+        await _commit(s)
         return new_admin
 
 
-async def get_all_users() -> List[User]:
+async def get_all_users(session: Optional[AsyncSession] = None) -> List[User]:
     """Получить всех пользователей."""
-    async with async_session() as session:
-        result = await session.execute(select(User).order_by(User.created_at.desc()))
+    async with session_scope(session) as s:
+        result = await s.execute(select(User).order_by(User.created_at.desc()))
         return list(result.scalars().all())
 
 
-async def get_user_by_tg_id(tg_id: int) -> Optional[User]:
+async def get_user_by_tg_id(
+    tg_id: int, session: Optional[AsyncSession] = None
+) -> Optional[User]:
     """Получить пользователя по Telegram ID."""
-    async with async_session() as session:
-        return await session.scalar(select(User).where(User.tg_id == tg_id))
+    async with session_scope(session) as s:
+        return await s.scalar(select(User).where(User.tg_id == tg_id))
 
 
-async def get_user_by_id(user_id: int) -> Optional[User]:
+async def get_user_by_id(
+    user_id: int, session: Optional[AsyncSession] = None
+) -> Optional[User]:
     """Получить пользователя по внутреннему ID."""
-    async with async_session() as session:
-        return await session.get(User, user_id)
+    async with session_scope(session) as s:
+        return await s.get(User, user_id)
 
 
-async def delete_user_by_id(user_id: int) -> bool:
+async def delete_user_by_id(
+    user_id: int, session: Optional[AsyncSession] = None
+) -> bool:
     """Удалить пользователя по ID (включая подписки и платежи)."""
-    async with async_session() as session:
+    async with session_scope(session) as s:
         # Сначала удаляем подписки
-        await session.execute(
-            delete(Subscription).where(Subscription.user_id == user_id)
-        )
+        await s.execute(delete(Subscription).where(Subscription.user_id == user_id))
         # Затем платежи
-        await session.execute(delete(Payment).where(Payment.user_id == user_id))
+        await s.execute(delete(Payment).where(Payment.user_id == user_id))
         # И самого пользователя
-        await session.execute(delete(User).where(User.id == user_id))
-        await session.commit()
+        await s.execute(delete(User).where(User.id == user_id))
+        await _commit(s)
         return True
 
 
-async def update_user_balance(user_id: int, new_balance: float) -> bool:
+async def update_user_balance(
+    user_id: int, new_balance: float, session: Optional[AsyncSession] = None
+) -> bool:
     """Обновить баланс пользователя."""
-    async with async_session() as session:
-        await session.execute(
+    async with session_scope(session) as s:
+        await s.execute(
             update(User).where(User.id == user_id).values(balance=new_balance)
         )
-        await session.commit()
+        await _commit(s)
         return True
 
 
-async def get_all_servers() -> List[Server]:
+async def get_all_servers(session: Optional[AsyncSession] = None) -> List[Server]:
     """Получить все серверы."""
-    async with async_session() as session:
-        result = await session.execute(select(Server).order_by(Server.name))
+    async with session_scope(session) as s:
+        result = await s.execute(select(Server).order_by(Server.name))
         return list(result.scalars().all())
 
 
@@ -356,9 +538,10 @@ async def add_server(
     password: str,
     location: str,
     max_clients: Optional[int] = None,
+    session: Optional[AsyncSession] = None,
 ) -> Server:
     """Добавить новый сервер."""
-    async with async_session() as session:
+    async with session_scope(session) as s:
         server = Server(
             name=name,
             api_url=api_url,
@@ -367,8 +550,9 @@ async def add_server(
             location=location,
             max_clients=max_clients,
         )
-        session.add(server)
-        await session.commit()
+        s.add(server)
+        await bump_catalogue_version(s)
+        await _commit(s)
         return server
 
 
@@ -381,10 +565,11 @@ async def update_server(
     location: Optional[str] = None,
     is_active: Optional[bool] = None,
     max_clients: Optional[int] = None,
+    session: Optional[AsyncSession] = None,
 ) -> bool:
     """Обновить данные сервера."""
-    async with async_session() as session:
-        server = await session.get(Server, server_id)
+    async with session_scope(session) as s:
+        server = await s.get(Server, server_id)
         if not server:
             return False
 
@@ -403,22 +588,24 @@ async def update_server(
         if max_clients is not None:
             server.max_clients = max_clients
 
-        await session.commit()
+        await bump_catalogue_version(s)
+        await _commit(s)
         return True
 
 
-async def delete_server(server_id: int) -> bool:
+async def delete_server(server_id: int, session: Optional[AsyncSession] = None) -> bool:
     """Удалить сервер."""
-    async with async_session() as session:
-        await session.execute(delete(Server).where(Server.id == server_id))
-        await session.commit()
+    async with session_scope(session) as s:
+        await s.execute(delete(Server).where(Server.id == server_id))
+        await bump_catalogue_version(s)
+        await _commit(s)
         return True
 
 
-async def get_all_plans() -> List[Plan]:
+async def get_all_plans(session: Optional[AsyncSession] = None) -> List[Plan]:
     """Получить все тарифные планы."""
-    async with async_session() as session:
-        result = await session.execute(select(Plan).order_by(Plan.price))
+    async with session_scope(session) as s:
+        result = await s.execute(select(Plan).order_by(Plan.price))
         return list(result.scalars().all())
 
 
@@ -428,9 +615,10 @@ async def add_plan(
     duration_days: int,
     data_limit_gb: int = 0,
     is_active: bool = True,
+    session: Optional[AsyncSession] = None,
 ) -> Plan:
     """Добавить новый тарифный план."""
-    async with async_session() as session:
+    async with session_scope(session) as s:
         plan = Plan(
             name=name,
             price=price,
@@ -438,8 +626,9 @@ async def add_plan(
             data_limit_gb=data_limit_gb,
             is_active=is_active,
         )
-        session.add(plan)
-        await session.commit()
+        s.add(plan)
+        await bump_catalogue_version(s)
+        await _commit(s)
         return plan
 
 
@@ -450,10 +639,11 @@ async def update_plan(
     duration_days: Optional[int] = None,
     data_limit_gb: Optional[int] = None,
     is_active: Optional[bool] = None,
+    session: Optional[AsyncSession] = None,
 ) -> bool:
     """Обновить тарифный план."""
-    async with async_session() as session:
-        plan = await session.get(Plan, plan_id)
+    async with session_scope(session) as s:
+        plan = await s.get(Plan, plan_id)
         if not plan:
             return False
 
@@ -468,22 +658,26 @@ async def update_plan(
         if is_active is not None:
             plan.is_active = is_active
 
-        await session.commit()
+        await bump_catalogue_version(s)
+        await _commit(s)
         return True
 
 
-async def delete_plan(plan_id: int) -> bool:
+async def delete_plan(plan_id: int, session: Optional[AsyncSession] = None) -> bool:
     """Удалить тарифный план."""
-    async with async_session() as session:
-        await session.execute(delete(Plan).where(Plan.id == plan_id))
-        await session.commit()
+    async with session_scope(session) as s:
+        await s.execute(delete(Plan).where(Plan.id == plan_id))
+        await bump_catalogue_version(s)
+        await _commit(s)
         return True
 
 
-async def get_subscription_by_id(subscription_id: int) -> Optional[Subscription]:
+async def get_subscription_by_id(
+    subscription_id: int, session: Optional[AsyncSession] = None
+) -> Optional[Subscription]:
     """Получить подписку по ID."""
-    async with async_session() as session:
-        return await session.get(Subscription, subscription_id)
+    async with session_scope(session) as s:
+        return await s.get(Subscription, subscription_id)
 
 
 async def create_custom_subscription(
@@ -496,9 +690,10 @@ async def create_custom_subscription(
     expires_at: datetime,
     data_limit_gb: int = 0,
     status: SubscriptionStatus = SubscriptionStatus.ACTIVE,
+    session: Optional[AsyncSession] = None,
 ) -> Optional[Subscription]:
     """Создать подписку с кастомными параметрами."""
-    async with async_session() as session:
+    async with session_scope(session) as s:
         subscription = Subscription(
             user_id=user_id,
             server_id=server_id,
@@ -510,16 +705,628 @@ async def create_custom_subscription(
             status=status,
             expires_at=expires_at,
         )
-        session.add(subscription)
-        await session.commit()
+        s.add(subscription)
+        await _commit(s)
         return subscription
 
 
-async def delete_subscription(subscription_id: int) -> bool:
-    """Удалить подписку."""
-    async with async_session() as session:
-        await session.execute(
-            delete(Subscription).where(Subscription.id == subscription_id)
+async def create_custom_subscriptions(
+    user_id: int,
+    server_id: int,
+    inbound_id: int,
+    clients: List[Tuple[str, str, str]],
+    expires_at: datetime,
+    status: SubscriptionStatus = SubscriptionStatus.ACTIVE,
+    session: Optional[AsyncSession] = None,
+) -> int:
+    """
+    Создать пачку подписок одной транзакцией (массовая выдача ключей).
+
+    Args:
+        clients: Список кортежей (uuid, email, key_url)
+
+    Returns:
+        Количество созданных подписок
+    """
+    async with session_scope(session) as s:
+        s.add_all(
+            Subscription(
+                user_id=user_id,
+                server_id=server_id,
+                plan_id=1,  # Default plan, as for custom subscriptions
+                uuid=client_uuid,
+                email=email,
+                inbound_id=inbound_id,
+                key_url=key_url,
+                status=status,
+                expires_at=expires_at,
+            )
+            for client_uuid, email, key_url in clients
         )
-        await session.commit()
+        await _commit(s)
+        return len(clients)
+
+
+async def delete_subscription(
+    subscription_id: int, session: Optional[AsyncSession] = None
+) -> bool:
+    """Удалить подписку."""
+    async with session_scope(session) as s:
+        await s.execute(delete(Subscription).where(Subscription.id == subscription_id))
+        await _commit(s)
         return True
+
+
+async def get_subscriptions_by_user(
+    user_id: int, session: Optional[AsyncSession] = None
+) -> List[Subscription]:
+    """Все подписки пользователя вместе с их серверами."""
+    async with session_scope(session) as s:
+        result = await s.scalars(
+            select(Subscription)
+            .options(joinedload(Subscription.server))
+            .where(Subscription.user_id == user_id)
+        )
+        return list(result.all())
+
+
+async def delete_subscriptions(
+    subscription_ids: List[int], session: Optional[AsyncSession] = None
+) -> int:
+    """
+    Удалить подписки одним запросом.
+
+    Returns:
+        Количество удалённых строк
+    """
+    if not subscription_ids:
+        return 0
+    async with session_scope(session) as s:
+        result = await s.execute(
+            delete(Subscription).where(Subscription.id.in_(subscription_ids))
+        )
+        await _commit(s)
+        return result.rowcount
+
+
+async def count_users(session: Optional[AsyncSession] = None) -> int:
+    """Количество пользователей."""
+    async with session_scope(session) as s:
+        return await s.scalar(select(func.count(User.id))) or 0
+
+
+async def get_user_tg_ids_page(
+    after_id: int, limit: int, session: Optional[AsyncSession] = None
+) -> List[Tuple[int, int]]:
+    """
+    Страница пользователей для рассылки (keyset по users.id).
+
+    Args:
+        after_id: id последнего пользователя предыдущей страницы (0 — с начала)
+        limit: Размер страницы
+        session: Сессия БД (опционально)
+
+    Returns:
+        Список (id, tg_id) по возрастанию id
+    """
+    async with session_scope(session) as s:
+        result = await s.execute(
+            select(User.id, User.tg_id)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return [(row.id, row.tg_id) for row in result]
+
+
+async def create_broadcast(
+    text: str, admin_chat_id: int, total: int, session: Optional[AsyncSession] = None
+) -> Broadcast:
+    """Создать рассылку."""
+    async with session_scope(session) as s:
+        broadcast = Broadcast(text=text, admin_chat_id=admin_chat_id, total=total)
+        s.add(broadcast)
+        await _commit(s)
+        return broadcast
+
+
+async def get_running_broadcasts(
+    session: Optional[AsyncSession] = None,
+) -> List[Broadcast]:
+    """Незавершённые рассылки (для продолжения после перезапуска)."""
+    async with session_scope(session) as s:
+        result = await s.execute(
+            select(Broadcast)
+            .where(Broadcast.status == BroadcastStatus.RUNNING)
+            .order_by(Broadcast.id)
+        )
+        return list(result.scalars().all())
+
+
+async def has_running_broadcast(session: Optional[AsyncSession] = None) -> bool:
+    """Идёт ли сейчас хотя бы одна рассылка."""
+    async with session_scope(session) as s:
+        broadcast_id = await s.scalar(
+            select(Broadcast.id)
+            .where(Broadcast.status == BroadcastStatus.RUNNING)
+            .limit(1)
+        )
+        return broadcast_id is not None
+
+
+async def update_broadcast(
+    broadcast_id: int, session: Optional[AsyncSession] = None, **values
+) -> None:
+    """
+    Обновить поля рассылки (курсор, счётчики, статус).
+
+    Args:
+        broadcast_id: ID рассылки
+        session: Сессия БД (опционально)
+        **values: Новые значения колонок
+    """
+    async with session_scope(session) as s:
+        await s.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(**values)
+        )
+        await _commit(s)
+
+
+async def get_users_page(
+    cursor_id: Optional[int] = None,
+    backward: bool = False,
+    limit: int = 10,
+    session: Optional[AsyncSession] = None,
+) -> Tuple[List[User], bool]:
+    """
+    Страница пользователей от новых к старым (keyset по (created_at, id)).
+
+    Args:
+        cursor_id: id пользователя на границе соседней страницы
+            (None — первая страница)
+        backward: True — страница перед курсором (новее), False — после него
+        limit: Размер страницы
+        session: Сессия БД (опционально)
+
+    Returns:
+        (пользователи от новых к старым, есть ли ещё страницы в направлении
+        перехода)
+    """
+    async with session_scope(session) as s:
+        key = tuple_(User.created_at, User.id)
+        stmt = select(User)
+        if cursor_id is not None:
+            # created_at курсора сравнивается в БД как хранится: в SQLite это
+            # строка, и datetime из Python с микросекундами её бы не совпал
+            cursor_created_at = (
+                select(User.created_at).where(User.id == cursor_id).scalar_subquery()
+            )
+            bound = tuple_(cursor_created_at, cursor_id)
+            stmt = stmt.where(key > bound if backward else key < bound)
+
+        if backward:
+            stmt = stmt.order_by(User.created_at, User.id)
+        else:
+            stmt = stmt.order_by(User.created_at.desc(), User.id.desc())
+
+        users = list((await s.scalars(stmt.limit(limit + 1))).all())
+        has_more = len(users) > limit
+        users = users[:limit]
+        if backward:
+            users.reverse()
+        return users, has_more
+
+
+def _prefix_match(column, prefix: str):
+    if engine.dialect.name == "postgresql":
+        # Сравнение строк в PostgreSQL зависит от сортировки базы, поэтому
+        # LIKE с экранированием; индекс — *_pattern с varchar_pattern_ops
+        escaped = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        return column.like(f"{escaped}%", escape="/")
+    # SQLite сравнивает побайтно (BINARY), и диапазон использует обычный
+    # индекс, а LIKE — нет (он не учитывает регистр)
+    return (column >= prefix) & (column < prefix + chr(0x10FFFF))
+
+
+async def search_users(
+    query: str, limit: int = 10, session: Optional[AsyncSession] = None
+) -> List[User]:
+    """
+    Поиск пользователей по tg_id, началу username или имени.
+
+    Args:
+        query: Telegram ID, @username или начало имени
+        limit: Максимум результатов
+        session: Сессия БД (опционально)
+
+    Returns:
+        Найденные пользователи от новых к старым
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    if query.isdigit():
+        condition = User.tg_id == int(query)
+    else:
+        prefix = query.lstrip("@")
+        # Регистр без lower(): SQLite не понижает кириллицу
+        variants = {
+            prefix,
+            prefix.lower(),
+            prefix.capitalize(),
+            prefix[:1].upper() + prefix[1:],
+        }
+        columns = (
+            [User.username]
+            if query.startswith("@")
+            else [
+                User.username,
+                User.full_name,
+            ]
+        )
+        condition = or_(
+            *(
+                _prefix_match(column, variant)
+                for column in columns
+                for variant in variants
+            )
+        )
+
+    async with session_scope(session) as s:
+        result = await s.scalars(
+            select(User)
+            .where(condition)
+            .order_by(User.created_at.desc(), User.id.desc())
+            .limit(limit)
+        )
+        return list(result.all())
+
+
+async def get_subscriptions_page(
+    status: Optional[SubscriptionStatus] = None,
+    server_id: Optional[int] = None,
+    expires_within_days: Optional[int] = None,
+    cursor_id: Optional[int] = None,
+    backward: bool = False,
+    limit: int = 10,
+    session: Optional[AsyncSession] = None,
+) -> Tuple[List[Subscription], bool]:
+    """
+    Страница подписок от новых к старым (keyset по (created_at, id)).
+
+    Пользователь, сервер и тариф подгружаются в том же запросе (JOIN),
+    поэтому страница — один запрос независимо от числа строк.
+
+    Args:
+        status: Только подписки с этим статусом
+        server_id: Только подписки этого сервера
+        expires_within_days: Только истекающие в ближайшие N дней
+        cursor_id: id подписки на границе соседней страницы
+            (None — первая страница)
+        backward: True — страница перед курсором (новее), False — после него
+        limit: Размер страницы
+        session: Сессия БД (опционально)
+
+    Returns:
+        (подписки от новых к старым, есть ли ещё страницы в направлении
+        перехода)
+    """
+    stmt = select(Subscription).options(
+        joinedload(Subscription.user),
+        joinedload(Subscription.server),
+        joinedload(Subscription.plan),
+    )
+    if status is not None:
+        stmt = stmt.where(Subscription.status == status)
+    if server_id is not None:
+        stmt = stmt.where(Subscription.server_id == server_id)
+    if expires_within_days is not None:
+        now = datetime.now()
+        stmt = stmt.where(
+            Subscription.expires_at >= now,
+            Subscription.expires_at < now + timedelta(days=expires_within_days),
+        )
+
+    key = tuple_(Subscription.created_at, Subscription.id)
+    if cursor_id is not None:
+        cursor_created_at = (
+            select(Subscription.created_at)
+            .where(Subscription.id == cursor_id)
+            .scalar_subquery()
+        )
+        bound = tuple_(cursor_created_at, cursor_id)
+        stmt = stmt.where(key > bound if backward else key < bound)
+
+    if backward:
+        stmt = stmt.order_by(Subscription.created_at, Subscription.id)
+    else:
+        stmt = stmt.order_by(Subscription.created_at.desc(), Subscription.id.desc())
+
+    async with session_scope(session) as s:
+        subscriptions = list((await s.scalars(stmt.limit(limit + 1))).all())
+    has_more = len(subscriptions) > limit
+    subscriptions = subscriptions[:limit]
+    if backward:
+        subscriptions.reverse()
+    return subscriptions, has_more
+
+
+async def get_expired_active_subscriptions(
+    now: datetime,
+    since: Optional[datetime] = None,
+    limit: int = 500,
+    session: Optional[AsyncSession] = None,
+) -> List:
+    """
+    Активные подписки с истёкшим сроком (диапазон по ix_subscriptions_status_expires).
+
+    Args:
+        now: Момент, на который подписка считается истёкшей
+        since: Нижняя граница expires_at (включительно) — водяной знак
+        limit: Размер пачки
+
+    Returns:
+        Строки (id, server_id, uuid, expires_at) по возрастанию expires_at
+    """
+    stmt = select(
+        Subscription.id,
+        Subscription.server_id,
+        Subscription.uuid,
+        Subscription.expires_at,
+    ).where(
+        Subscription.status == SubscriptionStatus.ACTIVE,
+        Subscription.expires_at <= now,
+    )
+    if since is not None:
+        stmt = stmt.where(Subscription.expires_at >= since)
+    stmt = stmt.order_by(Subscription.expires_at, Subscription.id).limit(limit)
+    async with session_scope(session) as s:
+        return list((await s.execute(stmt)).all())
+
+
+async def expire_subscriptions(
+    subscription_ids: List[int],
+    now: datetime,
+    session: Optional[AsyncSession] = None,
+) -> List[int]:
+    """
+    Перевести подписки в EXPIRED одним UPDATE.
+
+    Подписки, продлённые после выборки, не затрагиваются.
+
+    Returns:
+        id подписок, статус которых изменён
+    """
+    if not subscription_ids:
+        return []
+    stmt = (
+        update(Subscription)
+        .where(
+            Subscription.id.in_(subscription_ids),
+            Subscription.status == SubscriptionStatus.ACTIVE,
+            Subscription.expires_at <= now,
+        )
+        .values(status=SubscriptionStatus.EXPIRED)
+        .returning(Subscription.id)
+        .execution_options(synchronize_session=False)
+    )
+    async with session_scope(session) as s:
+        expired = list((await s.scalars(stmt)).all())
+        await _commit(s)
+        return expired
+
+
+async def get_due_reminders(
+    days_before: int,
+    lower: datetime,
+    upper: datetime,
+    statuses: Tuple[SubscriptionStatus, ...],
+    skip_email_prefixes: Tuple[str, ...] = (),
+    limit: int = 500,
+    session: Optional[AsyncSession] = None,
+) -> List:
+    """
+    Подписки, которым пора отправить напоминание окна days_before.
+
+    Берутся подписки пользовательского бота (user_id = tg_id) со сроком в
+    (lower, upper], для которых напоминание этого окна и срока ещё не
+    отправлено и у пользователя нет другой активной подписки дольше.
+
+    Args:
+        days_before: Окно напоминания (0 — подписка истекла)
+        lower: Нижняя граница expires_at (не включительно)
+        upper: Верхняя граница expires_at (включительно)
+        statuses: Допустимые статусы подписки
+        skip_email_prefixes: Подписки, выданные админом, не напоминаем
+        limit: Размер пачки
+
+    Returns:
+        Строки (id, expires_at, plan_id, tg_id) по возрастанию expires_at
+    """
+    sent = select(SubscriptionReminder.subscription_id).where(
+        SubscriptionReminder.subscription_id == Subscription.id,
+        SubscriptionReminder.days_before == days_before,
+        SubscriptionReminder.expires_at == Subscription.expires_at,
+    )
+    newer = aliased(Subscription)
+    renewed = select(newer.id).where(
+        newer.user_id == Subscription.user_id,
+        newer.status == SubscriptionStatus.ACTIVE,
+        newer.expires_at > Subscription.expires_at,
+    )
+    stmt = (
+        select(
+            Subscription.id,
+            Subscription.expires_at,
+            Subscription.plan_id,
+            User.tg_id,
+        )
+        .join(User, User.tg_id == Subscription.user_id)
+        .where(
+            Subscription.status.in_(statuses),
+            Subscription.expires_at > lower,
+            Subscription.expires_at <= upper,
+            ~sent.exists(),
+            ~renewed.exists(),
+        )
+        .order_by(Subscription.expires_at, Subscription.id)
+        .limit(limit)
+    )
+    for prefix in skip_email_prefixes:
+        stmt = stmt.where(~Subscription.email.startswith(prefix, autoescape=True))
+    async with session_scope(session) as s:
+        return list((await s.execute(stmt)).all())
+
+
+async def log_reminders(
+    reminders: List[Tuple[int, int, datetime]],
+    session: Optional[AsyncSession] = None,
+) -> None:
+    """
+    Записать отправляемые напоминания.
+
+    Args:
+        reminders: (subscription_id, days_before, expires_at)
+    """
+    if not reminders:
+        return
+    async with session_scope(session) as s:
+        s.add_all(
+            SubscriptionReminder(
+                subscription_id=subscription_id,
+                days_before=days_before,
+                expires_at=expires_at,
+            )
+            for subscription_id, days_before, expires_at in reminders
+        )
+        await _commit(s)
+
+
+async def purge_reminders(
+    before: datetime, session: Optional[AsyncSession] = None
+) -> int:
+    """
+    Удалить записи напоминаний о сроках раньше before.
+
+    Returns:
+        Количество удалённых строк
+    """
+    async with session_scope(session) as s:
+        result = await s.execute(
+            delete(SubscriptionReminder).where(SubscriptionReminder.expires_at < before)
+        )
+        await _commit(s)
+        return result.rowcount
+
+
+# Вставка с ON CONFLICT для текущего диалекта
+_insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+
+# Строк в одном INSERT снимков трафика
+TRAFFIC_INSERT_CHUNK = 500
+
+
+async def get_subscription_ids_by_email(
+    server_id: int, session: Optional[AsyncSession] = None
+) -> Dict[str, int]:
+    """
+    Подписки сервера по email клиента панели.
+
+    Returns:
+        Словарь email -> id подписки
+    """
+    async with session_scope(session) as s:
+        result = await s.execute(
+            select(Subscription.email, Subscription.id).where(
+                Subscription.server_id == server_id
+            )
+        )
+        return {email: subscription_id for email, subscription_id in result.all()}
+
+
+async def save_traffic_snapshots(
+    bucket: datetime,
+    snapshots: List[Tuple[int, int, int, int]],
+    session: Optional[AsyncSession] = None,
+) -> None:
+    """
+    Записать снимки трафика интервала (повторная запись обновляет снимок).
+
+    Args:
+        bucket: Начало интервала
+        snapshots: (subscription_id, up, down, total)
+    """
+    if not snapshots:
+        return
+    table = TrafficSnapshot.__table__
+    async with session_scope(session) as s:
+        for i in range(0, len(snapshots), TRAFFIC_INSERT_CHUNK):
+            stmt = _insert(table).values(
+                [
+                    {
+                        "subscription_id": subscription_id,
+                        "bucket": bucket,
+                        "up": up,
+                        "down": down,
+                        "total": total,
+                    }
+                    for subscription_id, up, down, total in snapshots[
+                        i : i + TRAFFIC_INSERT_CHUNK
+                    ]
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.subscription_id, table.c.bucket],
+                set_={
+                    "up": stmt.excluded.up,
+                    "down": stmt.excluded.down,
+                    "total": stmt.excluded.total,
+                },
+            )
+            await s.execute(stmt)
+        await _commit(s)
+
+
+async def purge_traffic_snapshots(
+    before: datetime, session: Optional[AsyncSession] = None
+) -> int:
+    """
+    Удалить снимки трафика интервалов раньше before.
+
+    Returns:
+        Количество удалённых строк
+    """
+    async with session_scope(session) as s:
+        result = await s.execute(
+            delete(TrafficSnapshot).where(TrafficSnapshot.bucket < before)
+        )
+        await _commit(s)
+        return result.rowcount
+
+
+async def get_latest_traffic(
+    subscription_ids: List[int], session: Optional[AsyncSession] = None
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Последние снимки трафика подписок.
+
+    Returns:
+        Словарь subscription_id -> (использовано байт, лимит байт)
+    """
+    if not subscription_ids:
+        return {}
+    stmt = select(
+        TrafficSnapshot.subscription_id,
+        TrafficSnapshot.up + TrafficSnapshot.down,
+        TrafficSnapshot.total,
+    ).where(
+        TrafficSnapshot.subscription_id.in_(subscription_ids),
+        TrafficSnapshot.bucket
+        == _latest_traffic_bucket(TrafficSnapshot.subscription_id),
+    )
+    async with session_scope(session) as s:
+        result = await s.execute(stmt)
+        return {
+            subscription_id: (used, total) for subscription_id, used, total in result
+        }
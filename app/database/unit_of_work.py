@@ -0,0 +1,100 @@
+"""
+Единица работы апдейта: общая сессия БД и действия после её фиксации.
+
+DbSessionMiddleware открывает одну сессию на апдейт и кладёт её в
+current_session. Записи хендлера копятся в одной транзакции, которая
+коммитится после хендлера и откатывается, если он упал.
+
+Побочные эффекты вне БД, которые должны случиться только вместе с
+записями (удаление старого клиента с панели, уведомления), откладываются
+через on_commit, а отмена уже сделанного на панели — через on_rollback.
+Хендлер, которому нужно зафиксировать записи до долгих сетевых запросов
+(панель 3x-ui, отправка сообщений), делает это явно через commit_update.
+"""
+
+import logging
+from contextvars import ContextVar
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Флаг в session.info: сессией владеет DbSessionMiddleware (одна на апдейт)
+UNIT_OF_WORK = "unit_of_work"
+
+# Списки отложенных действий в session.info
+_ON_COMMIT = "on_commit"
+_ON_ROLLBACK = "on_rollback"
+
+# Сессия текущего апдейта для кода, которому её не передать аргументом
+# (хранилище FSM); выставляется DbSessionMiddleware
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar(
+    "current_session", default=None
+)
+
+Callback = Callable[[], Awaitable[object]]
+
+
+def in_unit_of_work(session: Optional[AsyncSession]) -> bool:
+    """Принадлежит ли сессия апдейту (коммитит её DbSessionMiddleware)."""
+    return session is not None and bool(session.info.get(UNIT_OF_WORK))
+
+
+async def on_commit(callback: Callback, session: Optional[AsyncSession]) -> None:
+    """
+    Выполнить действие после фиксации транзакции апдейта.
+
+    Вне апдейта (сессии без UNIT_OF_WORK коммитят записи сразу) действие
+    выполняется немедленно.
+
+    Args:
+        callback: Корутинная функция без аргументов
+        session: Сессия, в которой сделаны записи
+    """
+    if in_unit_of_work(session):
+        session.info.setdefault(_ON_COMMIT, []).append(callback)
+    else:
+        await _run([callback])
+
+
+def on_rollback(callback: Callback, session: Optional[AsyncSession]) -> None:
+    """
+    Выполнить действие, если транзакция апдейта откатится.
+
+    Вне апдейта откатывать нечего, и действие не регистрируется.
+
+    Args:
+        callback: Корутинная функция без аргументов
+        session: Сессия, в которой сделаны записи
+    """
+    if in_unit_of_work(session):
+        session.info.setdefault(_ON_ROLLBACK, []).append(callback)
+
+
+async def commit_update(session: AsyncSession) -> None:
+    """Зафиксировать транзакцию апдейта и выполнить действия on_commit."""
+    try:
+        await session.commit()
+    except Exception:
+        # Не зафиксированное отменяется так же, как при ошибке хендлера
+        await rollback_update(session)
+        raise
+    session.info.pop(_ON_ROLLBACK, None)
+    await _run(session.info.pop(_ON_COMMIT, []))
+
+
+async def rollback_update(session: AsyncSession) -> None:
+    """Откатить транзакцию апдейта и выполнить действия on_rollback."""
+    await session.rollback()
+    session.info.pop(_ON_COMMIT, None)
+    await _run(session.info.pop(_ON_ROLLBACK, []))
+
+
+async def _run(callbacks: List[Callback]) -> None:
+    # Ошибка одного действия не отменяет остальные и не роняет апдейт
+    for callback in callbacks:
+        try:
+            await callback()
+        except Exception:
+            logger.exception(f"Ошибка отложенного действия {callback!r}")
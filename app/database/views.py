@@ -0,0 +1,34 @@
+"""
+Неизменяемые view-модели для экранов бота.
+
+Заполняются одним запросом из app.database.requests и не держат ORM-объектов,
+поэтому их можно безопасно использовать после закрытия сессии.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ProfileSubscriptionView:
+    """Активная подписка в профиле."""
+
+    email: str
+    expires_at: datetime
+    server_location: str
+    server_api_url: str
+    # Последний снимок трафика (байты); None — ещё не собирался
+    traffic_used: Optional[int] = None
+    traffic_limit: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class ProfileView:
+    """Данные экрана «👤 Профиль»."""
+
+    tg_id: int
+    balance: Decimal
+    referrals_count: int
+    subscription: Optional[ProfileSubscriptionView]
@@ -9,11 +9,19 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from app.database import requests as rq
+from app.database.catalogue import catalogue
 from app.database.models import Admin
 from app.keyboards.admin import get_admin_main_keyboard
 
-from app.handlers.admin import subscriptions, users, servers
+from app.handlers.admin import (
+    broadcast,
+    bulk,
+    servers,
+    subscription_list,
+    subscriptions,
+    user_list,
+    users,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +29,12 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 # Подключаем все роутеры
+# bulk, broadcast и списки — первыми: их хендлеры не должны перехватываться
+# универсальными хендлерами других роутеров
+router.include_router(bulk.router)
+router.include_router(broadcast.router)
+router.include_router(user_list.router)
+router.include_router(subscription_list.router)
 router.include_router(subscriptions.router)
 router.include_router(users.router)
 router.include_router(servers.router)
@@ -59,32 +73,10 @@ async def admin_menu_callback(callback: CallbackQuery, admin: Admin) -> None:
     await callback.answer()
 
 
-@router.message(F.text == "👥 Пользователи")
-async def show_users_list(message: Message) -> None:
-    """Показать список пользователей."""
-    users = await rq.get_all_users()
-
-    if not users:
-        await message.answer("📭 Пользователей пока нет.")
-        return
-
-    text = f"👥 <b>Пользователи ({len(users)})</b>\n\n"
-    for i, user in enumerate(users[:10], 1):
-        status = "✅" if user.received_bonus else "⏳"
-        text += (
-            f"{i}. {status} <code>{user.tg_id}</code> - {user.full_name or 'Unknown'}"
-        )
-        if user.username:
-            text += f" (@{user.username})"
-        text += f"\n   Баланс: {user.balance}₽\n"
-
-    await message.answer(text, parse_mode="HTML")
-
-
 @router.message(F.text == "📡 Серверы")
 async def show_servers_list(message: Message) -> None:
     """Показать список серверов."""
-    servers = await rq.get_all_servers()
+    servers = await catalogue.get_servers()
 
     if not servers:
         await message.answer("📭 Серверов пока нет.\nНажмите «➕ Добавить сервер».")
@@ -107,7 +99,7 @@ async def show_servers_list(message: Message) -> None:
 @router.message(F.text == "💳 Тарифы")
 async def show_plans_list(message: Message) -> None:
     """Показать список тарифов."""
-    plans = await rq.get_all_plans()
+    plans = await catalogue.get_plans()
 
     if not plans:
         await message.answer("📭 Тарифов пока нет.")
@@ -127,36 +119,6 @@ async def show_plans_list(message: Message) -> None:
     await message.answer(text, parse_mode="HTML")
 
 
-@router.message(F.text == "📋 Подписки")
-async def show_subscriptions_list(message: Message) -> None:
-    """Показать список подписок."""
-    # Получаем последние 10 подписок
-    async with rq.async_session() as session:
-        from sqlalchemy import select
-        from app.database.models import Subscription
-
-        result = await session.execute(
-            select(Subscription).order_by(Subscription.created_at.desc()).limit(10)
-        )
-        subscriptions = list(result.scalars().all())
-
-    if not subscriptions:
-        await message.answer("📭 Подписок пока нет.")
-        return
-
-    text = f"📋 <b>Последние подписки ({len(subscriptions)})</b>\n\n"
-    for sub in subscriptions:
-        user = await session.get(rq.User, sub.user_id)
-        user_name = user.full_name if user else f"User {sub.user_id}"
-        text += f"🔹 {user_name}\n"
-        text += f"   Email: {sub.email}\n"
-        text += f"   Истекает: {sub.expires_at.strftime('%d.%m.%Y')}\n"
-        status_value = sub.status.value if hasattr(sub.status, "value") else sub.status
-        text += f"   Статус: {status_value}\n\n"
-
-    await message.answer(text, parse_mode="HTML")
-
-
 @router.message(F.text == "➕ Добавить сервер")
 async def add_server_button_handler(message: Message, state: FSMContext) -> None:
     """Обработчик кнопки «➕ Добавить сервер»."""
@@ -0,0 +1,125 @@
+"""
+Хендлеры рассылки сообщений всем пользователям.
+"""
+
+import logging
+
+from aiogram import F, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Message
+
+from app.database import requests as rq
+from app.keyboards.admin import (
+    get_broadcast_confirm_keyboard,
+    get_broadcast_status_keyboard,
+)
+from app.database.models import BroadcastStatus
+from app.services.broadcast import (
+    BLOCKED,
+    DELIVERED,
+    FAILED,
+    broadcasts,
+    format_broadcast_status,
+)
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+BROADCAST_STATES = ("admin_broadcast_text", "admin_broadcast_confirm")
+
+
+@router.message(F.text == "📣 Рассылка")
+async def start_broadcast(message: Message, state: FSMContext) -> None:
+    """Начать рассылку."""
+    await state.clear()
+    if not broadcasts.available:
+        await message.answer("❌ Для рассылки нужен BOT_TOKEN пользовательского бота.")
+        return
+    if broadcasts.is_running():
+        await message.answer("⏳ Рассылка уже идёт, дождитесь её завершения.")
+        return
+
+    await message.answer(
+        "📣 <b>Рассылка</b>\n\n"
+        "Отправьте текст сообщения для всех пользователей "
+        "(форматирование сохраняется):\n"
+        "(или отправьте /cancel для отмены)",
+        parse_mode="HTML",
+    )
+    await state.set_state("admin_broadcast_text")
+
+
+@router.message(StateFilter(*BROADCAST_STATES), F.text == "/cancel")
+async def cancel_broadcast_input(message: Message, state: FSMContext) -> None:
+    """Отменить подготовку рассылки."""
+    await state.clear()
+    await message.answer("❌ Рассылка отменена.")
+
+
+@router.message(StateFilter("admin_broadcast_text"))
+async def process_broadcast_text(message: Message, state: FSMContext) -> None:
+    """Принять текст и показать предпросмотр."""
+    if not message.text:
+        await message.answer("❌ Отправьте текстовое сообщение:")
+        return
+
+    total = await rq.count_users()
+    await state.update_data(broadcast_text=message.html_text)
+    await message.answer(message.html_text, parse_mode="HTML")
+    await message.answer(
+        f"☝️ Так сообщение увидят пользователи.\n"
+        f"Получателей: <b>{total}</b>\n\nОтправить?",
+        reply_markup=get_broadcast_confirm_keyboard().as_markup(),
+        parse_mode="HTML",
+    )
+    await state.set_state("admin_broadcast_confirm")
+
+
+@router.callback_query(
+    StateFilter("admin_broadcast_confirm"), F.data == "admin_broadcast_send"
+)
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext) -> None:
+    """Запустить рассылку."""
+    data = await state.get_data()
+    if broadcasts.is_running():
+        await state.clear()
+        await callback.answer("Рассылка уже идёт", show_alert=True)
+        return
+
+    total = await rq.count_users()
+    # Запись коммитится своей сессией: фоновая рассылка обновляет её сразу
+    broadcast = await rq.create_broadcast(
+        text=data["broadcast_text"],
+        admin_chat_id=callback.message.chat.id,
+        total=total,
+    )
+    status_msg = await callback.message.answer(
+        format_broadcast_status(
+            broadcast.id,
+            BroadcastStatus.RUNNING,
+            total,
+            dict.fromkeys((DELIVERED, BLOCKED, FAILED), 0),
+        ),
+        reply_markup=get_broadcast_status_keyboard(broadcast.id).as_markup(),
+        parse_mode="HTML",
+    )
+    await rq.update_broadcast(broadcast.id, status_message_id=status_msg.message_id)
+    broadcast.status_message_id = status_msg.message_id
+
+    broadcasts.start(broadcast, callback.bot)
+    # Состояние пишется в транзакцию апдейта — после собственных коммитов выше,
+    # иначе на SQLite они ждали бы её блокировку
+    await state.clear()
+    await callback.answer("Рассылка запущена")
+
+
+@router.callback_query(F.data.startswith("admin_broadcast_stop_"))
+async def stop_broadcast(callback: CallbackQuery) -> None:
+    """Остановить рассылку."""
+    broadcast_id = int(callback.data.split("_")[-1])
+    if await broadcasts.cancel(broadcast_id):
+        await callback.answer("Рассылка остановлена")
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
@@ -0,0 +1,246 @@
+"""
+Хендлеры для массовой выдачи ключей (подарочные/корпоративные).
+"""
+
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from aiogram import F, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.inbounds import inbound_catalogue
+from app.api.pool import client_pool
+from app.api.three_x_ui import ClientSpec
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.unit_of_work import commit_update, rollback_update
+from app.services.placement import server_load
+from app.utils import extract_base_host, get_subscription_link
+from app.utils.admin_utils import parse_traffic_input
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+# Ограничение на одну выдачу
+BULK_MAX_KEYS = 1000
+
+BULK_STATES = (
+    "admin_bulk_user_id",
+    "admin_bulk_server",
+    "admin_bulk_count",
+    "admin_bulk_days",
+    "admin_bulk_traffic",
+)
+
+
+@router.message(F.text == "🎁 Массовая выдача")
+async def start_bulk_issue(message: Message, state: FSMContext) -> None:
+    """Начать массовую выдачу ключей."""
+    await state.clear()
+    await message.answer(
+        "🎁 <b>Массовая выдача ключей</b>\n\n"
+        "Введите <b>Telegram ID</b> владельца ключей:\n"
+        "(или отправьте /cancel для отмены)",
+        parse_mode="HTML",
+    )
+    await state.set_state("admin_bulk_user_id")
+
+
+@router.message(StateFilter(*BULK_STATES), F.text == "/cancel")
+async def cancel_bulk_issue(message: Message, state: FSMContext) -> None:
+    """Отменить массовую выдачу."""
+    await state.clear()
+    await message.answer("❌ Массовая выдача отменена.")
+
+
+@router.message(StateFilter("admin_bulk_user_id"))
+async def process_bulk_user(message: Message, state: FSMContext) -> None:
+    """Обработка Telegram ID владельца."""
+    text = (message.text or "").strip()
+    if not text.isdigit():
+        await message.answer("❌ Введите корректный Telegram ID (только цифры):")
+        return
+
+    user = await rq.get_user_by_tg_id(int(text))
+    if not user:
+        await message.answer(
+            f"❌ Пользователь с ID <code>{text}</code> не найден.\n\n"
+            "Введите корректный Telegram ID:",
+            parse_mode="HTML",
+        )
+        return
+
+    servers = await catalogue.get_active_servers()
+    if not servers:
+        await message.answer("❌ Нет активных серверов. Сначала добавьте сервер.")
+        await state.clear()
+        return
+
+    await state.update_data(bulk_user_id=user.id)
+
+    builder = InlineKeyboardBuilder()
+    for server in servers:
+        builder.row(
+            InlineKeyboardButton(
+                text=f"📡 {server.name} ({server.location})",
+                callback_data=f"admin_bulk_server_{server.id}",
+            )
+        )
+    builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="admin_cancel"))
+
+    await message.answer(
+        f"✅ Владелец: {user.full_name or 'Unknown'}\n\nВыберите сервер:",
+        reply_markup=builder.as_markup(),
+    )
+    await state.set_state("admin_bulk_server")
+
+
+@router.callback_query(
+    StateFilter("admin_bulk_server"), F.data.startswith("admin_bulk_server_")
+)
+async def process_bulk_server(callback: CallbackQuery, state: FSMContext) -> None:
+    """Обработка выбора сервера."""
+    server_id = int(callback.data.split("_")[-1])
+    await state.update_data(bulk_server_id=server_id)
+
+    await callback.message.answer(
+        f"Введите <b>количество ключей</b> (1–{BULK_MAX_KEYS}):", parse_mode="HTML"
+    )
+    await state.set_state("admin_bulk_count")
+    await callback.answer()
+
+
+@router.message(StateFilter("admin_bulk_count"))
+async def process_bulk_count(message: Message, state: FSMContext) -> None:
+    """Обработка количества ключей."""
+    text = (message.text or "").strip()
+    if not text.isdigit() or not 1 <= int(text) <= BULK_MAX_KEYS:
+        await message.answer(f"❌ Введите число от 1 до {BULK_MAX_KEYS}:")
+        return
+
+    await state.update_data(bulk_count=int(text))
+    await message.answer("Введите <b>срок действия в днях</b>:", parse_mode="HTML")
+    await state.set_state("admin_bulk_days")
+
+
+@router.message(StateFilter("admin_bulk_days"))
+async def process_bulk_days(message: Message, state: FSMContext) -> None:
+    """Обработка срока действия."""
+    text = (message.text or "").strip()
+    if not text.isdigit() or int(text) <= 0:
+        await message.answer("❌ Введите положительное число дней:")
+        return
+
+    await state.update_data(bulk_days=int(text))
+    await message.answer(
+        "Введите <b>лимит трафика в ГБ</b> на ключ (или 0 для безлимита):",
+        parse_mode="HTML",
+    )
+    await state.set_state("admin_bulk_traffic")
+
+
+@router.message(StateFilter("admin_bulk_traffic"))
+async def process_bulk_traffic(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
+    """Обработка лимита трафика и выдача ключей."""
+    traffic_gb = parse_traffic_input(message.text or "")
+    data = await state.get_data()
+    await state.clear()
+
+    server = await catalogue.get_server(data.get("bulk_server_id"))
+    if not server:
+        await message.answer("❌ Ошибка: сервер не найден")
+        return
+
+    client = await client_pool.acquire(server)
+    if not client:
+        await message.answer(f"❌ Ошибка подключения к серверу {server.name}")
+        return
+
+    target_inbound = await inbound_catalogue.get_default_inbound(server)
+    if not target_inbound:
+        await message.answer("❌ Нет доступных inbounds")
+        return
+
+    count = data["bulk_count"]
+    expires_at = datetime.now() + timedelta(days=data["bulk_days"])
+    expiry_time_ms = int(expires_at.timestamp() * 1000)
+    batch_tag = uuid.uuid4().hex[:6]
+
+    status_msg = await message.answer(f"⏳ Создаю {count} ключей на {server.name}...")
+
+    specs = []
+    for i in range(1, count + 1):
+        email = f"gift_{batch_tag}_{i:04d}"
+        specs.append(
+            ClientSpec(
+                email=email,
+                total_gb=traffic_gb,
+                expiry_time=expiry_time_ms,
+                sub_id=email,
+            )
+        )
+
+    results = await client.add_clients(target_inbound.id, specs)
+    created = [r for r in results if r.success]
+    failed = [r for r in results if not r.success]
+
+    links = target_inbound.link_template.render_many((r.uuid, r.email) for r in created)
+    if created:
+        try:
+            await rq.create_custom_subscriptions(
+                user_id=data["bulk_user_id"],
+                server_id=server.id,
+                inbound_id=target_inbound.id,
+                clients=[(r.uuid, r.email, link) for r, link in zip(created, links)],
+                expires_at=expires_at,
+                session=session,
+            )
+            await commit_update(session)
+        except Exception:
+            logger.exception(f"Массовая выдача {batch_tag}: ключи не сохранены в БД")
+            await rollback_update(session)
+            # Клиенты без подписок в БД не должны оставаться на панели
+            for r in created:
+                await client.delete_client(target_inbound.id, r.uuid)
+            await status_msg.edit_text(
+                "❌ Не удалось сохранить ключи, созданные клиенты удалены с панели"
+            )
+            return
+        server_load.reserve(server.id, len(created))
+
+    logger.info(
+        f"Массовая выдача {batch_tag}: создано {len(created)}, ошибок {len(failed)}"
+    )
+
+    text = (
+        f"✅ <b>Массовая выдача завершена</b>\n\n"
+        f"📡 Сервер: {server.name}\n"
+        f"🔑 Создано: {len(created)} из {count}\n"
+        f"📅 Истекают: {expires_at.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📊 Трафик: {traffic_gb or '∞'} ГБ на ключ\n"
+    )
+    if failed:
+        text += f"⚠️ Ошибок: {len(failed)} (первая: {failed[0].msg or 'нет ответа'})\n"
+    await status_msg.edit_text(text, parse_mode="HTML")
+
+    if created:
+        base_host = extract_base_host(server.api_url)
+        lines = [
+            f"{r.email}\t{get_subscription_link(base_host, r.email)}\t{link}"
+            for r, link in zip(created, links)
+        ]
+        await message.answer_document(
+            BufferedInputFile(
+                "\n".join(lines).encode(), filename=f"keys_{batch_tag}.tsv"
+            ),
+            caption=f"🎁 Ключи выдачи {batch_tag}",
+        )
@@ -6,10 +6,14 @@ import logging
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
+from app.api.inbounds import inbound_catalogue
+from app.api.pool import client_pool
 from app.database import requests as rq
+from app.database.catalogue import catalogue
 
 logger = logging.getLogger(__name__)
 
@@ -128,7 +132,9 @@ async def process_server_location(message: Message, state: FSMContext) -> None:
 
 
 @router.message()
-async def process_server_max_clients(message: Message, state: FSMContext) -> None:
+async def process_server_max_clients(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
     """Обработка максимального количества клиентов."""
     current_state = await state.get_state()
     if current_state != "admin_add_server_max_clients":
@@ -150,15 +156,12 @@ async def process_server_max_clients(message: Message, state: FSMContext) -> Non
         password=data["server_password"],
         location=data["server_location"],
         max_clients=max_clients if max_clients > 0 else None,
+        session=session,
     )
 
     if server:
         # Проверяем подключение к серверу
-        from app.api.three_x_ui import ThreeXUIClient
-
-        client = ThreeXUIClient(server.api_url, server.username, server.password)
-        login_success = await client.login()
-        await client.close()
+        login_success = await client_pool.acquire(server) is not None
 
         status = "✅ Подключение успешно" if login_success else "⚠️ Ошибка подключения"
 
@@ -189,20 +192,45 @@ async def show_server_card(callback: CallbackQuery) -> None:
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
         return
 
-    # Проверяем подключение
-    from app.api.three_x_ui import ThreeXUIClient
+    await _send_server_card(callback, server)
+
+
+@router.callback_query(F.data.startswith("admin_refresh_inbounds_"))
+async def refresh_server_inbounds(callback: CallbackQuery) -> None:
+    """Перечитать inbounds сервера из панели, минуя кэш."""
+    try:
+        server_id = int(callback.data.split("_")[-1])
+    except (ValueError, IndexError):
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
 
-    client = ThreeXUIClient(server.api_url, server.username, server.password)
-    login_success = await client.login()
-    inbounds = await client.get_inbounds() if login_success else None
-    await client.close()
+    server = await catalogue.get_server(server_id)
+
+    if not server:
+        await callback.answer("❌ Сервер не найден", show_alert=True)
+        return
+
+    await _send_server_card(callback, server, refresh=True)
+
+
+async def _send_server_card(
+    callback: CallbackQuery, server: rq.Server, refresh: bool = False
+) -> None:
+    """Отправить карточку сервера с проверкой подключения и списком inbounds."""
+    server_id = server.id
+
+    # Проверяем подключение
+    client = await client_pool.acquire(server)
+    login_success = client is not None
+    inbounds = (
+        await inbound_catalogue.get_inbounds(server, force=refresh) if client else None
+    )
 
     status = "✅ Активен" if server.is_active else "❌ Отключён"
     connection = "✅ Подключено" if login_success else "❌ Ошибка"
@@ -219,12 +247,11 @@ async def show_server_card(callback: CallbackQuery) -> None:
     if server.max_clients:
         text += f"<b>Макс. клиентов:</b> {server.max_clients}\n"
 
-    if inbounds and inbounds.get("success"):
-        inbounds_list = inbounds.get("obj", [])
-        text += f"\n📊 <b>Inbounds ({len(inbounds_list)})</b>\n"
-        for inbound in inbounds_list[:5]:
-            text += f"  • {inbound.get('tag', 'Unknown')} "
-            text += f"({inbound.get('port', '?')} port)\n"
+    if inbounds:
+        text += f"\n📊 <b>Inbounds ({len(inbounds)})</b>\n"
+        for inbound in inbounds[:5]:
+            text += f"  • {inbound.tag or 'Unknown'} "
+            text += f"({inbound.port or '?'} port)\n"
 
     # Клавиатура действий
     builder = InlineKeyboardBuilder()
@@ -233,6 +260,12 @@ async def show_server_card(callback: CallbackQuery) -> None:
             text="✏️ Редактировать", callback_data=f"admin_edit_server_{server_id}"
         ),
     )
+    builder.row(
+        InlineKeyboardButton(
+            text="🔄 Обновить inbounds",
+            callback_data=f"admin_refresh_inbounds_{server_id}",
+        ),
+    )
     builder.row(
         InlineKeyboardButton(
             text="🔘 Включить" if not server.is_active else "🔘 Выключить",
@@ -267,8 +300,7 @@ async def start_edit_server(callback: CallbackQuery, state: FSMContext) -> None:
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
@@ -336,7 +368,9 @@ async def edit_server_field(callback: CallbackQuery, state: FSMContext) -> None:
 
 
 @router.message()
-async def process_edit_server_value(message: Message, state: FSMContext) -> None:
+async def process_edit_server_value(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
     """Обработка нового значения поля сервера."""
     current_state = await state.get_state()
     if current_state != "admin_edit_server_value":
@@ -373,7 +407,7 @@ async def process_edit_server_value(message: Message, state: FSMContext) -> None
             await message.answer("❌ Введите корректное число:")
             return
 
-    success = await rq.update_server(server_id, **kwargs)
+    success = await rq.update_server(server_id, session=session, **kwargs)
 
     if success:
         await message.answer("✅ Поле обновлено!")
@@ -392,8 +426,7 @@ async def toggle_server(callback: CallbackQuery) -> None:
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
@@ -418,8 +451,7 @@ async def confirm_delete_server(callback: CallbackQuery) -> None:
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
@@ -457,8 +489,7 @@ async def execute_delete_server(callback: CallbackQuery) -> None:
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
@@ -466,6 +497,8 @@ async def execute_delete_server(callback: CallbackQuery) -> None:
 
     server_name = server.name
     await rq.delete_server(server_id)
+    await client_pool.invalidate(server_id)
+    inbound_catalogue.invalidate(server_id)
 
     await callback.message.answer(
         f"✅ Сервер <b>{server_name}</b> удалён.", parse_mode="HTML"
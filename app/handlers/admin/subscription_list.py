@@ -0,0 +1,165 @@
+"""
+Хендлеры списка подписок: постраничный просмотр с фильтрами.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.models import Subscription, SubscriptionStatus
+from app.keyboards.admin import get_subscriptions_list_keyboard
+from app.utils.admin_utils import SubscriptionFilter
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+SUBSCRIPTIONS_PAGE_SIZE = 10
+
+STATUS_LABELS = {
+    SubscriptionStatus.ACTIVE: "✅ активна",
+    SubscriptionStatus.EXPIRED: "⌛ истекла",
+    SubscriptionStatus.PENDING: "⏸ ожидает",
+    SubscriptionStatus.BANNED: "🚫 заблокирована",
+}
+
+
+def format_subscription_lines(subscriptions: List[Subscription]) -> str:
+    """
+    Строки списка подписок.
+
+    Args:
+        subscriptions: Подписки с подгруженными user, server и plan
+
+    Returns:
+        Текст в HTML
+    """
+    text = ""
+    for sub in subscriptions:
+        if sub.user:
+            user_name = (
+                f"{sub.user.full_name or 'Unknown'} (<code>{sub.user.tg_id}</code>)"
+            )
+        else:
+            user_name = f"User {sub.user_id}"
+        server_name = sub.server.name if sub.server else f"сервер {sub.server_id}"
+        plan_name = sub.plan.name if sub.plan else "—"
+        status = STATUS_LABELS.get(sub.status, sub.status)
+        text += f"🔹 {user_name}\n"
+        text += f"   Email: {sub.email}\n"
+        text += f"   📡 {server_name} · {plan_name}\n"
+        text += f"   Истекает: {sub.expires_at.strftime('%d.%m.%Y')} · {status}\n\n"
+    return text
+
+
+async def build_subscriptions_page(
+    flt: SubscriptionFilter,
+    page: int = 0,
+    cursor_id: Optional[int] = None,
+    backward: bool = False,
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Текст и клавиатура одной страницы списка подписок.
+
+    Args:
+        flt: Фильтр списка
+        page: Номер страницы (для отображения)
+        cursor_id: id крайней подписки соседней страницы
+        backward: Страница перед курсором, а не после него
+
+    Returns:
+        (текст, клавиатура)
+    """
+    subscriptions, has_more = await rq.get_subscriptions_page(
+        status=flt.status,
+        server_id=flt.server_id,
+        expires_within_days=flt.expires_within_days,
+        cursor_id=cursor_id,
+        backward=backward,
+        limit=SUBSCRIPTIONS_PAGE_SIZE,
+    )
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor_id is not None, has_more
+
+    servers = await catalogue.get_servers()
+    conditions = []
+    if flt.status is not None:
+        conditions.append(STATUS_LABELS[flt.status])
+    if flt.server_id is not None:
+        server = await catalogue.get_server(flt.server_id)
+        conditions.append(f"📡 {server.name if server else flt.server_id}")
+    if flt.expires_within_days is not None:
+        conditions.append(f"истекают ≤{flt.expires_within_days} дн.")
+
+    text = f"📋 <b>Подписки</b> — стр. {page + 1}\n"
+    if conditions:
+        text += f"Фильтр: {' · '.join(conditions)}\n"
+    text += "\n"
+    text += format_subscription_lines(subscriptions) or "📭 Подписок не найдено."
+
+    keyboard = get_subscriptions_list_keyboard(
+        subscriptions, flt, servers, page, has_prev, has_next
+    )
+    return text, keyboard.as_markup()
+
+
+async def _edit_page(callback: CallbackQuery, flt: SubscriptionFilter, *args) -> None:
+    text, markup = await build_subscriptions_page(flt, *args)
+    try:
+        await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        # Повторное нажатие на уже выбранный фильтр
+        if "message is not modified" not in str(e).lower():
+            raise
+    await callback.answer()
+
+
+@router.message(F.text == "📋 Подписки")
+async def show_subscriptions_list(message: Message) -> None:
+    """Показать первую страницу подписок."""
+    text, markup = await build_subscriptions_page(SubscriptionFilter())
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+@router.callback_query(F.data == "admin_subscriptions_list")
+async def show_subscriptions_list_callback(callback: CallbackQuery) -> None:
+    """Показать первую страницу подписок (callback)."""
+    text, markup = await build_subscriptions_page(SubscriptionFilter())
+    await callback.message.answer(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_subs_f_"))
+async def filter_subscriptions(callback: CallbackQuery) -> None:
+    """Применить фильтр (admin_subs_f_{фильтр})."""
+    try:
+        flt = SubscriptionFilter.unpack(callback.data.removeprefix("admin_subs_f_"))
+    except ValueError:
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+
+    await _edit_page(callback, flt)
+
+
+@router.callback_query(F.data.startswith("admin_subs_page_"))
+async def show_subscriptions_page(callback: CallbackQuery) -> None:
+    """Перейти на соседнюю страницу (admin_subs_page_{номер}_{b|a}{id}_{фильтр})."""
+    try:
+        page, cursor, packed = callback.data.removeprefix("admin_subs_page_").split(
+            "_", 2
+        )
+        page, cursor_id = int(page), int(cursor[1:])
+        backward = cursor[0] == "b"
+        flt = SubscriptionFilter.unpack(packed)
+    except (ValueError, IndexError):
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+
+    await _edit_page(callback, flt, max(page, 0), cursor_id, backward)
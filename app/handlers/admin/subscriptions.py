@@ -5,14 +5,19 @@
 import logging
 import uuid
 from datetime import datetime, timedelta
+from functools import partial
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
 from app.database import requests as rq
-from app.api.three_x_ui import ThreeXUIClient
+from app.database.catalogue import catalogue
+from app.database.unit_of_work import commit_update, on_rollback
+from app.api.inbounds import inbound_catalogue
+from app.api.pool import client_pool
 from app.utils.admin_utils import parse_traffic_input, generate_uuid
 
 logger = logging.getLogger(__name__)
@@ -84,8 +89,7 @@ async def create_subscription_fsm_handler(message: Message, state: FSMContext) -
         await state.update_data(user_id=user.id, tg_id=tg_id, user_name=user.full_name)
 
         # Получаем активные серверы
-        servers = await rq.get_all_servers()
-        active_servers = [s for s in servers if s.is_active]
+        active_servers = await catalogue.get_active_servers()
 
         if not active_servers:
             await message.answer("❌ Нет активных серверов. Сначала добавьте сервер.")
@@ -152,8 +156,7 @@ async def create_subscription_fsm_handler(message: Message, state: FSMContext) -
 async def process_server_select(callback: CallbackQuery, state: FSMContext) -> None:
     """Обработка выбора сервера."""
     server_id = int(callback.data.split("_")[-1])
-    server = await rq.get_all_servers()
-    server = next((s for s in server if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await callback.answer("❌ Сервер не найден", show_alert=True)
@@ -360,7 +363,9 @@ async def process_time_input(message: Message, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "admin_calendar_confirm")
-async def calendar_confirm(callback: CallbackQuery, state: FSMContext) -> None:
+async def calendar_confirm(
+    callback: CallbackQuery, state: FSMContext, session: AsyncSession
+) -> None:
     """Подтвердить выбор даты."""
     data = await state.get_data()
     expires_at = data.get("selected_date")
@@ -377,11 +382,13 @@ async def calendar_confirm(callback: CallbackQuery, state: FSMContext) -> None:
     await state.update_data(expires_at=expires_at)
 
     # Создаём подписку
-    await create_subscription_final(callback.message, state)
+    await create_subscription_final(callback.message, state, session)
     await callback.answer()
 
 
-async def create_subscription_final(message: Message, state: FSMContext) -> None:
+async def create_subscription_final(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
     """Финальное создание подписки."""
     data = await state.get_data()
 
@@ -391,8 +398,7 @@ async def create_subscription_final(message: Message, state: FSMContext) -> None
     expires_at = data.get("expires_at")
 
     # Получаем сервер
-    servers = await rq.get_all_servers()
-    server = next((s for s in servers if s.id == server_id), None)
+    server = await catalogue.get_server(server_id)
 
     if not server:
         await message.answer("❌ Ошибка: сервер не найден")
@@ -400,31 +406,20 @@ async def create_subscription_final(message: Message, state: FSMContext) -> None
         return
 
     # Подключаемся к 3x-ui
-    client = ThreeXUIClient(server.api_url, server.username, server.password)
+    client = await client_pool.acquire(server)
 
-    if not await client.login():
+    if not client:
         await message.answer(f"❌ Ошибка подключения к серверу {server.name}")
         await state.clear()
-        await client.close()
         return
 
-    # Получаем inbounds
-    inbounds_resp = await client.get_inbounds()
-    if not inbounds_resp.get("success"):
-        await message.answer("❌ Ошибка получения inbounds")
-        await state.clear()
-        await client.close()
-        return
-
-    inbounds = inbounds_resp.get("obj", [])
-    if not inbounds:
+    # Получаем inbound из кэша
+    target_inbound = await inbound_catalogue.get_default_inbound(server)
+    if not target_inbound:
         await message.answer("❌ Нет доступных inbounds")
         await state.clear()
-        await client.close()
         return
 
-    target_inbound = inbounds[0]
-
     # Генерируем данные клиента
     email = f"admin_{uuid.uuid4().hex[:8]}"
     client_uuid = generate_uuid()
@@ -432,35 +427,27 @@ async def create_subscription_final(message: Message, state: FSMContext) -> None
 
     # Добавляем клиента в 3x-ui
     success, msg, _ = await client.add_client(
-        inbound_id=target_inbound["id"],
+        inbound_id=target_inbound.id,
         email=email,
         total_gb=traffic_gb,
         expiry_time=expiry_time_ms,
         enable=True,
         sub_id=email,
+        client_uuid=client_uuid,
     )
 
     if not success:
         await message.answer(f"❌ Ошибка добавления клиента: {msg}")
         await state.clear()
-        await client.close()
         return
+    # Если запись подписки откатится, клиент на панели никому не принадлежит
+    on_rollback(partial(client.delete_client, target_inbound.id, client_uuid), session)
 
     # Генерируем ссылку
-    from app.utils import (
-        generate_vless_link,
-        get_subscription_link,
-        get_port_from_stream,
-        extract_base_host,
-    )
+    from app.utils import get_subscription_link, extract_base_host
 
     base_host = extract_base_host(server.api_url)
-    port = get_port_from_stream(
-        target_inbound.get("streamSettings", "{}"), default_port=443
-    )
-    vless_link = generate_vless_link(
-        client_uuid, base_host, port, email, target_inbound.get("streamSettings")
-    )
+    vless_link = target_inbound.link_template.render(client_uuid, email)
 
     # Создаём подписку в БД
     subscription = await rq.create_custom_subscription(
@@ -468,13 +455,16 @@ async def create_subscription_final(message: Message, state: FSMContext) -> None
         server_id=server_id,
         uuid=client_uuid,
         email=email,
-        inbound_id=target_inbound["id"],
+        inbound_id=target_inbound.id,
         key_url=vless_link,
         expires_at=expires_at,
         data_limit_gb=traffic_gb,
+        session=session,
     )
 
     if subscription:
+        # Подписка зафиксирована до отправки сообщения
+        await commit_update(session)
         sub_link = get_subscription_link(base_host, email)
 
         await message.answer(
@@ -491,7 +481,6 @@ async def create_subscription_final(message: Message, state: FSMContext) -> None
         await message.answer("❌ Ошибка сохранения подписки в БД")
 
     await state.clear()
-    await client.close()
 
 
 @router.callback_query(F.data == "admin_cancel")
@@ -0,0 +1,157 @@
+"""
+Хендлеры списка пользователей: постраничный просмотр и поиск.
+"""
+
+import html
+import logging
+from typing import List, Optional, Tuple
+
+from aiogram import F, Router
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+
+from app.database import requests as rq
+from app.database.models import User
+from app.keyboards.admin import get_users_list_keyboard
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+USERS_PAGE_SIZE = 10
+
+
+def format_user_lines(users: List[User], start: int = 1) -> str:
+    """
+    Строки списка пользователей.
+
+    Args:
+        users: Пользователи
+        start: Номер первой строки
+
+    Returns:
+        Текст в HTML
+    """
+    text = ""
+    for i, user in enumerate(users, start):
+        status = "✅" if user.received_bonus else "⏳"
+        text += (
+            f"{i}. {status} <code>{user.tg_id}</code> - {user.full_name or 'Unknown'}"
+        )
+        if user.username:
+            text += f" (@{user.username})"
+        text += f"\n   Баланс: {user.balance}₽\n"
+    return text
+
+
+async def build_users_page(
+    page: int = 0, cursor_id: Optional[int] = None, backward: bool = False
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Текст и клавиатура одной страницы списка пользователей.
+
+    Args:
+        page: Номер страницы (для отображения)
+        cursor_id: id крайнего пользователя соседней страницы
+        backward: Страница перед курсором, а не после него
+
+    Returns:
+        (текст, клавиатура)
+    """
+    users, has_more = await rq.get_users_page(cursor_id, backward, USERS_PAGE_SIZE)
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor_id is not None, has_more
+
+    total = await rq.count_users()
+    if not users:
+        text = "📭 Пользователей пока нет." if not total else "📭 Страница пуста."
+    else:
+        text = f"👥 <b>Пользователи ({total})</b> — стр. {page + 1}\n\n"
+        text += format_user_lines(users, page * USERS_PAGE_SIZE + 1)
+
+    keyboard = get_users_list_keyboard(users, page, has_prev, has_next)
+    return text, keyboard.as_markup()
+
+
+@router.message(F.text == "👥 Пользователи")
+async def show_users_list(message: Message) -> None:
+    """Показать первую страницу пользователей."""
+    text, markup = await build_users_page()
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+@router.callback_query(F.data.in_({"admin_users_list", "admin_users_all"}))
+async def show_users_list_callback(callback: CallbackQuery, state: FSMContext) -> None:
+    """Показать первую страницу пользователей (callback)."""
+    await state.clear()
+    text, markup = await build_users_page()
+    await callback.message.answer(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("admin_users_page_"))
+async def show_users_page(callback: CallbackQuery) -> None:
+    """Перейти на соседнюю страницу (admin_users_page_{номер}_{b|a}{id})."""
+    try:
+        page, cursor = callback.data.removeprefix("admin_users_page_").split("_")
+        page, cursor_id = int(page), int(cursor[1:])
+        backward = cursor[0] == "b"
+    except (ValueError, IndexError):
+        await callback.answer("❌ Ошибка", show_alert=True)
+        return
+
+    text, markup = await build_users_page(max(page, 0), cursor_id, backward)
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    await callback.answer()
+
+
+# ==================== Поиск ====================
+
+
+@router.callback_query(F.data == "admin_users_search")
+async def start_users_search(callback: CallbackQuery, state: FSMContext) -> None:
+    """Начать поиск пользователя."""
+    await callback.message.answer(
+        "🔍 <b>Поиск пользователя</b>\n\n"
+        "Введите Telegram ID, @username или начало имени:\n"
+        "(или отправьте /cancel для отмены)",
+        parse_mode="HTML",
+    )
+    await state.set_state("admin_users_search")
+    await callback.answer()
+
+
+@router.message(StateFilter("admin_users_search"), F.text == "/cancel")
+async def cancel_users_search(message: Message, state: FSMContext) -> None:
+    """Отменить поиск."""
+    await state.clear()
+    await message.answer("❌ Поиск отменён.")
+
+
+@router.message(StateFilter("admin_users_search"))
+async def process_users_search(message: Message, state: FSMContext) -> None:
+    """Показать найденных пользователей."""
+    query = (message.text or "").strip()
+    if not query:
+        await message.answer("❌ Введите Telegram ID, @username или имя:")
+        return
+
+    await state.clear()
+    users = await rq.search_users(query, limit=USERS_PAGE_SIZE)
+
+    if not users:
+        text = f"📭 По запросу <code>{html.escape(query)}</code> никого не найдено."
+    else:
+        text = f"🔍 <b>Найдено: {len(users)}</b>\n"
+        if len(users) == USERS_PAGE_SIZE:
+            text += "Показаны первые совпадения — уточните запрос.\n"
+        text += "\n" + format_user_lines(users)
+
+    await message.answer(
+        text,
+        reply_markup=get_users_list_keyboard(users).as_markup(),
+        parse_mode="HTML",
+    )
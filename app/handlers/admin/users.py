@@ -6,84 +6,20 @@ import logging
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
 from app.database import requests as rq
 from app.database.models import SubscriptionStatus
+from app.services.cleanup import remove_panel_clients
+from app.services.traffic import format_traffic
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
 
-# ==================== Просмотр пользователей ====================
-
-
-@router.callback_query(F.data == "admin_users_list")
-async def show_users_list_callback(callback: CallbackQuery, state: FSMContext) -> None:
-    """Показать список пользователей (callback)."""
-    await state.clear()
-    users = await rq.get_all_users()
-
-    if not users:
-        await callback.message.answer("📭 Пользователей пока нет.")
-        await callback.answer()
-        return
-
-    text = f"👥 <b>Пользователи ({len(users)})</b>\n\n"
-    for i, user in enumerate(users[:10], 1):
-        status = "✅" if user.received_bonus else "⏳"
-        text += (
-            f"{i}. {status} <code>{user.tg_id}</code> - {user.full_name or 'Unknown'}"
-        )
-        if user.username:
-            text += f" (@{user.username})"
-        text += f"\n   Баланс: {user.balance}₽\n"
-
-    builder = InlineKeyboardBuilder()
-    for user in users[:10]:
-        name = f"{user.full_name or 'Unknown'}"[:20]
-        if user.username:
-            name = f"@{user.username}"
-        builder.row(
-            InlineKeyboardButton(
-                text=f"👤 {name}", callback_data=f"admin_user_{user.id}"
-            )
-        )
-
-    if len(users) > 10:
-        builder.row(
-            InlineKeyboardButton(text="Всех в меню", callback_data="admin_users_all")
-        )
-
-    builder.row(InlineKeyboardButton(text="🔙 В меню", callback_data="admin_menu"))
-
-    await callback.message.answer(
-        text, reply_markup=builder.as_markup(), parse_mode="HTML"
-    )
-    await callback.answer()
-
-
-@router.callback_query(F.data == "admin_users_all")
-async def show_all_users(callback: CallbackQuery) -> None:
-    """Показать всех пользователей."""
-    users = await rq.get_all_users()
-
-    text = f"👥 <b>Все пользователи ({len(users)})</b>\n\n"
-    for i, user in enumerate(users, 1):
-        status = "✅" if user.received_bonus else "⏳"
-        text += (
-            f"{i}. {status} <code>{user.tg_id}</code> - {user.full_name or 'Unknown'}"
-        )
-        if user.username:
-            text += f" (@{user.username})"
-        text += f" | Баланс: {user.balance}₽\n"
-
-    await callback.message.answer(text, parse_mode="HTML")
-    await callback.answer()
-
-
 # ==================== Карточка пользователя ====================
 
 
@@ -132,10 +68,14 @@ async def show_user_card(callback: CallbackQuery) -> None:
 
     if subscriptions:
         text += f"\n📋 <b>Подписки ({len(subscriptions)})</b>\n"
+        traffic = await rq.get_latest_traffic([sub.id for sub in subscriptions[:3]])
         for sub in subscriptions[:3]:
             status_emoji = "✅" if sub.status == SubscriptionStatus.ACTIVE else "❌"
             text += f"   {status_emoji} {sub.email}\n"
             text += f"       до {sub.expires_at.strftime('%d.%m.%Y')}\n"
+            usage = format_traffic(*traffic.get(sub.id, (None, None)))
+            if usage:
+                text += f"       📊 {usage}\n"
     else:
         text += "\n📭 Подписок нет"
 
@@ -200,7 +140,9 @@ async def start_edit_balance(callback: CallbackQuery, state: FSMContext) -> None
 
 
 @router.message()
-async def process_edit_balance(message: Message, state: FSMContext) -> None:
+async def process_edit_balance(
+    message: Message, state: FSMContext, session: AsyncSession
+) -> None:
     """Обработка нового баланса."""
     current_state = await state.get_state()
     if current_state != "admin_edit_balance_value":
@@ -230,9 +172,9 @@ async def process_edit_balance(message: Message, state: FSMContext) -> None:
             # Устанавливаем новый баланс
             new_balance = float(text)
 
-        await rq.update_user_balance(user_id, new_balance)
+        await rq.update_user_balance(user_id, new_balance, session=session)
 
-        user = await rq.get_user_by_id(user_id)
+        user = await rq.get_user_by_id(user_id, session=session)
         await message.answer(
             f"✅ Баланс изменён!\n\nНовый баланс: <b>{new_balance}₽</b>",
             parse_mode="HTML",
@@ -289,46 +231,60 @@ async def confirm_delete_user(callback: CallbackQuery, state: FSMContext) -> Non
 
 
 @router.callback_query(F.data.startswith("admin_delete_user_exec_"))
-async def execute_delete_user(callback: CallbackQuery) -> None:
-    """Удаление пользователя."""
+async def execute_delete_user(callback: CallbackQuery, session: AsyncSession) -> None:
+    """
+    Удаление пользователя.
+
+    Из БД удаляются только подписки, клиент которых удалён с панели или
+    уже отсутствует на ней. Если хотя бы один клиент остался, пользователь
+    и его неудалённые подписки сохраняются для повторной попытки.
+    """
     try:
         user_id = int(callback.data.split("_")[-1])
     except (ValueError, IndexError):
         await callback.answer("❌ Ошибка", show_alert=True)
         return
 
-    user = await rq.get_user_by_id(user_id)
+    user = await rq.get_user_by_id(user_id, session=session)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
 
-    # Получаем подписки для удаления из 3x-ui
-    async with rq.async_session() as session:
-        from sqlalchemy import select
-
-        result = await session.execute(
-            select(rq.Subscription).where(rq.Subscription.user_id == user_id)
-        )
-        subscriptions = list(result.scalars().all())
-
-    # Удаляем клиентов из 3x-ui
-    for sub in subscriptions:
-        server = await session.get(rq.Server, sub.server_id)
-        if server:
-            from app.api.three_x_ui import ThreeXUIClient
+    # Панели могут отвечать долго — отвечаем на callback сразу
+    await callback.answer("⏳ Удаление…")
 
-            client = ThreeXUIClient(server.api_url, server.username, server.password)
-            if await client.login():
-                await client.delete_client(sub.inbound_id, sub.uuid)
-                await client.close()
+    subscriptions = await rq.get_subscriptions_by_user(user_id, session=session)
+    removal = await remove_panel_clients(subscriptions)
+    name = user.full_name or "Unknown"
 
-    # Удаляем из БД
-    await rq.delete_user_by_id(user_id)
+    if removal.failed:
+        deleted = await rq.delete_subscriptions(removal.done_ids, session=session)
+        builder = InlineKeyboardBuilder()
+        builder.row(
+            InlineKeyboardButton(
+                text="🔁 Повторить",
+                callback_data=f"admin_delete_user_exec_{user_id}",
+            ),
+        )
+        await callback.message.answer(
+            f"⚠️ Пользователь {name} удалён не полностью.\n\n"
+            f"Удалено подписок: {deleted}\n"
+            f"Не удалось удалить клиентов: {len(removal.failed)} "
+            f"({', '.join(removal.failed_servers())})\n\n"
+            f"Пользователь и эти подписки сохранены — повторите удаление, "
+            f"когда серверы будут доступны.",
+            reply_markup=builder.as_markup(),
+        )
+        return
 
-    await callback.message.answer(
-        f"✅ Пользователь {user.full_name or 'Unknown'} удалён."
-    )
-    await callback.answer()
+    await rq.delete_user_by_id(user_id, session=session)
+    text = f"✅ Пользователь {name} удалён."
+    if subscriptions:
+        text += (
+            f"\n\nКлиентов удалено с панелей: {len(removal.removed)}\n"
+            f"Уже отсутствовали на панелях: {len(removal.absent)}"
+        )
+    await callback.message.answer(text)
 
 
 # ==================== Подписки пользователя ====================
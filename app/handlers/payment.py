@@ -3,13 +3,19 @@
 """
 
 import logging
+from decimal import Decimal
 
 from aiogram import F, Router, Bot
 from aiogram.types import PreCheckoutQuery, Message, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import requests as rq
-from app.database.models import Plan, PaymentStatus
+from app.database.catalogue import catalogue
+from app.database.models import PaymentStatus
+from app.database.unit_of_work import commit_update
+from app.services.invoice import check_invoice, parse_invoice_payload
+from app.services.placement import server_load
 from app.services.subscription import SubscriptionService
 from app.utils import extract_base_host, get_subscription_link
 
@@ -19,50 +25,76 @@ router = Router()
 
 
 @router.pre_checkout_query()
-async def pre_checkout_query(pre_checkout_q: PreCheckoutQuery, bot: Bot) -> None:
+async def pre_checkout_query(
+    pre_checkout_q: PreCheckoutQuery, bot: Bot, session: AsyncSession
+) -> None:
     """
-    Подтверждение pre-checkout запроса от Telegram.
+    Проверка заказа перед списанием: тариф, баланс, место и доступность сервера.
 
     Args:
         pre_checkout_q: Объект pre-checkout запроса
         bot: Экземпляр бота
+        session: Сессия БД апдейта
     """
     logger.debug(f"Received pre_checkout_query: {pre_checkout_q.id}")
+    error = await check_invoice(
+        parse_invoice_payload(pre_checkout_q.invoice_payload),
+        tg_id=pre_checkout_q.from_user.id,
+        total_amount=pre_checkout_q.total_amount,
+        session=session,
+    )
+    if error:
+        logger.info(
+            f"pre_checkout_query {pre_checkout_q.id} отклонён: {error} "
+            f"(payload {pre_checkout_q.invoice_payload})"
+        )
     try:
-        await bot.answer_pre_checkout_query(pre_checkout_q.id, ok=True)
-        logger.debug("Answered pre_checkout_query: OK")
+        await bot.answer_pre_checkout_query(
+            pre_checkout_q.id, ok=error is None, error_message=error
+        )
+        logger.debug(f"Answered pre_checkout_query: {'OK' if error is None else error}")
     except Exception as e:
         logger.error(f"Failed to answer pre_checkout_query: {e}")
 
 
 @router.message(F.successful_payment)
-async def successful_payment(message: Message, bot: Bot) -> None:
+async def successful_payment(message: Message, bot: Bot, session: AsyncSession) -> None:
     """
     Обработка успешного платежа.
 
     Args:
         message: Сообщение об успешном платеже
         bot: Экземпляр бота
+        session: Сессия БД апдейта
     """
     payload = message.successful_payment.invoice_payload
-    parts = payload.split(":")
+    invoice = parse_invoice_payload(payload)
+    if invoice is None:
+        # pre_checkout_query такие счета отклоняет — оплата прошла в обход
+        logger.error(
+            f"Оплата с нераспознанным payload {payload}: "
+            f"{message.successful_payment.telegram_payment_charge_id}"
+        )
+        await message.answer(
+            "✅ Оплата прошла, но заказ не распознан. Обратитесь в поддержку."
+        )
+        return
 
-    plan_id = int(parts[1])
-    tg_id = int(parts[2])
-    balance_used = float(parts[3]) if len(parts) > 3 else 0
+    plan_id = invoice.plan_id
+    tg_id = invoice.tg_id
+    balance_used = invoice.balance_used
 
     # Сумма платежа в рублях (копейки / 100)
-    payment_amount = message.successful_payment.total_amount / 100
+    payment_amount = Decimal(message.successful_payment.total_amount) / 100
     # Общая сумма с учётом баланса
     total_amount = payment_amount + balance_used
 
     # Списываем баланс, который был использован как скидка
     if balance_used > 0:
-        await rq.deduct_balance(tg_id, balance_used)
+        await rq.deduct_balance(tg_id, balance_used, session=session)
 
     # Получаем план для записи в payments
-    async with rq.async_session() as session:
-        plan = await session.get(Plan, plan_id)
+    plan = await catalogue.get_plan(plan_id)
 
     # Создаём запись о платеже в БД
     await rq.create_payment(
@@ -71,10 +103,20 @@ async def successful_payment(message: Message, bot: Bot) -> None:
         currency="RUB",
         status=PaymentStatus.SUCCEEDED,
         provider_id=message.successful_payment.telegram_payment_charge_id,
+        session=session,
     )
-
-    # Активируем подписку
-    server = await rq.get_active_server()
+    # Деньги уже списаны: платёж фиксируется до запросов к панели и не
+    # откатывается вместе с неудачной выдачей ключа
+    await commit_update(session)
+
+    # Активируем подписку на выбранном сервере, если на нём ещё есть место,
+    # иначе (и для счетов старого формата) — на наименее загруженном
+    await server_load.refresh()
+    server = await catalogue.get_server(invoice.server_id)
+    if server and server.is_active and server_load.has_capacity(server):
+        server_load.reserve(server.id)
+    else:
+        server = await server_load.place()
 
     if server and plan:
         success, subscription = await SubscriptionService.issue_subscription(
@@ -83,9 +125,12 @@ async def successful_payment(message: Message, bot: Bot) -> None:
             server=server,
             bot=bot,
             replace_existing=True,  # Обновляем существующую подписку
+            session=session,
         )
 
         if success and subscription:
+            await commit_update(session)
+
             # Отправляем уведомление об успешной активации
             base_host = extract_base_host(server.api_url)
             sub_link = get_subscription_link(base_host, subscription.email)
@@ -101,6 +146,7 @@ async def successful_payment(message: Message, bot: Bot) -> None:
             await message.answer(
                 f"✅ **Подписка активирована!**\n\n"
                 f"Тариф: {plan.name}\n"
+                f"Сервер: {server.location}\n"
                 f"Сумма оплаты: {total_amount} RUB\n"
                 f"Срок действия: {subscription.expires_at.strftime('%d.%m.%Y')}\n\n"
                 f"Нажмите на кнопки ниже для доступа.",
@@ -110,6 +156,8 @@ async def successful_payment(message: Message, bot: Bot) -> None:
             return
 
     # Если ошибка
+    if server:
+        server_load.release(server.id)
     await message.answer(
         "✅ Оплата прошла, но возникла ошибка при создании ключа. "
         "Обратитесь в поддержку."
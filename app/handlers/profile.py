@@ -3,33 +3,39 @@
 """
 
 from datetime import datetime
+from typing import Optional
 
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import requests as rq
+from app.database.views import ProfileSubscriptionView, ProfileView
 from app.keyboards import get_referral_keyboard
+from app.services.traffic import format_traffic
 from app.utils import MessageCleaner, extract_base_host, get_subscription_link
 
 router = Router()
 
 
 @router.message(F.text == "👤 Профиль")
-async def profile(message: Message) -> None:
+async def profile(message: Message, session: AsyncSession) -> None:
     """
     Показ профиля пользователя.
 
     Args:
         message: Сообщение от пользователя
+        session: Сессия БД апдейта
     """
-    user = await rq.select_user(message.from_user.id)
-    sub = await rq.get_user_subscription(user.tg_id)
-    referrals_count = await rq.get_referrals_count(user.id)
+    view = await rq.get_profile_view(message.from_user.id, session=session)
+    if not view:
+        await message.answer("Профиль не найден. Нажмите /start.")
+        return
 
-    text = _build_profile_text(user, sub, referrals_count)
-    markup = _build_profile_markup(sub)
+    text = _build_profile_text(view)
+    markup = _build_profile_markup(view.subscription)
 
     # Очищаем старые сообщения профиля
     await MessageCleaner.clear_old_messages(message.from_user.id, max_messages=1)
@@ -37,42 +43,46 @@ async def profile(message: Message) -> None:
     await message.answer(text, reply_markup=markup, parse_mode="Markdown")
 
 
-def _build_profile_text(user, sub, referrals_count: int) -> str:
+def _build_profile_text(view: ProfileView) -> str:
     """
     Построение текста профиля.
 
     Args:
-        user: Объект пользователя
-        sub: Объект подписки или None
-        referrals_count: Количество рефералов
+        view: Данные профиля
 
     Returns:
         Текст профиля
     """
     text = "👤 **Профиль**\n\n"
-    text += f"🆔 ID: `{user.tg_id}`\n"
-    text += f"💰 Баланс: {user.balance} RUB\n"
-    text += f"👥 Приглашено друзей: {referrals_count}\n\n"
+    text += f"🆔 ID: `{view.tg_id}`\n"
+    text += f"💰 Баланс: {view.balance} RUB\n"
+    text += f"👥 Приглашено друзей: {view.referrals_count}\n\n"
 
+    sub = view.subscription
     if sub:
         expiry = sub.expires_at.strftime("%d.%m.%Y")
         days_left = (sub.expires_at - datetime.now()).days
 
         text += "🔑 **Активная подписка**\n"
         text += f"📅 Истекает: {expiry} ({days_left} дн.)\n"
-        text += f"🌍 Сервер: {sub.server.location}\n"
+        text += f"🌍 Сервер: {sub.server_location}\n"
+        traffic = format_traffic(sub.traffic_used, sub.traffic_limit)
+        if traffic:
+            text += f"📊 Трафик: {traffic}\n"
     else:
         text += "❌ Нет активной подписки."
 
     return text
 
 
-def _build_profile_markup(sub) -> InlineKeyboardMarkup:
+def _build_profile_markup(
+    sub: Optional[ProfileSubscriptionView],
+) -> InlineKeyboardMarkup:
     """
     Построение клавиатуры профиля.
 
     Args:
-        sub: Объект подписки или None
+        sub: Активная подписка или None
 
     Returns:
         InlineKeyboardMarkup
@@ -80,7 +90,7 @@ def _build_profile_markup(sub) -> InlineKeyboardMarkup:
     if sub:
         builder = InlineKeyboardBuilder()
 
-        base_host = extract_base_host(sub.server.api_url)
+        base_host = extract_base_host(sub.server_api_url)
         sub_link = get_subscription_link(base_host, sub.email)
 
         builder.row(InlineKeyboardButton(text="📥 Моя подписка", url=sub_link))
@@ -98,14 +108,15 @@ def _build_profile_markup(sub) -> InlineKeyboardMarkup:
 
 
 @router.callback_query(F.data == "view_key")
-async def view_key(callback: CallbackQuery) -> None:
+async def view_key(callback: CallbackQuery, session: AsyncSession) -> None:
     """
     Показ ключа подписки.
 
     Args:
         callback: Callback query от пользователя
+        session: Сессия БД апдейта
     """
-    sub = await rq.get_user_subscription(callback.from_user.id)
+    sub = await rq.get_user_subscription(callback.from_user.id, session=session)
 
     if sub:
         msg = (
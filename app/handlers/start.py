@@ -7,9 +7,13 @@ import logging
 from aiogram import F, Router, Bot
 from aiogram.filters import CommandStart
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.unit_of_work import commit_update
 from app.services.subscription import SubscriptionService
+from app.services.placement import server_load
 from app.services.referral import ReferralService
 from app.keyboards import main_menu
 from app.utils import MessageCleaner
@@ -22,12 +26,13 @@ BOT_USERNAME = "VPNLESS_VPN_BOT"
 
 
 @router.message(CommandStart())
-async def start_command(message: Message) -> None:
+async def start_command(message: Message, session: AsyncSession) -> None:
     """
     Обработчик команды /start.
 
     Args:
         message: Сообщение от пользователя
+        session: Сессия БД апдейта
     """
     referrer_id = None
 
@@ -45,10 +50,15 @@ async def start_command(message: Message) -> None:
         surname=message.from_user.last_name,
         user_tag=message.from_user.username,
         referrer_id=referrer_id,
+        session=session,
     )
 
     if is_new:
-        await _handle_new_user(message=message, referrer_id=referrer_id)
+        # Регистрация не зависит от пробного периода и не ждёт панель
+        await commit_update(session)
+        await _handle_new_user(
+            message=message, referrer_id=referrer_id, session=session
+        )
     else:
         await message.answer(
             f"С возвращением, {message.from_user.first_name}!", reply_markup=main_menu
@@ -58,34 +68,42 @@ async def start_command(message: Message) -> None:
     await MessageCleaner.clear_old_messages(message.from_user.id, max_messages=2)
 
 
-async def _handle_new_user(message: Message, referrer_id: int | None) -> None:
+async def _handle_new_user(
+    message: Message, referrer_id: int | None, session: AsyncSession
+) -> None:
     """
     Обработка нового пользователя.
 
     Args:
         message: Сообщение от пользователя
         referrer_id: ID реферера
+        session: Сессия БД апдейта
     """
     msg = f"👋 Привет, {message.from_user.first_name}!\nДобро пожаловать в VPNLESS."
 
-    # Получаем trial план и сервер
-    trial_plan = await rq.get_trial_plan()
-    server = await rq.get_active_server()
+    # Получаем trial план и наименее загруженный сервер (место резервируется)
+    trial_plan = await catalogue.get_trial_plan()
+    server = await server_load.place()
+    activated = False
 
     logger.info(f"Trial plan: {trial_plan}, Server: {server}")
 
     # Проверяем наличие активной подписки у пользователя
-    existing_sub = await rq.get_user_subscription(message.from_user.id)
+    existing_sub = await rq.get_user_subscription(message.from_user.id, session=session)
 
     if trial_plan and server and not existing_sub:
         logger.info(f"Активация trial для пользователя {message.from_user.id}")
         success, sub_link = await SubscriptionService.activate_trial(
-            tg_id=message.from_user.id, trial_plan=trial_plan, server=server
+            tg_id=message.from_user.id,
+            trial_plan=trial_plan,
+            server=server,
+            session=session,
         )
 
         logger.info(f"Результат активации: success={success}, sub_link={sub_link}")
 
-        if success and sub_link:
+        activated = success and bool(sub_link)
+        if activated:
             msg += (
                 f"\n\n🎁 **Вам начислен пробный период на 7 дней!**\n\n"
                 f"Моя подписка: [Нажать]({sub_link})\n"
@@ -100,11 +118,17 @@ async def _handle_new_user(message: Message, referrer_id: int | None) -> None:
             logger.warning("Trial план не найден")
             msg += "\n\n⚠️ Пробный план не найден в базе данных."
         if not server:
-            logger.warning("Активный сервер не найден")
-            msg += "\n\n⚠️ Активные серверы отсутствуют."
+            logger.warning("Нет активного сервера со свободным местом")
+            msg += "\n\n⚠️ Свободные серверы отсутствуют."
         if not trial_plan or not server:
             msg += "\n\nПопробуйте позже или обратитесь в поддержку."
 
+    if server and not activated:
+        server_load.release(server.id)
+    if activated:
+        # Пробная подписка фиксируется до запросов реферальной программы
+        await commit_update(session)
+
     # Обработка реферала (всегда, независимо от активации trial)
     if referrer_id:
         logger.info(
@@ -117,6 +141,7 @@ async def _handle_new_user(message: Message, referrer_id: int | None) -> None:
             server=server,
             trial_plan=trial_plan,
             bot=bot,
+            session=session,
         )
 
     await message.answer(msg, reply_markup=main_menu, parse_mode="Markdown")
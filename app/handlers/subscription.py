@@ -10,10 +10,14 @@ from aiogram import F, Router, Bot
 from aiogram.types import CallbackQuery, Message, LabeledPrice, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import requests as rq
+from app.database.catalogue import catalogue
 from app.database.models import Plan, Server, PaymentStatus
+from app.database.unit_of_work import commit_update
+from app.services.invoice import build_invoice_payload
+from app.services.placement import server_load
 from app.services.subscription import SubscriptionService
 from app.keyboards.inline import get_plans_keyboard, get_servers_keyboard
 from app.utils import MessageCleaner, extract_base_host, get_subscription_link
@@ -31,19 +35,10 @@ async def buy_subscription(message: Message) -> None:
     Args:
         message: Сообщение от пользователя
     """
-    async with rq.async_session() as session:
-        plans = (
-            await session.scalars(
-                select(Plan).where(Plan.price > 0).order_by(Plan.price)
-            )
-        ).all()
-
     # Очищаем старые сообщения о покупке
     await MessageCleaner.clear_old_messages(message.from_user.id, max_messages=1)
 
-    await message.answer(
-        "Выберите тариф:", reply_markup=await get_plans_keyboard(plans)
-    )
+    await message.answer("Выберите тариф:", reply_markup=await get_plans_keyboard())
 
 
 @router.callback_query(F.data.startswith("buy_plan_"))
@@ -58,8 +53,7 @@ async def process_buy_plan(callback: CallbackQuery, state: FSMContext) -> None:
 
     plan_id = int(callback.data.split("_")[2])
 
-    async with rq.async_session() as session:
-        plan = await session.get(Plan, plan_id)
+    plan = await catalogue.get_plan(plan_id)
 
     if not plan:
         await callback.answer("Тариф не найден.", show_alert=True)
@@ -68,26 +62,26 @@ async def process_buy_plan(callback: CallbackQuery, state: FSMContext) -> None:
     # Сохраняем ID тарифа в состоянии
     await state.update_data(plan_id=plan_id)
 
-    # Получаем серверы со статистикой
-    servers_with_stats = await rq.get_servers_with_stats()
-
-    if not servers_with_stats:
+    if not await catalogue.get_active_servers():
         await callback.answer("Нет доступных серверов.", show_alert=True)
         return
 
+    # Заполненность серверов для индикаторов — из таблицы нагрузки
+    sub_counts = await server_load.get_counts()
+
     await callback.message.answer(
         "Выберите сервер:\n"
         "🟢 - свободно\n"
         "🟡 - средняя заполненность\n"
         "🔴 - почти заполнен",
-        reply_markup=await get_servers_keyboard(servers_with_stats),
+        reply_markup=await get_servers_keyboard(sub_counts),
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("select_server_"))
 async def process_server_selection(
-    callback: CallbackQuery, state: FSMContext, bot: Bot
+    callback: CallbackQuery, state: FSMContext, bot: Bot, session: AsyncSession
 ) -> None:
     """
     Обработка выбора сервера и оплата подписки.
@@ -96,22 +90,26 @@ async def process_server_selection(
         callback: Callback query от пользователя
         state: FSM context
         bot: Экземпляр бота
+        session: Сессия БД апдейта
     """
 
     server_id = int(callback.data.split("_")[2])
 
-    async with rq.async_session() as session:
-        server = await session.get(Server, server_id)
-        data = await state.get_data()
-        plan_id = data.get("plan_id")
-        plan = await session.get(Plan, plan_id)
+    server = await catalogue.get_server(server_id)
+    data = await state.get_data()
+    plan = await catalogue.get_plan(data.get("plan_id"))
 
     if not server or not plan:
         await callback.answer("Ошибка выбора.", show_alert=True)
         await state.clear()
         return
 
-    user = await rq.select_user(callback.from_user.id)
+    await server_load.refresh()
+    if not server.is_active or not server_load.has_capacity(server):
+        await callback.answer("Сервер заполнен, выберите другой.", show_alert=True)
+        return
+
+    user = await rq.select_user(callback.from_user.id, session=session)
 
     # Очищаем состояние
     await state.clear()
@@ -119,16 +117,28 @@ async def process_server_selection(
     # Полная оплата с баланса
     if user.balance >= plan.price:
         await _pay_with_balance(
-            callback=callback, user=user, plan=plan, server=server, bot=bot
+            callback=callback,
+            user=user,
+            plan=plan,
+            server=server,
+            bot=bot,
+            session=session,
         )
         return
 
     # Частичная оплата через Yoo
-    await _pay_with_yookassa(callback=callback, user=user, plan=plan, bot=bot)
+    await _pay_with_yookassa(
+        callback=callback, user=user, plan=plan, server=server, bot=bot
+    )
 
 
 async def _pay_with_balance(
-    callback: CallbackQuery, user, plan: Plan, server: Server, bot: Bot
+    callback: CallbackQuery,
+    user,
+    plan: Plan,
+    server: Server,
+    bot: Bot,
+    session: AsyncSession,
 ) -> None:
     """
     Оплата подписки с баланса пользователя.
@@ -139,23 +149,34 @@ async def _pay_with_balance(
         plan: Тарифный план
         server: Выбранный сервер
         bot: Экземпляр бота
+        session: Сессия БД апдейта
     """
-    await rq.deduct_balance(user.tg_id, plan.price)
-
-    # Создаём запись о платеже в БД
-    await rq.create_payment(
-        user_id=user.id,
-        amount=plan.price,
-        currency="RUB",
-        status=PaymentStatus.SUCCEEDED,
-        provider_id=f"balance_payment_{user.tg_id}_{int(time.time())}",
-    )
-
+    server_load.reserve(server.id)
+    # Сначала ключ: клиент на панели создаётся до первой записи апдейта,
+    # и транзакция не ждёт панель. Баланс списывается только за выданный ключ
     success, subscription = await SubscriptionService.issue_subscription(
-        tg_id=user.tg_id, plan=plan, server=server, bot=bot, replace_existing=True
+        tg_id=user.tg_id,
+        plan=plan,
+        server=server,
+        bot=bot,
+        replace_existing=True,
+        session=session,
     )
 
     if success and subscription:
+        await rq.deduct_balance(user.tg_id, plan.price, session=session)
+        # Создаём запись о платеже в БД
+        await rq.create_payment(
+            user_id=user.id,
+            amount=plan.price,
+            currency="RUB",
+            status=PaymentStatus.SUCCEEDED,
+            provider_id=f"balance_payment_{user.tg_id}_{int(time.time())}",
+            session=session,
+        )
+        # Покупка зафиксирована до отправки сообщений
+        await commit_update(session)
+
         # Отправляем уведомление об успешной активации
         base_host = extract_base_host(server.api_url)
         sub_link = get_subscription_link(base_host, subscription.email)
@@ -180,15 +201,15 @@ async def _pay_with_balance(
         )
         await callback.answer()
     else:
-        # Возвращаем баланс при ошибке
-        await rq.add_balance(user.tg_id, plan.price)
+        # Возвращаем место на сервере; баланс не списывался
+        server_load.release(server.id)
         await callback.message.answer(
-            "⚠️ Ошибка при активации. Деньги возвращены на баланс, обратитесь в поддержку."
+            "⚠️ Ошибка при активации. Баланс не списан, обратитесь в поддержку."
         )
 
 
 async def _pay_with_yookassa(
-    callback: CallbackQuery, user, plan: Plan, bot: Bot
+    callback: CallbackQuery, user, plan: Plan, server: Server, bot: Bot
 ) -> None:
     """
     Оплата подписки через (с доплатой).
@@ -210,7 +231,13 @@ async def _pay_with_yookassa(
                 f"Доплата за VPN. Использовано с баланса: {user.balance} RUB. "
                 f"К оплате: {amount_to_pay} RUB."
             ),
-            payload=f"vpn_payment:{plan.id}:{callback.from_user.id}:{user.balance}",
+            payload=build_invoice_payload(
+                plan_id=plan.id,
+                server_id=server.id,
+                tg_id=callback.from_user.id,
+                balance_used=user.balance,
+                catalogue_version=catalogue.version,
+            ),
             provider_token=os.getenv("YOOKASSA_LIVE_TOKEN"),
             currency="RUB",
             prices=[
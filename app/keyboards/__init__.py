@@ -8,6 +8,7 @@ from app.keyboards.inline import (
     get_profile_keyboard,
     get_subscription_keyboard,
     get_referral_keyboard,
+    get_renew_keyboard,
 )
 
 # Для обратной совместимости
@@ -23,6 +24,7 @@ __all__ = [
     "get_profile_keyboard",
     "get_subscription_keyboard",
     "get_referral_keyboard",
+    "get_renew_keyboard",
     # Алиасы для обратной совместимости
     "inline_plans",
     "profile_keyboard",
@@ -2,9 +2,17 @@
 Клавиатуры для админ-бота.
 """
 
+from dataclasses import replace
+
 from aiogram.types import InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
+from app.database.models import SubscriptionStatus
+from app.utils.admin_utils import SubscriptionFilter
+
+# Окна «истекают в ближайшие N дней» в фильтре подписок
+SUBSCRIPTION_EXPIRY_WINDOWS = (3, 7, 30)
+
 
 def get_admin_main_keyboard() -> ReplyKeyboardMarkup:
     """Главное меню админ-бота."""
@@ -21,18 +29,29 @@ def get_admin_main_keyboard() -> ReplyKeyboardMarkup:
         KeyboardButton(text="➕ Создать подписку"),
         KeyboardButton(text="➕ Добавить сервер"),
     )
-    builder.adjust(2, 2, 2)
+    builder.row(
+        KeyboardButton(text="🎁 Массовая выдача"),
+        KeyboardButton(text="📣 Рассылка"),
+    )
+    builder.adjust(2, 2, 2, 2)
     return builder.as_markup(resize_keyboard=True)
 
 
-def get_users_list_keyboard(users: list, page: int = 0) -> InlineKeyboardBuilder:
-    """Клавиатура со списком пользователей."""
+def get_users_list_keyboard(
+    users: list, page: int = 0, has_prev: bool = False, has_next: bool = False
+) -> InlineKeyboardBuilder:
+    """
+    Клавиатура со списком пользователей.
+
+    Кнопки пагинации несут id крайнего пользователя страницы:
+    admin_users_page_{номер}_{b|a}{id} — страница перед ним или после него.
+    """
     builder = InlineKeyboardBuilder()
 
     for user in users:
-        name = f"{user.full_name or 'Unknown'}"
+        name = f"{user.full_name or 'Unknown'}"[:20]
         if user.username:
-            name += f" (@{user.username})"
+            name = f"@{user.username}"
         builder.row(
             InlineKeyboardButton(
                 text=f"👤 {name}", callback_data=f"admin_user_{user.id}"
@@ -40,19 +59,27 @@ def get_users_list_keyboard(users: list, page: int = 0) -> InlineKeyboardBuilder
         )
 
     # Пагинация
-    if page > 0:
-        builder.row(
+    navigation = []
+    if has_prev and users:
+        navigation.append(
             InlineKeyboardButton(
-                text="⬅️ Назад", callback_data=f"admin_users_page_{page - 1}"
+                text="⬅️ Назад",
+                callback_data=f"admin_users_page_{page - 1}_b{users[0].id}",
             )
         )
-    if len(users) == 10:  # Если есть ещё
-        builder.row(
+    if has_next and users:
+        navigation.append(
             InlineKeyboardButton(
-                text="Вперёд ➡️", callback_data=f"admin_users_page_{page + 1}"
+                text="Вперёд ➡️",
+                callback_data=f"admin_users_page_{page + 1}_a{users[-1].id}",
             )
         )
+    if navigation:
+        builder.row(*navigation)
 
+    builder.row(
+        InlineKeyboardButton(text="🔍 Поиск", callback_data="admin_users_search")
+    )
     builder.row(InlineKeyboardButton(text="🔙 В меню", callback_data="admin_menu"))
 
     return builder
@@ -169,35 +196,88 @@ def get_plan_actions_keyboard(plan_id: int) -> InlineKeyboardBuilder:
 
 
 def get_subscriptions_list_keyboard(
-    subscriptions: list, page: int = 0
+    subscriptions: list,
+    flt: SubscriptionFilter,
+    servers: list,
+    page: int = 0,
+    has_prev: bool = False,
+    has_next: bool = False,
 ) -> InlineKeyboardBuilder:
-    """Клавиатура со списком подписок."""
-    builder = InlineKeyboardBuilder()
+    """
+    Клавиатура списка подписок: пагинация и фильтры.
 
-    for sub in subscriptions:
-        user_name = f"User {sub.user_id}"
-        if hasattr(sub, "user") and sub.user:
-            user_name = sub.user.full_name or "Unknown"
-        builder.row(
-            InlineKeyboardButton(
-                text=f"📋 {user_name} | {sub.email}",
-                callback_data=f"admin_subscription_{sub.id}",
-            )
-        )
+    Пагинация — admin_subs_page_{номер}_{b|a}{id}_{фильтр}, выбор фильтра —
+    admin_subs_f_{фильтр}; фильтр упакован SubscriptionFilter.pack().
+    """
+    builder = InlineKeyboardBuilder()
+    packed = flt.pack()
 
     # Пагинация
-    if page > 0:
-        builder.row(
+    navigation = []
+    if has_prev and subscriptions:
+        navigation.append(
             InlineKeyboardButton(
-                text="⬅️ Назад", callback_data=f"admin_subs_page_{page - 1}"
+                text="⬅️ Назад",
+                callback_data=f"admin_subs_page_{page - 1}_b{subscriptions[0].id}_{packed}",
             )
         )
-    if len(subscriptions) == 10:
-        builder.row(
+    if has_next and subscriptions:
+        navigation.append(
             InlineKeyboardButton(
-                text="Вперёд ➡️", callback_data=f"admin_subs_page_{page + 1}"
+                text="Вперёд ➡️",
+                callback_data=f"admin_subs_page_{page + 1}_a{subscriptions[-1].id}_{packed}",
             )
         )
+    if navigation:
+        builder.row(*navigation)
+
+    def option(text: str, selected: bool, **changes) -> InlineKeyboardButton:
+        return InlineKeyboardButton(
+            text=f"• {text}" if selected else text,
+            callback_data=f"admin_subs_f_{replace(flt, **changes).pack()}",
+        )
+
+    builder.row(
+        option("Все", flt.status is None, status=None),
+        option(
+            "✅",
+            flt.status == SubscriptionStatus.ACTIVE,
+            status=SubscriptionStatus.ACTIVE,
+        ),
+        option(
+            "⌛",
+            flt.status == SubscriptionStatus.EXPIRED,
+            status=SubscriptionStatus.EXPIRED,
+        ),
+        option(
+            "⏸",
+            flt.status == SubscriptionStatus.PENDING,
+            status=SubscriptionStatus.PENDING,
+        ),
+        option(
+            "🚫",
+            flt.status == SubscriptionStatus.BANNED,
+            status=SubscriptionStatus.BANNED,
+        ),
+    )
+    builder.row(
+        option("Любой срок", flt.expires_within_days is None, expires_within_days=None),
+        *(
+            option(
+                f"≤{days} дн.",
+                flt.expires_within_days == days,
+                expires_within_days=days,
+            )
+            for days in SUBSCRIPTION_EXPIRY_WINDOWS
+        ),
+    )
+    server_buttons = [option("Все серверы", flt.server_id is None, server_id=None)]
+    server_buttons += [
+        option(server.name, flt.server_id == server.id, server_id=server.id)
+        for server in servers
+    ]
+    for i in range(0, len(server_buttons), 3):
+        builder.row(*server_buttons[i : i + 3])
 
     builder.row(InlineKeyboardButton(text="🔙 В меню", callback_data="admin_menu"))
 
@@ -241,6 +321,27 @@ def get_cancel_keyboard() -> InlineKeyboardBuilder:
     return builder
 
 
+def get_broadcast_confirm_keyboard() -> InlineKeyboardBuilder:
+    """Клавиатура подтверждения рассылки."""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="✅ Отправить", callback_data="admin_broadcast_send"),
+        InlineKeyboardButton(text="❌ Отмена", callback_data="admin_cancel"),
+    )
+    return builder
+
+
+def get_broadcast_status_keyboard(broadcast_id: int) -> InlineKeyboardBuilder:
+    """Клавиатура статуса идущей рассылки."""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(
+            text="⛔ Остановить", callback_data=f"admin_broadcast_stop_{broadcast_id}"
+        )
+    )
+    return builder
+
+
 def get_select_server_keyboard(servers: list) -> InlineKeyboardBuilder:
     """Клавиатура выбора сервера."""
     builder = InlineKeyboardBuilder()
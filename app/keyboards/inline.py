@@ -2,122 +2,128 @@
 Inline-клавиатуры для бота.
 """
 
-from typing import List
+from typing import Dict, Optional, Tuple
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from app.database.models import Plan
+from app.database.catalogue import catalogue
+from app.database.models import Server
+
+# Индикаторы заполненности сервера: свободно, средне, почти заполнен
+FILL_INDICATORS = ("🟢", "🟡", "🔴")
+
+# Лимит клиентов, если у сервера он не задан
+DEFAULT_MAX_CLIENTS = 50
+
+# Сколько комбинаций заполненности серверов держать в кэше
+SERVERS_MARKUP_CACHE_SIZE = 64
+
+
+def _fill_bucket(sub_count: int, max_clients: Optional[int]) -> int:
+    """Индекс в FILL_INDICATORS по проценту заполненности сервера."""
+    max_clients = max_clients or DEFAULT_MAX_CLIENTS
+    fill_percent = (sub_count / max_clients) * 100 if max_clients > 0 else 0
+    if fill_percent >= 80:
+        return 2
+    if fill_percent >= 50:
+        return 1
+    return 0
+
+
+class _MarkupCache:
+    """Готовые клавиатуры покупки, действительные для одной версии каталога."""
+
+    def __init__(self) -> None:
+        self.version: Optional[int] = None
+        self.plans: Optional[InlineKeyboardMarkup] = None
+        # (server_id, корзина) -> кнопка
+        self.server_buttons: Dict[Tuple[int, int], InlineKeyboardButton] = {}
+        # ((server_id, корзина), ...) -> клавиатура
+        self.servers: Dict[Tuple[Tuple[int, int], ...], InlineKeyboardMarkup] = {}
+
+    def sync(self, version: int) -> None:
+        """Сбросить кэш, если каталог перечитан."""
+        if version != self.version:
+            self.version = version
+            self.plans = None
+            self.server_buttons.clear()
+            self.servers.clear()
+
+    def server_button(self, server: Server, bucket: int) -> InlineKeyboardButton:
+        key = (server.id, bucket)
+        button = self.server_buttons.get(key)
+        if button is None:
+            flag = catalogue.get_location_flag(server)
+            button = InlineKeyboardButton(
+                text=f"{flag} {server.name}  {FILL_INDICATORS[bucket]}",
+                callback_data=f"select_server_{server.id}",
+            )
+            self.server_buttons[key] = button
+        return button
+
 
+_markups = _MarkupCache()
 
-async def get_plans_keyboard(plans: List[Plan]) -> InlineKeyboardMarkup:
+
+async def get_plans_keyboard() -> InlineKeyboardMarkup:
     """
-    Клавиатура с тарифными планами.
+    Клавиатура с платными тарифными планами.
 
-    Args:
-        plans: Список тарифных планов
+    Собирается один раз на версию каталога.
 
     Returns:
         InlineKeyboardMarkup с кнопками тарифов
     """
-    keyboard = InlineKeyboardBuilder()
+    plans = await catalogue.get_paid_plans()
+    _markups.sync(catalogue.version)
 
-    for plan in plans:
-        if plan.price > 0:  # Не показывать trial планы
+    if _markups.plans is None:
+        keyboard = InlineKeyboardBuilder()
+        for plan in plans:
             keyboard.add(
                 InlineKeyboardButton(
                     text=f"{plan.name} - {plan.price} RUB",
                     callback_data=f"buy_plan_{plan.id}",
                 )
             )
+        _markups.plans = keyboard.adjust(1).as_markup()
 
-    return keyboard.adjust(1).as_markup()
+    return _markups.plans
 
 
-async def get_servers_keyboard(servers_with_stats: list) -> InlineKeyboardMarkup:
+async def get_servers_keyboard(sub_counts: Dict[int, int]) -> InlineKeyboardMarkup:
     """
     Клавиатура выбора сервера с индикаторами заполненности.
 
+    Кэшируется по версии каталога и корзине заполненности каждого сервера.
+
     Args:
-        servers_with_stats: Список кортежей (Server, sub_count)
+        sub_counts: Количество активных подписок по server_id
 
     Returns:
-        InlineKeyboardMarkup с кнопками серверов
+        InlineKeyboardMarkup с кнопками активных серверов
     """
-    keyboard = InlineKeyboardBuilder()
+    servers = sorted(await catalogue.get_active_servers(), key=lambda s: s.id)
+    _markups.sync(catalogue.version)
 
-    for server, sub_count in servers_with_stats:
-        # Вычисляем процент заполненности
-        max_clients = server.max_clients or 50  # Default 50 if not set
-        fill_percent = (sub_count / max_clients) * 100 if max_clients > 0 else 0
-
-        # Выбираем индикатор
-        if fill_percent >= 80:
-            indicator = "🔴"  # Красный - почти заполнен
-        elif fill_percent >= 50:
-            indicator = "🟡"  # Жёлтый - средняя заполненность
-        else:
-            indicator = "🟢"  # Зелёный - свободно
-
-        # Формируем текст кнопки
-        location_flag = _get_location_flag(server.location)
-        button_text = f"{location_flag} {server.name}  {indicator}"
-
-        keyboard.add(
-            InlineKeyboardButton(
-                text=button_text, callback_data=f"select_server_{server.id}"
-            )
+    key = tuple(
+        (server.id, _fill_bucket(sub_counts.get(server.id, 0), server.max_clients))
+        for server in servers
+    )
+    markup = _markups.servers.get(key)
+    if markup is None:
+        if len(_markups.servers) >= SERVERS_MARKUP_CACHE_SIZE:
+            _markups.servers.clear()
+        markup = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [_markups.server_button(server, bucket)]
+                for server, (_, bucket) in zip(servers, key)
+            ]
         )
+        _markups.servers[key] = markup
 
-    keyboard.adjust(1)
-    return keyboard.as_markup()
-
-
-def _get_location_flag(location: str) -> str:
-    """
-    Получить флаг страны по названию локации.
-
-    Args:
-        location: Название локации
-
-    Returns:
-        Эмодзи флага
-    """
-    flags = {
-        "germany": "🇩🇪",
-        "german": "🇩🇪",
-        "de": "🇩🇪",
-        "france": "🇫🇷",
-        "french": "🇫🇷",
-        "fr": "🇫🇷",
-        "netherlands": "🇳🇱",
-        "nl": "🇳🇱",
-        "usa": "🇺🇸",
-        "united states": "🇺🇸",
-        "uk": "🇬🇧",
-        "united kingdom": "🇬🇧",
-        "poland": "🇵🇱",
-        "pl": "🇵🇱",
-        "spain": "🇪🇸",
-        "es": "🇪🇸",
-        "italy": "🇮🇹",
-        "it": "🇮🇹",
-        "turkey": "🇹🇷",
-        "tr": "🇹🇷",
-        "russia": "🇷🇺",
-        "ru": "🇷🇺",
-        "kazakhstan": "🇰🇿",
-        "kz": "🇰🇿",
-        "ukraine": "🇺🇦",
-        "ua": "🇺🇦",
-    }
-
-    location_lower = location.lower()
-    for key, flag in flags.items():
-        if key in location_lower:
-            return flag
-
-    return "🌍"  # Default flag
+    return markup
 
 
 async def get_profile_keyboard() -> InlineKeyboardMarkup:
@@ -164,3 +170,20 @@ def get_referral_keyboard() -> InlineKeyboardBuilder:
         InlineKeyboardButton(text="👥 Пригласить друга", callback_data="ref_link")
     )
     return builder
+
+
+def get_renew_keyboard(plan_id: int) -> InlineKeyboardMarkup:
+    """
+    Кнопка продления из напоминания о сроке подписки.
+
+    Args:
+        plan_id: Тариф, который предлагается купить
+
+    Returns:
+        InlineKeyboardMarkup с кнопкой покупки тарифа
+    """
+    keyboard = InlineKeyboardBuilder()
+    keyboard.row(
+        InlineKeyboardButton(text="🔄 Продлить", callback_data=f"buy_plan_{plan_id}")
+    )
+    return keyboard.as_markup()
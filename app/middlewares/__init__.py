@@ -4,8 +4,10 @@
 
 from app.middlewares.clean_messages import CleanMessageMiddleware
 from app.middlewares.admin_auth import AdminAuthMiddleware
+from app.middlewares.db_session import DbSessionMiddleware
 
 __all__ = [
     "CleanMessageMiddleware",
     "AdminAuthMiddleware",
+    "DbSessionMiddleware",
 ]
@@ -35,7 +35,7 @@ class AdminAuthMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         # Проверяем, является ли пользователь администратором
-        admin = await rq.get_admin_by_tg_id(tg_id)
+        admin = await rq.get_admin_by_tg_id(tg_id, session=data.get("session"))
         logger.debug(f"Middleware: Admin lookup for {tg_id} returned {admin}")
 
         if not admin or not admin.is_active:
@@ -0,0 +1,61 @@
+"""
+Middleware для единой сессии БД на апдейт (unit of work).
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.models import async_session
+from app.database.unit_of_work import (
+    UNIT_OF_WORK,
+    commit_update,
+    current_session,
+    rollback_update,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Открывает одну AsyncSession на апдейт и передаёт её хендлерам как session.
+
+    Функции app.database.requests, получившие эту сессию, не коммитят сами:
+    изменения апдейта фиксируются одной транзакцией после хендлера и
+    откатываются, если хендлер упал (app.database.unit_of_work). Хранилище
+    FSM пишет смену состояния своей короткой транзакцией после транзакции
+    апдейта.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker = async_session):
+        """
+        Инициализация middleware.
+
+        Args:
+            session_pool: Фабрика сессий
+        """
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Соединение берётся из пула только при первом запросе к БД
+        async with self.session_pool(info={UNIT_OF_WORK: True}) as session:
+            data["session"] = session
+            token = current_session.set(session)
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await rollback_update(session)
+                raise
+            finally:
+                current_session.reset(token)
+            await commit_update(session)
+            return result
@@ -4,8 +4,11 @@
 
 from app.services.subscription import SubscriptionService
 from app.services.referral import ReferralService
+from app.services.reconcile import ReconcileReport, reconcile_all
 
 __all__ = [
     "SubscriptionService",
     "ReferralService",
+    "ReconcileReport",
+    "reconcile_all",
 ]
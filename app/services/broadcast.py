@@ -0,0 +1,334 @@
+"""
+Рассылка сообщений всем пользователям бота.
+
+Рассылку запускает админ-бот, а отправляет пользовательский бот
+(BOT_TOKEN): админ-боту пользователи не писали. tg_id читаются страницами
+по users.id (keyset), сообщения отправляют BROADCAST_WORKERS воркеров не
+чаще BROADCAST_RATE в секунду. Тем же токеном в это время пользуется
+процесс пользовательского бота, поэтому скорость рассылки берётся из его
+общего лимита: пользовательский бот раз в BROADCAST_LIMIT_INTERVAL секунд
+проверяет, идёт ли рассылка, и уменьшает свой лимит на BROADCAST_RATE
+(sync_send_limit), а рассылка начинает отправку не раньше, чем он это
+заметит.
+
+Прогресс раз в BROADCAST_STATUS_INTERVAL секунд сохраняется в таблицу
+broadcasts и выводится в статусное сообщение админа. Курсор last_user_id —
+последний пользователь, до которого включительно все отправки завершены:
+после перезапуска админ-бота рассылка продолжается с него.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from app.database import requests as rq
+from app.database.models import Broadcast, BroadcastStatus
+from app.keyboards.admin import get_broadcast_status_keyboard
+from app.utils.sender import TokenBucket, outbound
+
+logger = logging.getLogger(__name__)
+
+# Токен пользовательского бота, от имени которого идёт рассылка
+USER_BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# Сообщений рассылки в секунду
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "10"))
+# Одновременных отправок
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "5"))
+# Пользователей в одной странице выборки
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+# Период сохранения прогресса и обновления статуса (с)
+BROADCAST_STATUS_INTERVAL = float(os.getenv("BROADCAST_STATUS_INTERVAL", "5"))
+# Как часто пользовательский бот проверяет, идёт ли рассылка (с),
+# 0 — не уступать рассылке часть лимита
+BROADCAST_LIMIT_INTERVAL = float(os.getenv("BROADCAST_LIMIT_INTERVAL", "5"))
+
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+STATUS_TITLES = {
+    BroadcastStatus.RUNNING: "⏳ Идёт",
+    BroadcastStatus.DONE: "✅ Завершена",
+    BroadcastStatus.CANCELLED: "⛔ Остановлена",
+}
+
+
+def format_broadcast_status(
+    broadcast_id: int,
+    status: BroadcastStatus,
+    total: int,
+    counts: Dict[str, int],
+    paused: bool = False,
+) -> str:
+    """
+    Текст статусного сообщения рассылки.
+
+    Args:
+        broadcast_id: ID рассылки
+        status: Статус рассылки
+        total: Пользователей на момент запуска
+        counts: Счётчики delivered/blocked/failed
+        paused: Рассылка прервана остановкой бота и продолжится после запуска
+
+    Returns:
+        Текст в HTML
+    """
+    title = "⏸ Приостановлена до перезапуска" if paused else STATUS_TITLES[status]
+    processed = sum(counts.values())
+    return (
+        f"📣 <b>Рассылка #{broadcast_id}</b>\n\n"
+        f"Статус: {title}\n"
+        f"Обработано: {processed} из {total}\n\n"
+        f"✅ Доставлено: {counts[DELIVERED]}\n"
+        f"🚫 Заблокировали бота: {counts[BLOCKED]}\n"
+        f"⚠️ Ошибок: {counts[FAILED]}"
+    )
+
+
+class BroadcastRun:
+    """Выполнение одной рассылки."""
+
+    def __init__(
+        self, broadcast: Broadcast, sender: Bot, admin_bot: Bot, bucket: TokenBucket
+    ) -> None:
+        """
+        Инициализация.
+
+        Args:
+            broadcast: Рассылка (новая или продолжаемая)
+            sender: Пользовательский бот
+            admin_bot: Админ-бот для статусного сообщения
+            bucket: Общий лимит скорости рассылок
+        """
+        self.broadcast_id = broadcast.id
+        self.text = broadcast.text
+        self.total = broadcast.total
+        self.admin_chat_id = broadcast.admin_chat_id
+        self.status_message_id = broadcast.status_message_id
+        self.sender = sender
+        self.admin_bot = admin_bot
+        self.bucket = bucket
+        # True — остановлена админом, а не остановкой бота
+        self.cancelled = False
+
+        self.counts = {
+            DELIVERED: broadcast.delivered,
+            BLOCKED: broadcast.blocked,
+            FAILED: broadcast.failed,
+        }
+        self.watermark = broadcast.last_user_id
+        # id пользователей в порядке выборки, ещё не вошедшие в курсор
+        self._order: Deque[int] = deque()
+        # Итоги отправок, завершившихся раньше предыдущих по порядку
+        self._outcomes: Dict[int, str] = {}
+
+    async def _deliver(self, tg_id: int) -> str:
+        delay = self.bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self.sender.send_message(tg_id, self.text, parse_mode="HTML")
+            return DELIVERED
+        except TelegramForbiddenError:
+            # Бот заблокирован или аккаунт удалён
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                return BLOCKED
+            logger.warning(f"Рассылка #{self.broadcast_id}: {tg_id}: {e}")
+            return FAILED
+        except Exception as e:
+            logger.warning(f"Рассылка #{self.broadcast_id}: {tg_id}: {e}")
+            return FAILED
+
+    def _complete(self, user_id: int, outcome: str) -> None:
+        self._outcomes[user_id] = outcome
+        while self._order and self._order[0] in self._outcomes:
+            done_id = self._order.popleft()
+            self.counts[self._outcomes.pop(done_id)] += 1
+            self.watermark = done_id
+
+    async def _produce(self, queue: asyncio.Queue) -> None:
+        after_id = self.watermark
+        while True:
+            page = await rq.get_user_tg_ids_page(after_id, BROADCAST_PAGE_SIZE)
+            if not page:
+                break
+            for user_id, tg_id in page:
+                self._order.append(user_id)
+                await queue.put((user_id, tg_id))
+            after_id = page[-1][0]
+        for _ in range(BROADCAST_WORKERS):
+            await queue.put(None)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            user_id, tg_id = item
+            self._complete(user_id, await self._deliver(tg_id))
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(BROADCAST_STATUS_INTERVAL)
+            await self._checkpoint()
+            await self.show(BroadcastStatus.RUNNING)
+
+    async def _checkpoint(self, **values) -> None:
+        await rq.update_broadcast(
+            self.broadcast_id,
+            last_user_id=self.watermark,
+            delivered=self.counts[DELIVERED],
+            blocked=self.counts[BLOCKED],
+            failed=self.counts[FAILED],
+            **values,
+        )
+
+    async def show(self, status: BroadcastStatus, paused: bool = False) -> None:
+        """Обновить статусное сообщение админа."""
+        if self.status_message_id is None:
+            return
+        markup = (
+            get_broadcast_status_keyboard(self.broadcast_id).as_markup()
+            if status == BroadcastStatus.RUNNING and not paused
+            else None
+        )
+        try:
+            await self.admin_bot.edit_message_text(
+                format_broadcast_status(
+                    self.broadcast_id, status, self.total, self.counts, paused
+                ),
+                chat_id=self.admin_chat_id,
+                message_id=self.status_message_id,
+                reply_markup=markup,
+                parse_mode="HTML",
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e).lower():
+                logger.warning(f"Рассылка #{self.broadcast_id}: статус: {e}")
+        except Exception as e:
+            logger.warning(f"Рассылка #{self.broadcast_id}: статус: {e}")
+
+    async def run(self) -> None:
+        """Разослать сообщение всем пользователям после курсора."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_PAGE_SIZE)
+        reporter = asyncio.create_task(self._report())
+        status = BroadcastStatus.RUNNING
+        try:
+            # Пользовательский бот должен успеть уступить рассылке часть лимита
+            await asyncio.sleep(BROADCAST_LIMIT_INTERVAL)
+            await asyncio.gather(
+                self._produce(queue),
+                *(self._work(queue) for _ in range(BROADCAST_WORKERS)),
+            )
+            status = BroadcastStatus.DONE
+        except asyncio.CancelledError:
+            if not self.cancelled:
+                # Остановка бота: курсор сохраняется, рассылка продолжится
+                raise
+            status = BroadcastStatus.CANCELLED
+        finally:
+            reporter.cancel()
+            values = {}
+            if status != BroadcastStatus.RUNNING:
+                values = {"status": status, "finished_at": datetime.now()}
+            await self._checkpoint(**values)
+            await self.show(status, paused=status == BroadcastStatus.RUNNING)
+            logger.info(
+                f"Рассылка #{self.broadcast_id}: {status.value}, "
+                f"доставлено {self.counts[DELIVERED]}, "
+                f"заблокировали {self.counts[BLOCKED]}, ошибок {self.counts[FAILED]}"
+            )
+
+
+class BroadcastManager:
+    """Запущенные рассылки процесса админ-бота."""
+
+    def __init__(self) -> None:
+        self._runs: Dict[int, Tuple[BroadcastRun, asyncio.Task]] = {}
+        self._sender: Optional[Bot] = None
+        self._bucket = TokenBucket(BROADCAST_RATE, 1)
+
+    @property
+    def available(self) -> bool:
+        """Есть токен пользовательского бота."""
+        return bool(USER_BOT_TOKEN)
+
+    def is_running(self) -> bool:
+        """Идёт ли сейчас рассылка."""
+        return bool(self._runs)
+
+    def _get_sender(self) -> Bot:
+        if self._sender is None:
+            self._sender = Bot(token=USER_BOT_TOKEN)
+            self._sender.session.middleware(outbound)
+        return self._sender
+
+    def start(self, broadcast: Broadcast, admin_bot: Bot) -> None:
+        """
+        Запустить рассылку в фоне.
+
+        Args:
+            broadcast: Рассылка с заполненным status_message_id
+            admin_bot: Админ-бот для статусного сообщения
+        """
+        run = BroadcastRun(broadcast, self._get_sender(), admin_bot, self._bucket)
+        # Пустой контекст: задача переживает апдейт и не должна видеть его сессию
+        task = asyncio.create_task(
+            run.run(), name=f"broadcast-{broadcast.id}", context=contextvars.Context()
+        )
+        self._runs[broadcast.id] = (run, task)
+        task.add_done_callback(lambda _: self._runs.pop(broadcast.id, None))
+        logger.info(f"Рассылка #{broadcast.id} запущена с id > {run.watermark}")
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """
+        Остановить рассылку по команде админа.
+
+        Returns:
+            False, если рассылка не выполняется
+        """
+        entry = self._runs.get(broadcast_id)
+        if entry is None:
+            return False
+        run, task = entry
+        run.cancelled = True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def resume(self, admin_bot: Bot) -> None:
+        """Продолжить рассылки, прерванные остановкой бота."""
+        if not self.available:
+            return
+        for broadcast in await rq.get_running_broadcasts():
+            if broadcast.id not in self._runs:
+                self.start(broadcast, admin_bot)
+
+    async def close(self) -> None:
+        """Прервать рассылки с сохранением курсора (при остановке бота)."""
+        tasks = [task for _, task in self._runs.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._sender is not None:
+            await self._sender.session.close()
+            self._sender = None
+
+
+broadcasts = BroadcastManager()
+
+
+async def sync_send_limit() -> None:
+    """Уступить идущей рассылке BROADCAST_RATE из лимита пользовательского бота."""
+    running = await rq.has_running_broadcast()
+    outbound.reserve_global_rate(BROADCAST_RATE if running else 0.0)
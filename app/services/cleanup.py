@@ -0,0 +1,245 @@
+"""
+Удаление клиентов подписок с панелей 3x-ui.
+
+Подписки группируются по серверу: на каждый сервер берётся один клиент
+из client_pool, серверы обрабатываются параллельно (не более
+CLEANUP_CONCURRENCY одновременно). Внутри сервера удаления идут
+последовательно — панель перезаписывает settings inbound'а целиком.
+
+Если панель не подтвердила удаление, список клиентов сервера читается
+один раз: клиента, которого там уже нет, считаем удалённым. Удалять
+подписку из БД можно только после успешного удаления или подтверждённого
+отсутствия клиента, иначе он останется на панели без записи в БД.
+
+Для полной очистки сервера (purge_server_clients) клиенты удаляются не по
+одному: список клиентов inbound'а пересобирается без удаляемых и
+записывается одним запросом.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Set
+
+from app.api.pool import client_pool
+from app.api.three_x_ui import ThreeXUIClient
+from app.database.models import Server, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Сколько серверов обрабатывается одновременно
+CLEANUP_CONCURRENCY = int(os.getenv("CLEANUP_CONCURRENCY", "4"))
+
+
+@dataclass
+class PanelRemoval:
+    """Итоги удаления клиентов с панелей."""
+
+    # id подписок, клиент которых удалён панелью
+    removed: List[int] = field(default_factory=list)
+    # id подписок, клиента которых на панели уже не было
+    absent: List[int] = field(default_factory=list)
+    # Подписки, клиент которых мог остаться на панели
+    failed: List[Subscription] = field(default_factory=list)
+
+    @property
+    def done_ids(self) -> List[int]:
+        """id подписок, которые можно удалить из БД."""
+        return self.removed + self.absent
+
+    def failed_servers(self) -> List[str]:
+        """Названия серверов с неудалёнными клиентами."""
+        names = {
+            sub.server.name if sub.server else f"#{sub.server_id}"
+            for sub in self.failed
+        }
+        return sorted(names)
+
+
+def _inbound_settings(inbound: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(inbound.get("settings") or "{}")
+    except (TypeError, ValueError):
+        return None
+
+
+async def _panel_client_ids(client: ThreeXUIClient) -> Optional[Set[str]]:
+    """uuid всех клиентов панели или None, если список не получен."""
+    resp = await client.get_inbounds()
+    if not resp.get("success"):
+        return None
+    ids: Set[str] = set()
+    for inbound in resp.get("obj") or []:
+        settings = _inbound_settings(inbound)
+        if settings is None:
+            # Не разобрали inbound — отсутствие клиентов не подтверждено
+            return None
+        ids.update(c.get("id") for c in settings.get("clients") or [])
+    return ids
+
+
+async def _remove_on_server(
+    server: Server, subscriptions: List[Subscription], report: PanelRemoval
+) -> None:
+    client = await client_pool.acquire(server)
+    if not client:
+        logger.error(f"Удаление клиентов: нет подключения к {server.name}")
+        report.failed.extend(subscriptions)
+        return
+
+    unconfirmed = []
+    for sub in subscriptions:
+        if await client.delete_client(sub.inbound_id, sub.uuid):
+            report.removed.append(sub.id)
+        else:
+            unconfirmed.append(sub)
+
+    if not unconfirmed:
+        return
+    present = await _panel_client_ids(client)
+    for sub in unconfirmed:
+        if present is not None and sub.uuid not in present:
+            report.absent.append(sub.id)
+        else:
+            report.failed.append(sub)
+
+
+async def remove_panel_clients(
+    subscriptions: Iterable[Subscription],
+    concurrency: int = CLEANUP_CONCURRENCY,
+) -> PanelRemoval:
+    """
+    Удалить клиентов подписок с их панелей.
+
+    Args:
+        subscriptions: Подписки с подгруженным server
+        concurrency: Сколько серверов обрабатывать одновременно
+
+    Returns:
+        PanelRemoval: какие подписки можно удалять из БД, а какие нет
+    """
+    report = PanelRemoval()
+    by_server: Dict[int, List[Subscription]] = defaultdict(list)
+    for sub in subscriptions:
+        if sub.server is None:
+            # Сервер удалён из БД — клиента больше негде искать
+            report.absent.append(sub.id)
+        else:
+            by_server[sub.server_id].append(sub)
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _run(subs: List[Subscription]) -> None:
+        server = subs[0].server
+        async with semaphore:
+            try:
+                await _remove_on_server(server, subs, report)
+            except Exception as e:
+                logger.error(f"Удаление клиентов на {server.name} прервано: {e}")
+                handled = set(report.done_ids) | {sub.id for sub in report.failed}
+                report.failed.extend(sub for sub in subs if sub.id not in handled)
+
+    await asyncio.gather(*(_run(subs) for subs in by_server.values()))
+
+    logger.info(
+        f"Удаление клиентов: удалено {len(report.removed)}, "
+        f"отсутствовали {len(report.absent)}, ошибок {len(report.failed)}"
+    )
+    return report
+
+
+@dataclass
+class PurgeReport:
+    """Итоги массового удаления клиентов."""
+
+    removed: int = 0
+    absent: int = 0
+    failed: int = 0
+
+    def __iadd__(self, other: "PurgeReport") -> "PurgeReport":
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+        return self
+
+    @property
+    def processed(self) -> int:
+        """Сколько клиентов обработано."""
+        return self.removed + self.absent + self.failed
+
+
+async def purge_server_clients(
+    server: Server,
+    uuids: Collection[str],
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> PurgeReport:
+    """
+    Удалить с панели сервера всех клиентов из uuids.
+
+    Список inbound'ов читается один раз. Клиенты каждого inbound'а
+    удаляются одним update_inbound с пересобранным списком; если панель
+    его не приняла, клиенты этого inbound'а удаляются по одному.
+
+    Args:
+        server: Сервер 3x-ui
+        uuids: uuid клиентов к удалению
+        on_progress: Вызывается с числом клиентов, обработанных за шаг
+
+    Returns:
+        PurgeReport по серверу
+    """
+    report = PurgeReport()
+    progress = on_progress or (lambda _: None)
+
+    client = await client_pool.acquire(server)
+    resp = await client.get_inbounds() if client else {}
+    if not resp.get("success"):
+        logger.error(f"Очистка {server.name}: не удалось получить inbounds")
+        report.failed = len(uuids)
+        progress(report.failed)
+        return report
+
+    pending = set(uuids)
+    unparsed = False
+    for inbound in resp.get("obj") or []:
+        settings = _inbound_settings(inbound)
+        if settings is None:
+            unparsed = True
+            continue
+        clients = settings.get("clients") or []
+        drop = [c["id"] for c in clients if c.get("id") in pending]
+        if not drop:
+            continue
+        pending.difference_update(drop)
+
+        dropped = set(drop)
+        settings["clients"] = [c for c in clients if c.get("id") not in dropped]
+        rebuilt = {**inbound, "settings": json.dumps(settings)}
+        if await client.update_inbound(rebuilt):
+            report.removed += len(drop)
+        else:
+            logger.warning(
+                f"Очистка {server.name}: inbound {inbound['id']} не обновлён, "
+                f"удаляю {len(drop)} клиентов по одному"
+            )
+            for client_uuid in drop:
+                if await client.delete_client(inbound["id"], client_uuid):
+                    report.removed += 1
+                else:
+                    report.failed += 1
+        progress(len(drop))
+
+    # Не найденные на панели: отсутствуют, если все inbound'ы разобраны
+    if unparsed:
+        report.failed += len(pending)
+    else:
+        report.absent += len(pending)
+    progress(len(pending))
+
+    logger.info(
+        f"Очистка {server.name}: удалено {report.removed}, "
+        f"отсутствовали {report.absent}, ошибок {report.failed}"
+    )
+    return report
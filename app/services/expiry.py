@@ -0,0 +1,166 @@
+"""
+Перевод истёкших подписок в EXPIRED.
+
+Фоновая задача пользовательского бота раз в EXPIRY_INTERVAL секунд
+выбирает активные подписки с expires_at <= now пачками по
+EXPIRY_BATCH_SIZE (диапазон по индексу ix_subscriptions_status_expires),
+меняет им статус одним UPDATE ... WHERE id IN (...) и отключает клиентов
+на панелях: по одному запросу списка inbound'ов на сервер, серверы
+параллельно (не более EXPIRY_CONCURRENCY одновременно). Клиентов, которых
+отключить не удалось, позже отключит сверка (app.services.reconcile).
+
+Водяной знак — expires_at последней обработанной подписки: следующий
+запуск просматривает только срок от него и дальше. Граница включительная,
+поэтому подписки с тем же сроком не теряются, а уже обработанные
+отсекает условие на статус. После перезапуска бота первый проход
+просматривает весь диапазон.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.api.pool import client_pool
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.services.placement import server_load
+from app.services.reconcile import panel_clients
+
+logger = logging.getLogger(__name__)
+
+# Период проверки истёкших подписок (с), 0 — отключить
+EXPIRY_INTERVAL = float(os.getenv("EXPIRY_INTERVAL", "60"))
+# Подписок в одной пачке
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+# Сколько серверов обрабатывается одновременно
+EXPIRY_CONCURRENCY = int(os.getenv("EXPIRY_CONCURRENCY", "4"))
+
+
+@dataclass
+class ExpiredClient:
+    """Клиент панели, которого нужно отключить."""
+
+    subscription_id: int
+    server_id: int
+    uuid: str
+
+
+async def _disable_on_server(server_id: int, clients: List[ExpiredClient]) -> int:
+    """
+    Отключить клиентов одного сервера.
+
+    Returns:
+        Количество клиентов, отключить которых не удалось
+    """
+    server = await catalogue.get_server(server_id)
+    if server is None:
+        return 0
+    client = await client_pool.acquire(server)
+    resp = await client.get_inbounds() if client else {}
+    if not resp.get("success"):
+        logger.error(f"Истечение: нет списка клиентов {server.name}")
+        return len(clients)
+
+    panel: Dict[str, tuple] = {}
+    for inbound in resp.get("obj") or []:
+        for panel_client in panel_clients(inbound):
+            panel[panel_client.get("id")] = (inbound["id"], panel_client)
+
+    failed = 0
+    # Последовательно: панель перезаписывает settings inbound'а целиком
+    for expired in clients:
+        entry = panel.get(expired.uuid)
+        if entry is None or not entry[1].get("enable", True):
+            continue
+        inbound_id, panel_client = entry
+        if not await client.update_client_data(
+            inbound_id, {**panel_client, "enable": False}
+        ):
+            failed += 1
+    return failed
+
+
+async def disable_panel_clients(
+    clients: List[ExpiredClient], concurrency: int = EXPIRY_CONCURRENCY
+) -> int:
+    """
+    Отключить клиентов на панелях, сгруппировав их по серверам.
+
+    Returns:
+        Количество клиентов, отключить которых не удалось
+    """
+    by_server: Dict[int, List[ExpiredClient]] = defaultdict(list)
+    for expired in clients:
+        by_server[expired.server_id].append(expired)
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _run(server_id: int, server_clients: List[ExpiredClient]) -> int:
+        async with semaphore:
+            try:
+                return await _disable_on_server(server_id, server_clients)
+            except Exception as e:
+                logger.error(f"Истечение: сервер {server_id}: {e}")
+                return len(server_clients)
+
+    results = await asyncio.gather(
+        *(_run(server_id, items) for server_id, items in by_server.items())
+    )
+    return sum(results)
+
+
+class ExpiryReaper:
+    """Периодический перевод истёкших подписок в EXPIRED."""
+
+    def __init__(self, batch_size: int = EXPIRY_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        # expires_at последней обработанной подписки
+        self.watermark: Optional[datetime] = None
+
+    async def run(self) -> int:
+        """
+        Обработать подписки, истёкшие с прошлого запуска.
+
+        Returns:
+            Количество подписок, переведённых в EXPIRED
+        """
+        now = datetime.now()
+        expired_total = 0
+        panel_failed = 0
+        while True:
+            rows = await rq.get_expired_active_subscriptions(
+                now, self.watermark, self.batch_size
+            )
+            if not rows:
+                break
+
+            expired_ids = set(
+                await rq.expire_subscriptions([row.id for row in rows], now)
+            )
+            clients = [
+                ExpiredClient(row.id, row.server_id, row.uuid)
+                for row in rows
+                if row.id in expired_ids
+            ]
+            for expired in clients:
+                server_load.release(expired.server_id)
+            panel_failed += await disable_panel_clients(clients)
+            expired_total += len(clients)
+            self.watermark = rows[-1].expires_at
+
+            if len(rows) < self.batch_size:
+                break
+
+        if expired_total:
+            logger.info(
+                f"Истекло подписок: {expired_total}, "
+                f"не отключено на панелях: {panel_failed}"
+            )
+        return expired_total
+
+
+expiry_reaper = ExpiryReaper()
@@ -0,0 +1,188 @@
+"""
+Payload счёта Telegram и проверка заказа перед списанием.
+
+Payload — компактная подписанная строка
+v2:{тариф}:{сервер}:{tg_id}:{баланс в копейках}:{версия каталога}:{подпись}.
+Подпись — усечённый HMAC-SHA256 от остальных полей на INVOICE_SECRET,
+поэтому подменить тариф, сервер или списание с баланса нельзя. Версия каталога (тарифы и серверы) показывает, менялись ли
+они после выставления счёта. Старый формат vpn_payment:{тариф}:{tg_id}:{баланс}
+без сервера и подписи по-прежнему разбирается: такие счета уже выставлены.
+
+pre_checkout_query проверяет заказ только по данным в памяти (каталог,
+таблица нагрузки и здоровья серверов) и одному запросу баланса, не
+обращаясь к панелям, чтобы ответить задолго до 10 секунд Telegram.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.services.placement import server_load
+
+logger = logging.getLogger(__name__)
+
+# Ключ подписи payload; обязателен, с пустым ключом подпись подделывается
+INVOICE_SECRET = os.getenv("INVOICE_SECRET", "")
+if not INVOICE_SECRET:
+    raise RuntimeError("Не задан INVOICE_SECRET: ключ подписи счетов")
+# Сколько ждать проверки заказа до отказа (с), Telegram даёт 10 с
+PRE_CHECKOUT_TIMEOUT = float(os.getenv("PRE_CHECKOUT_TIMEOUT", "5"))
+
+PAYLOAD_VERSION = "v2"
+LEGACY_PREFIX = "vpn_payment"
+# Байт HMAC в подписи (16 символов base64)
+SIGNATURE_BYTES = 12
+
+
+@dataclass(frozen=True)
+class InvoicePayload:
+    """Данные заказа из payload счёта."""
+
+    plan_id: int
+    tg_id: int
+    balance_used: Decimal
+    # None — счёт старого формата, без сервера и версии
+    server_id: Optional[int] = None
+    catalogue_version: Optional[int] = None
+
+
+def _sign(body: str) -> str:
+    digest = hmac.new(INVOICE_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode()
+
+
+def build_invoice_payload(
+    plan_id: int,
+    server_id: int,
+    tg_id: int,
+    balance_used: Decimal,
+    catalogue_version: int,
+) -> str:
+    """
+    Собрать подписанный payload счёта.
+
+    Args:
+        plan_id: ID тарифа
+        server_id: ID выбранного сервера
+        tg_id: Telegram ID покупателя
+        balance_used: Сколько списать с баланса при оплате
+        catalogue_version: Версия каталога на момент выставления счёта
+
+    Returns:
+        Строка до 128 байт
+    """
+    kopecks = int(Decimal(balance_used) * 100)
+    body = (
+        f"{PAYLOAD_VERSION}:{plan_id}:{server_id}:{tg_id}:{kopecks}:{catalogue_version}"
+    )
+    return f"{body}:{_sign(body)}"
+
+
+def parse_invoice_payload(payload: str) -> Optional[InvoicePayload]:
+    """
+    Разобрать payload счёта нового или старого формата.
+
+    Returns:
+        InvoicePayload или None, если формат неизвестен или подпись неверна
+    """
+    parts = payload.split(":")
+    try:
+        if parts[0] == PAYLOAD_VERSION and len(parts) == 7:
+            body, signature = payload.rsplit(":", 1)
+            if not hmac.compare_digest(signature, _sign(body)):
+                logger.warning(f"Неверная подпись payload счёта: {payload}")
+                return None
+            _, plan_id, server_id, tg_id, kopecks, version, _ = parts
+            return InvoicePayload(
+                plan_id=int(plan_id),
+                tg_id=int(tg_id),
+                balance_used=Decimal(int(kopecks)) / 100,
+                server_id=int(server_id),
+                catalogue_version=int(version),
+            )
+        if parts[0] == LEGACY_PREFIX and len(parts) in (3, 4):
+            return InvoicePayload(
+                plan_id=int(parts[1]),
+                tg_id=int(parts[2]),
+                balance_used=Decimal(parts[3]) if len(parts) > 3 else Decimal(0),
+            )
+    except (ValueError, InvalidOperation):
+        pass
+    logger.warning(f"Неизвестный payload счёта: {payload}")
+    return None
+
+
+async def _check_order(
+    invoice: Optional[InvoicePayload],
+    tg_id: int,
+    total_amount: int,
+    session: Optional[AsyncSession] = None,
+) -> Optional[str]:
+    if invoice is None or invoice.tg_id != tg_id:
+        return "Счёт не распознан. Оформите покупку заново."
+
+    plan = await catalogue.get_plan(invoice.plan_id)
+    if plan is None or plan.price <= 0:
+        return "Тариф больше не продаётся. Выберите другой."
+    # При той же версии каталога цена не менялась с выставления счёта
+    if (
+        invoice.catalogue_version != catalogue.version
+        and int((plan.price - invoice.balance_used) * 100) != total_amount
+    ):
+        return "Цена тарифа изменилась. Оформите покупку заново."
+
+    if invoice.balance_used > 0:
+        user = await rq.select_user(tg_id, session=session)
+        if user is None or user.balance < invoice.balance_used:
+            return "Баланс изменился. Оформите покупку заново."
+
+    await server_load.refresh()
+    if invoice.server_id is None:
+        if await server_load.choose() is None:
+            return "Свободных серверов сейчас нет. Попробуйте позже."
+        return None
+    server = await catalogue.get_server(invoice.server_id)
+    if server is not None and server.is_active and not server_load.has_capacity(server):
+        return f"Сервер {server.name} заполнен. Выберите другой сервер."
+    if server is None or not server_load.accepts(server):
+        name = server.name if server else "выбранный"
+        return f"Сервер {name} сейчас недоступен. Выберите другой сервер."
+    return None
+
+
+async def check_invoice(
+    invoice: Optional[InvoicePayload],
+    tg_id: int,
+    total_amount: int,
+    session: Optional[AsyncSession] = None,
+) -> Optional[str]:
+    """
+    Проверить заказ перед списанием денег.
+
+    Args:
+        invoice: Разобранный payload (None — не разобран)
+        tg_id: Telegram ID плательщика
+        total_amount: Сумма счёта в копейках
+        session: Сессия БД апдейта (опционально)
+
+    Returns:
+        Текст отказа для пользователя или None, если заказ можно оплатить
+    """
+    try:
+        return await asyncio.wait_for(
+            _check_order(invoice, tg_id, total_amount, session),
+            PRE_CHECKOUT_TIMEOUT,
+        )
+    except TimeoutError:
+        logger.error(f"Проверка заказа {tg_id} не уложилась в {PRE_CHECKOUT_TIMEOUT} с")
+        return "Не удалось проверить заказ. Попробуйте ещё раз."
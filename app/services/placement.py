@@ -0,0 +1,183 @@
+"""
+Выбор сервера для новых подписок по нагрузке.
+
+Пробные и оплаченные ключи выдаются на наименее заполненный включённый
+сервер: заполненность — активные подписки к max_clients (у серверов без
+лимита — к DEFAULT_MAX_CLIENTS, как в индикаторах выбора сервера).
+Серверы, где подписок уже max_clients, не выбираются. При равной
+заполненности выигрывает сервер, где меньше клиентов онлайн (если включён
+опрос панелей, PLACEMENT_ONLINE_INTERVAL), затем меньший id.
+
+Таблица нагрузки живёт в памяти процесса и меняется на месте: выбор
+сервера резервирует место, неудачная выдача его освобождает, замена
+подписки освобождает место старой, истечение — места истёкших. Подписки,
+выданные и удалённые в админ-боте и других воркерах webhook, подхватывает
+сверка с БД — одна агрегирующая выборка не чаще раза в
+PLACEMENT_SYNC_INTERVAL секунд.
+
+Здоровье панелей тоже берётся из памяти: неудачная выдача ключа или опрос
+онлайна помечают сервер недоступным на PLACEMENT_HEALTH_TTL секунд,
+удачные — снимают отметку. Пока есть доступные серверы, недоступные не
+выбираются.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from app.api.pool import client_pool
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.models import Server
+from app.keyboards.inline import DEFAULT_MAX_CLIENTS
+
+logger = logging.getLogger(__name__)
+
+# Как часто сверять таблицу нагрузки с БД (с)
+PLACEMENT_SYNC_INTERVAL = float(os.getenv("PLACEMENT_SYNC_INTERVAL", "60"))
+# Период опроса панелей о клиентах онлайн (с), 0 — не опрашивать
+PLACEMENT_ONLINE_INTERVAL = float(os.getenv("PLACEMENT_ONLINE_INTERVAL", "0"))
+# Сколько сервер считается недоступным после ошибки панели (с)
+PLACEMENT_HEALTH_TTL = float(os.getenv("PLACEMENT_HEALTH_TTL", "120"))
+
+
+class ServerLoad:
+    """Активные подписки по серверам и выбор наименее загруженного."""
+
+    def __init__(self, sync_interval: float = PLACEMENT_SYNC_INTERVAL) -> None:
+        self.sync_interval = sync_interval
+        # server_id -> активные подписки (с резервами этого процесса)
+        self._counts: Dict[int, int] = {}
+        # server_id -> клиенты онлайн по последнему опросу панели
+        self._online: Dict[int, int] = {}
+        # server_id -> время последней ошибки панели (monotonic)
+        self._failed_at: Dict[int, float] = {}
+        self._synced_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._synced_at is not None
+            and time.monotonic() - self._synced_at < self.sync_interval
+        )
+
+    async def refresh(self) -> None:
+        """Перечитать счётчики из БД, если с прошлой сверки прошло sync_interval."""
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            self._counts = await rq.get_server_subscription_counts()
+            self._synced_at = time.monotonic()
+
+    async def get_counts(self) -> Dict[int, int]:
+        """Активные подписки по server_id."""
+        await self.refresh()
+        return dict(self._counts)
+
+    def load(self, server_id: int) -> int:
+        """Активные подписки сервера по таблице."""
+        return self._counts.get(server_id, 0)
+
+    def has_capacity(self, server: Server) -> bool:
+        """Есть ли на сервере место под новую подписку."""
+        return not server.max_clients or self.load(server.id) < server.max_clients
+
+    def is_healthy(self, server_id: int) -> bool:
+        """Не было ли ошибок панели сервера за последние PLACEMENT_HEALTH_TTL секунд."""
+        failed_at = self._failed_at.get(server_id)
+        return failed_at is None or time.monotonic() - failed_at >= PLACEMENT_HEALTH_TTL
+
+    def mark_failed(self, server_id: int) -> None:
+        """Отметить ошибку панели сервера."""
+        self._failed_at[server_id] = time.monotonic()
+
+    def mark_ok(self, server_id: int) -> None:
+        """Снять отметку об ошибке после удачного запроса к панели."""
+        self._failed_at.pop(server_id, None)
+
+    def accepts(self, server: Server) -> bool:
+        """Можно ли выдать на сервер подписку: включён, есть место, панель доступна."""
+        return (
+            server.is_active
+            and self.has_capacity(server)
+            and self.is_healthy(server.id)
+        )
+
+    def _rank(self, server: Server) -> tuple:
+        capacity = server.max_clients or DEFAULT_MAX_CLIENTS
+        return (
+            self.load(server.id) / capacity,
+            self._online.get(server.id, 0),
+            server.id,
+        )
+
+    def reserve(self, server_id: int, count: int = 1) -> None:
+        """Учесть новые подписки на сервере."""
+        self._counts[server_id] = self.load(server_id) + count
+
+    def release(self, server_id: Optional[int], count: int = 1) -> None:
+        """Освободить места подписок, которые больше не активны."""
+        if server_id is not None:
+            self._counts[server_id] = max(self.load(server_id) - count, 0)
+
+    async def choose(self) -> Optional[Server]:
+        """
+        Наименее загруженный включённый сервер со свободным местом.
+
+        Returns:
+            Сервер или None, если свободных нет
+        """
+        await self.refresh()
+        candidates = [
+            server
+            for server in await catalogue.get_active_servers()
+            if self.has_capacity(server)
+        ]
+        if not candidates:
+            logger.warning("Размещение: нет включённых серверов со свободным местом")
+            return None
+        healthy = [server for server in candidates if self.is_healthy(server.id)]
+        return min(healthy or candidates, key=self._rank)
+
+    async def place(self) -> Optional[Server]:
+        """
+        Выбрать сервер для новой подписки и зарезервировать на нём место.
+
+        Если выдать подписку не удалось, место нужно вернуть через release.
+
+        Returns:
+            Наименее загруженный сервер со свободным местом или None
+        """
+        server = await self.choose()
+        if server:
+            self.reserve(server.id)
+        return server
+
+    async def poll_online(self) -> None:
+        """Обновить число клиентов онлайн по всем включённым серверам."""
+
+        async def _online(server: Server) -> Optional[int]:
+            client = await client_pool.acquire(server)
+            emails = await client.get_online_clients() if client else None
+            return len(emails) if emails is not None else None
+
+        servers = await catalogue.get_active_servers()
+        results = await asyncio.gather(
+            *(_online(server) for server in servers), return_exceptions=True
+        )
+        online = {}
+        for server, result in zip(servers, results):
+            if isinstance(result, int):
+                online[server.id] = result
+                self.mark_ok(server.id)
+            else:
+                self.mark_failed(server.id)
+                logger.debug(f"Размещение: нет данных онлайн с {server.name}")
+        self._online = online
+
+
+server_load = ServerLoad()
@@ -0,0 +1,395 @@
+"""
+Сверка подписок из БД с клиентами на панелях 3x-ui.
+
+Список клиентов забирается один раз на сервер (вместе со статистикой
+трафика), сравнивается с таблицей subscriptions, и на панель уходят
+только расхождения: срок, лимит трафика, флаг enable и отсутствующие
+клиенты. Клиенты панели без подписки в БД считаются осиротевшими.
+
+Выдача ключа с заменой меняет клиента на панели и строку подписки не
+одновременно, поэтому перед созданием и удалением клиентов подписки
+перечитываются: uuid, который за время сверки перестал принадлежать
+активной подписке сервера, не создаётся, а клиент, у которого появилась
+подписка, не считается осиротевшим. Так же перед отправкой обновлений
+перечитываются их строки: продление или смена тарифа за время сверки
+меняют срок и лимит, и патч по старой выборке откатил бы их на панели.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.api.pool import client_pool
+from app.api.three_x_ui import ClientSpec, ThreeXUIClient
+from app.database.models import (
+    Plan,
+    Server,
+    Subscription,
+    SubscriptionStatus,
+    async_session,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько серверов сверяется одновременно
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+
+# Период фоновой сверки в боте (с), 0 — отключить
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "3600"))
+
+# Подписки, созданные администратором вручную: лимит трафика задан при
+# выдаче и в тарифе не хранится, поэтому totalGB у них не сверяем
+CUSTOM_EMAIL_PREFIXES = ("admin_", "gift_")
+
+GB = 1024 * 1024 * 1024
+
+# Допустимое расхождение срока действия (мс)
+EXPIRY_TOLERANCE_MS = 1000
+
+# uuid в одной выборке перепроверки
+RECHECK_CHUNK = 500
+
+
+@dataclass
+class ReconcileReport:
+    """Итоги сверки."""
+
+    in_sync: int = 0
+    updated: int = 0
+    created: int = 0
+    orphaned: int = 0
+    deleted: int = 0
+    failed: int = 0
+    servers_failed: int = 0
+
+    def __iadd__(self, other: "ReconcileReport") -> "ReconcileReport":
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+        return self
+
+    def summary(self) -> str:
+        """Краткая строка для логов и CLI."""
+        return (
+            f"в синхроне: {self.in_sync}, обновлено: {self.updated}, "
+            f"создано: {self.created}, осиротевших: {self.orphaned} "
+            f"(удалено: {self.deleted}), ошибок: {self.failed}, "
+            f"недоступных серверов: {self.servers_failed}"
+        )
+
+
+def _expiry_ms(expires_at: datetime) -> int:
+    return int(expires_at.timestamp() * 1000)
+
+
+def panel_clients(inbound: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Клиенты из settings inbound'а (пустой список, если не разобрать)."""
+    try:
+        settings = json.loads(inbound.get("settings") or "{}")
+    except (TypeError, ValueError):
+        return []
+    return settings.get("clients") or []
+
+
+def _is_depleted(stats: Optional[Dict[str, Any]]) -> bool:
+    """Трафик клиента исчерпан — панель отключила его сама."""
+    if not stats:
+        return False
+    total = stats.get("total") or 0
+    used = (stats.get("up") or 0) + (stats.get("down") or 0)
+    return total > 0 and used >= total
+
+
+def _desired_patch(
+    row: Any, panel: Dict[str, Any], stats: Optional[Dict[str, Any]], now: datetime
+) -> Dict[str, Any]:
+    """
+    Поля клиента панели, которые расходятся с подпиской.
+
+    Args:
+        row: Строка подписки (uuid, email, status, expires_at, data_limit_gb)
+        panel: Клиент из settings inbound'а
+        stats: Запись clientStats для клиента
+        now: Момент сверки
+
+    Returns:
+        Словарь полей для обновления (пустой, если всё совпадает)
+    """
+    patch: Dict[str, Any] = {}
+
+    expiry = _expiry_ms(row.expires_at)
+    if abs((panel.get("expiryTime") or 0) - expiry) > EXPIRY_TOLERANCE_MS:
+        patch["expiryTime"] = expiry
+
+    if not row.email.startswith(CUSTOM_EMAIL_PREFIXES):
+        total = int((row.data_limit_gb or 0) * GB)
+        if (panel.get("totalGB") or 0) != total:
+            patch["totalGB"] = total
+
+    # Истёкший или отключённый по трафику клиент не включаем обратно
+    enable = row.status == SubscriptionStatus.ACTIVE and row.expires_at > now
+    if enable and not panel.get("enable", True) and _is_depleted(stats):
+        enable = False
+    if bool(panel.get("enable", True)) != enable:
+        patch["enable"] = enable
+
+    return patch
+
+
+def _subscriptions_query():
+    return select(
+        Subscription.uuid,
+        Subscription.email,
+        Subscription.server_id,
+        Subscription.inbound_id,
+        Subscription.status,
+        Subscription.expires_at,
+        Plan.data_limit_gb,
+    ).outerjoin(Plan, Plan.id == Subscription.plan_id)
+
+
+async def _load_subscriptions(server_id: int) -> List[Any]:
+    async with async_session() as session:
+        result = await session.execute(
+            _subscriptions_query().where(Subscription.server_id == server_id)
+        )
+        return result.all()
+
+
+async def _recheck_updates(server_id: int, rows: Dict[str, Any]) -> Set[str]:
+    """
+    Перечитать подписки, клиентов которых сверка собирается обновить.
+
+    Args:
+        server_id: ID сервера
+        rows: uuid -> строка подписки, по которой посчитан патч
+
+    Returns:
+        uuid, строки которых не изменились с начала сверки
+    """
+    uuids = list(rows)
+    unchanged: Set[str] = set()
+    async with async_session() as session:
+        for start in range(0, len(uuids), RECHECK_CHUNK):
+            result = await session.execute(
+                _subscriptions_query().where(
+                    Subscription.uuid.in_(uuids[start : start + RECHECK_CHUNK])
+                )
+            )
+            for fresh in result:
+                old = rows[fresh.uuid]
+                if (
+                    fresh.server_id == server_id
+                    and fresh.inbound_id == old.inbound_id
+                    and fresh.status == old.status
+                    and fresh.expires_at == old.expires_at
+                    and fresh.data_limit_gb == old.data_limit_gb
+                ):
+                    unchanged.add(fresh.uuid)
+    return unchanged
+
+
+async def _recheck(
+    server_id: int, missing: Iterable[str], orphans: Iterable[str]
+) -> Tuple[Set[str], Set[str]]:
+    """
+    Перечитать подписки перед изменением панели.
+
+    Args:
+        server_id: ID сервера
+        missing: uuid активных подписок, которых нет на панели
+        orphans: uuid клиентов панели без подписки
+
+    Returns:
+        (uuid, которые всё ещё нужно создать; uuid, у которых теперь есть подписка)
+    """
+    missing, orphans = set(missing), set(orphans)
+    uuids = list(missing | orphans)
+    now = datetime.now()
+    still_missing: Set[str] = set()
+    claimed: Set[str] = set()
+    async with async_session() as session:
+        for start in range(0, len(uuids), RECHECK_CHUNK):
+            result = await session.execute(
+                select(
+                    Subscription.uuid,
+                    Subscription.server_id,
+                    Subscription.status,
+                    Subscription.expires_at,
+                ).where(Subscription.uuid.in_(uuids[start : start + RECHECK_CHUNK]))
+            )
+            for uuid, sub_server_id, status, expires_at in result:
+                if uuid in orphans:
+                    claimed.add(uuid)
+                elif (
+                    sub_server_id == server_id
+                    and status == SubscriptionStatus.ACTIVE
+                    and expires_at > now
+                ):
+                    still_missing.add(uuid)
+    return still_missing, claimed
+
+
+async def reconcile_server(
+    server: Server, delete_orphans: bool = False, dry_run: bool = False
+) -> ReconcileReport:
+    """
+    Сверить подписки одного сервера с его панелью.
+
+    Args:
+        server: Сервер 3x-ui
+        delete_orphans: Удалять клиентов панели, которых нет в БД
+        dry_run: Только посчитать расхождения, ничего не меняя
+
+    Returns:
+        ReconcileReport по серверу
+    """
+    report = ReconcileReport()
+
+    client: Optional[ThreeXUIClient] = await client_pool.acquire(server)
+    if not client:
+        logger.error(f"Сверка {server.name}: нет подключения к панели")
+        report.servers_failed = 1
+        return report
+
+    resp = await client.get_inbounds()
+    if not resp.get("success"):
+        logger.error(f"Сверка {server.name}: не удалось получить inbounds: {resp}")
+        report.servers_failed = 1
+        return report
+
+    # uuid -> (inbound_id, клиент), email -> clientStats
+    panel: Dict[str, tuple] = {}
+    stats: Dict[str, Dict[str, Any]] = {}
+    for inbound in resp.get("obj") or []:
+        for panel_client in panel_clients(inbound):
+            if panel_client.get("id"):
+                panel[panel_client["id"]] = (inbound["id"], panel_client)
+        for client_stats in inbound.get("clientStats") or []:
+            stats[client_stats.get("email")] = client_stats
+
+    rows = await _load_subscriptions(server.id)
+    now = datetime.now()
+
+    updates = []
+    missing: Dict[int, List[ClientSpec]] = {}
+    for row in rows:
+        entry = panel.pop(row.uuid, None)
+        if entry is None:
+            if row.status == SubscriptionStatus.ACTIVE and row.expires_at > now:
+                limit = 0
+                if not row.email.startswith(CUSTOM_EMAIL_PREFIXES):
+                    limit = row.data_limit_gb or 0
+                missing.setdefault(row.inbound_id, []).append(
+                    ClientSpec(
+                        email=row.email,
+                        total_gb=limit,
+                        expiry_time=_expiry_ms(row.expires_at),
+                        sub_id=row.email,
+                        uuid=row.uuid,
+                    )
+                )
+            else:
+                report.in_sync += 1
+            continue
+
+        inbound_id, panel_client = entry
+        patch = _desired_patch(row, panel_client, stats.get(row.email), now)
+        if patch:
+            updates.append((inbound_id, {**panel_client, **patch}, row))
+        else:
+            report.in_sync += 1
+
+    if dry_run:
+        report.orphaned = len(panel)
+        report.updated = len(updates)
+        report.created = sum(len(specs) for specs in missing.values())
+        return report
+
+    still_missing, claimed = await _recheck(
+        server.id,
+        (spec.uuid for specs in missing.values() for spec in specs),
+        panel,
+    )
+    for inbound_id in list(missing):
+        specs = [spec for spec in missing[inbound_id] if spec.uuid in still_missing]
+        report.in_sync += len(missing[inbound_id]) - len(specs)
+        if specs:
+            missing[inbound_id] = specs
+        else:
+            del missing[inbound_id]
+    for client_uuid in claimed:
+        del panel[client_uuid]
+    report.orphaned = len(panel)
+
+    # Строку, изменённую за время сверки, поправит следующая сверка
+    unchanged = await _recheck_updates(
+        server.id, {row.uuid: row for *_, row in updates}
+    )
+    report.in_sync += len(updates) - len(unchanged)
+
+    # Внутри одного сервера изменения идут последовательно: панель
+    # перезаписывает settings inbound'а целиком на каждый вызов
+    for inbound_id, client_data, row in updates:
+        if row.uuid not in unchanged:
+            continue
+        if await client.update_client_data(inbound_id, client_data):
+            report.updated += 1
+        else:
+            report.failed += 1
+
+    for inbound_id, specs in missing.items():
+        for result in await client.add_clients(inbound_id, specs):
+            if result.success:
+                report.created += 1
+            else:
+                report.failed += 1
+
+    if delete_orphans:
+        for client_uuid, (inbound_id, _) in panel.items():
+            if await client.delete_client(inbound_id, client_uuid):
+                report.deleted += 1
+            else:
+                report.failed += 1
+
+    logger.info(f"Сверка {server.name}: {report.summary()}")
+    return report
+
+
+async def reconcile_all(
+    delete_orphans: bool = False,
+    dry_run: bool = False,
+    concurrency: int = RECONCILE_CONCURRENCY,
+) -> ReconcileReport:
+    """
+    Сверить все активные серверы, не более concurrency одновременно.
+
+    Returns:
+        Суммарный ReconcileReport
+    """
+    async with async_session() as session:
+        servers = (
+            await session.scalars(select(Server).where(Server.is_active.is_(True)))
+        ).all()
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _run(server: Server) -> ReconcileReport:
+        async with semaphore:
+            try:
+                return await reconcile_server(server, delete_orphans, dry_run)
+            except Exception as e:
+                logger.error(f"Сверка {server.name} прервана: {e}")
+                return ReconcileReport(servers_failed=1)
+
+    total = ReconcileReport()
+    for report in await asyncio.gather(*(_run(server) for server in servers)):
+        total += report
+
+    logger.info(f"Сверка завершена: {total.summary()}")
+    return total
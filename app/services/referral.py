@@ -4,12 +4,16 @@
 """
 
 import logging
+from functools import partial
 from typing import Optional
 
 from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.models import Server, Plan, Subscription, User
 from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.unit_of_work import on_commit
 from app.services.subscription import SubscriptionService
 
 logger = logging.getLogger(__name__)
@@ -29,6 +33,7 @@ class ReferralService:
         server: Optional[Server],
         trial_plan: Optional[Plan],
         bot: Bot,
+        session: Optional[AsyncSession] = None,
     ) -> None:
         """
         Обработка реферальной ссылки при регистрации нового пользователя.
@@ -39,6 +44,7 @@ class ReferralService:
             server: Активный сервер
             trial_plan: Trial план
             bot: Экземпляр бота
+            session: Сессия БД апдейта (опционально)
         """
         logger.info(
             f"process_referral: new_user={new_user_id}, referrer_id={referrer_id}"
@@ -48,7 +54,7 @@ class ReferralService:
             logger.warning("process_referral: referrer_id не указан")
             return
 
-        ref_user = await rq.select_user(referrer_id)
+        ref_user = await rq.select_user(referrer_id, session=session)
         if not ref_user:
             logger.warning(f"process_referral: реферер {referrer_id} не найден в БД")
             return
@@ -63,7 +69,9 @@ class ReferralService:
             logger.info(
                 f"process_referral: реферер {ref_user.tg_id} уже получил бонус, начисляем деньги"
             )
-            await ReferralService._grant_balance_bonus(ref_user=ref_user, bot=bot)
+            await ReferralService._grant_balance_bonus(
+                ref_user=ref_user, bot=bot, session=session
+            )
             return
 
         # Если сервер и trial план доступны — пытаемся начислить бонус
@@ -72,19 +80,29 @@ class ReferralService:
                 f"process_referral: начисление бонуса рефереру {ref_user.tg_id}"
             )
             await ReferralService._grant_subscription_bonus(
-                ref_user=ref_user, server=server, trial_plan=trial_plan, bot=bot
+                ref_user=ref_user,
+                server=server,
+                trial_plan=trial_plan,
+                bot=bot,
+                session=session,
             )
         else:
             # Нет сервера или trial плана — начисляем деньги
             logger.warning(
                 f"process_referral: нет сервера или trial плана, начисляем деньги рефереру {ref_user.tg_id}"
             )
-            await ReferralService._grant_balance_bonus(ref_user=ref_user, bot=bot)
-            await rq.set_user_bonus_received(ref_user.id)
+            await ReferralService._grant_balance_bonus(
+                ref_user=ref_user, bot=bot, session=session
+            )
+            await rq.set_user_bonus_received(ref_user.id, session=session)
 
     @staticmethod
     async def _grant_subscription_bonus(
-        ref_user: User, server: Server, trial_plan: Plan, bot: Bot
+        ref_user: User,
+        server: Server,
+        trial_plan: Plan,
+        bot: Bot,
+        session: Optional[AsyncSession] = None,
     ) -> None:
         """
         Начисление бонуса в виде продления подписки.
@@ -94,57 +112,93 @@ class ReferralService:
             server: Сервер
             trial_plan: Trial план
             bot: Экземпляр бота
+            session: Сессия БД апдейта (опционально)
         """
-        ref_sub = await rq.get_user_subscription(ref_user.tg_id)
+        ref_sub = await rq.get_user_subscription(ref_user.tg_id, session=session)
 
         if not ref_sub:
             # Нет активной подписки — начисляем деньги на баланс
             logger.info(
                 f"У реферера {ref_user.tg_id} нет подписки, начисляем денежный бонус"
             )
-            await ReferralService._grant_balance_bonus(ref_user=ref_user, bot=bot)
+            await ReferralService._grant_balance_bonus(
+                ref_user=ref_user, bot=bot, session=session
+            )
             # Помечаем бонус как использованный
-            await rq.set_user_bonus_received(ref_user.id)
+            await rq.set_user_bonus_received(ref_user.id, session=session)
             return
 
+        # Продлевается клиент на сервере подписки реферера, а не на сервере,
+        # выбранном для нового пользователя
+        ref_server = await catalogue.get_server(ref_sub.server_id) or server
         success = await SubscriptionService.extend_user_subscription(
             user_id=ref_user.id,
             days=REFERRAL_BONUS_DAYS,
-            server=server,
+            server=ref_server,
             subscription=ref_sub,
             plan=trial_plan,
+            session=session,
         )
 
         if success:
             # Помечаем бонус как использованный
-            await rq.set_user_bonus_received(ref_user.id)
-
-            # Уведомляем реферера
-            await ReferralService._notify_subscription_bonus(
-                referrer_id=ref_user.tg_id, subscription=ref_sub, bot=bot
+            await rq.set_user_bonus_received(ref_user.id, session=session)
+
+            # Уведомляем реферера, когда бонус зафиксирован
+            await on_commit(
+                partial(
+                    ReferralService._notify_subscription_bonus,
+                    referrer_id=ref_user.tg_id,
+                    subscription=ref_sub,
+                    bot=bot,
+                ),
+                session,
             )
         else:
             # Если продление не удалось, начисляем деньги
             logger.warning(
                 f"Не удалось продлить подписку рефереру {ref_user.tg_id}, начисляем деньги"
             )
-            await ReferralService._grant_balance_bonus(ref_user=ref_user, bot=bot)
-            await rq.set_user_bonus_received(ref_user.id)
+            await ReferralService._grant_balance_bonus(
+                ref_user=ref_user, bot=bot, session=session
+            )
+            await rq.set_user_bonus_received(ref_user.id, session=session)
 
     @staticmethod
-    async def _grant_balance_bonus(ref_user: User, bot: Bot) -> None:
+    async def _grant_balance_bonus(
+        ref_user: User, bot: Bot, session: Optional[AsyncSession] = None
+    ) -> None:
         """
         Начисление денежного бонуса на баланс.
 
         Args:
             ref_user: Пользователь-реферер
             bot: Экземпляр бота
+            session: Сессия БД апдейта (опционально)
+        """
+        await rq.add_balance(ref_user.tg_id, REFERRAL_BONUS_RUB, session=session)
+        # Уведомляем реферера, когда бонус зафиксирован
+        await on_commit(
+            partial(
+                ReferralService._notify_balance_bonus,
+                referrer_id=ref_user.tg_id,
+                bot=bot,
+            ),
+            session,
+        )
+
+    @staticmethod
+    async def _notify_balance_bonus(referrer_id: int, bot: Bot) -> None:
         """
-        await rq.add_balance(ref_user.tg_id, REFERRAL_BONUS_RUB)
+        Уведомление о денежном бонусе.
 
+        Args:
+            referrer_id: ID реферера в Telegram
+            bot: Экземпляр бота
+        """
         try:
             await bot.send_message(
-                ref_user.tg_id,
+                referrer_id,
                 f"🎉 По вашей ссылке зарегистрировался друг! "
                 f"Вам начислено {REFERRAL_BONUS_RUB} рублей на баланс.",
             )
@@ -194,14 +248,17 @@ class ReferralService:
         return f"https://t.me/{bot_username}?start={user_id}"
 
     @staticmethod
-    async def get_referrals_count(user_id: int) -> int:
+    async def get_referrals_count(
+        user_id: int, session: Optional[AsyncSession] = None
+    ) -> int:
         """
         Получение количества приглашённых пользователей.
 
         Args:
             user_id: ID пользователя в БД
+            session: Сессия БД апдейта (опционально)
 
         Returns:
             Количество рефералов
         """
-        return await rq.get_referrals_count(user_id)
+        return await rq.get_referrals_count(user_id, session=session)
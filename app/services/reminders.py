@@ -0,0 +1,191 @@
+"""
+Напоминания об окончании подписки.
+
+Фоновая задача пользовательского бота раз в REMINDER_INTERVAL секунд
+ищет подписки, срок которых попал в одно из окон REMINDER_WINDOWS
+(дни до expires_at; 0 — подписка уже истекла), и отправляет владельцу
+сообщение с кнопкой продления (buy_plan_{тариф}). Окна не пересекаются:
+за 3 и 1 день это (1, 3] и (0, 1] дня до срока, поэтому подписке,
+купленной за два дня до конца, придёт только ближайшее напоминание.
+Истёкшие подписки напоминаются не позже REMINDER_EXPIRED_WINDOW секунд
+после срока.
+
+Каждое напоминание записывается в subscription_reminders до отправки
+(окно + срок подписки), поэтому повторно не уходит даже после
+перезапуска, а после продления срока окна срабатывают заново. Сообщения
+идут через планировщик исходящих запросов бота и дополнительно не чаще
+REMINDER_RATE в секунду, чтобы не занимать лимит ответов пользователям.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.models import SubscriptionStatus
+from app.keyboards.inline import get_renew_keyboard
+from app.services.reconcile import CUSTOM_EMAIL_PREFIXES
+from app.utils.sender import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Период проверки (с), 0 — отключить
+REMINDER_INTERVAL = float(os.getenv("REMINDER_INTERVAL", "900"))
+# Окна напоминаний в днях до срока; 0 — подписка истекла
+REMINDER_WINDOWS = tuple(
+    sorted(
+        {int(days) for days in os.getenv("REMINDER_WINDOWS", "3,1,0").split(",")},
+        reverse=True,
+    )
+)
+# Сколько после срока ещё можно напомнить об истёкшей подписке (с)
+REMINDER_EXPIRED_WINDOW = float(os.getenv("REMINDER_EXPIRED_WINDOW", "86400"))
+# Напоминаний в секунду
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "5"))
+# Подписок в одной выборке
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "200"))
+
+
+def _days_word(days: int) -> str:
+    if days % 10 == 1 and days % 100 != 11:
+        return "день"
+    if days % 10 in (2, 3, 4) and days % 100 not in (12, 13, 14):
+        return "дня"
+    return "дней"
+
+
+def format_reminder(days_before: int, expires_at: datetime) -> str:
+    """
+    Текст напоминания.
+
+    Args:
+        days_before: Окно напоминания (0 — подписка истекла)
+        expires_at: Срок подписки
+
+    Returns:
+        Текст в HTML
+    """
+    date = expires_at.strftime("%d.%m.%Y")
+    if days_before == 0:
+        return (
+            f"❌ <b>Срок подписки истёк</b> {date}.\n\n"
+            "VPN-ключ отключён. Продлите подписку, чтобы снова подключиться."
+        )
+    left = (
+        "меньше чем через сутки"
+        if days_before == 1
+        else f"меньше чем через {days_before} {_days_word(days_before)}"
+    )
+    return (
+        f"⏳ <b>Подписка заканчивается {date}</b> — {left}.\n\n"
+        "Продлите её заранее, чтобы VPN не отключился."
+    )
+
+
+def _windows(now: datetime) -> List[Tuple[int, datetime, datetime, tuple]]:
+    """(окно, нижняя граница, верхняя граница, статусы) для каждого окна."""
+    windows = []
+    bounds = [days for days in REMINDER_WINDOWS if days > 0]
+    for i, days in enumerate(bounds):
+        closer = bounds[i + 1] if i + 1 < len(bounds) else 0
+        windows.append(
+            (
+                days,
+                now + timedelta(days=closer),
+                now + timedelta(days=days),
+                (SubscriptionStatus.ACTIVE,),
+            )
+        )
+    if 0 in REMINDER_WINDOWS:
+        # Статус EXPIRED ставит фоновая задача истечения — не ждём её
+        windows.append(
+            (
+                0,
+                now - timedelta(seconds=REMINDER_EXPIRED_WINDOW),
+                now,
+                (SubscriptionStatus.ACTIVE, SubscriptionStatus.EXPIRED),
+            )
+        )
+    return windows
+
+
+class ReminderSender:
+    """Периодическая отправка напоминаний о сроке подписки."""
+
+    def __init__(self) -> None:
+        self._bucket = TokenBucket(REMINDER_RATE, 1)
+
+    async def _renew_plan_id(self, plan_id: int) -> Optional[int]:
+        """Тариф для кнопки продления: текущий, если он платный, иначе самый дешёвый."""
+        paid = await catalogue.get_paid_plans()
+        if any(plan.id == plan_id for plan in paid):
+            return plan_id
+        return paid[0].id if paid else None
+
+    async def _send(self, bot: Bot, row, days_before: int) -> bool:
+        delay = self._bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        renew_plan_id = await self._renew_plan_id(row.plan_id)
+        try:
+            await bot.send_message(
+                row.tg_id,
+                format_reminder(days_before, row.expires_at),
+                reply_markup=(
+                    get_renew_keyboard(renew_plan_id) if renew_plan_id else None
+                ),
+                parse_mode="HTML",
+            )
+            return True
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат удалён — повторять бессмысленно
+            logger.debug(f"Напоминание {row.tg_id} не доставлено: {e}")
+        except Exception as e:
+            logger.warning(f"Напоминание {row.tg_id} не доставлено: {e}")
+        return False
+
+    async def run(self, bot: Bot) -> int:
+        """
+        Отправить все напоминания, срок которых наступил.
+
+        Args:
+            bot: Пользовательский бот
+
+        Returns:
+            Количество доставленных напоминаний
+        """
+        now = datetime.now()
+        delivered = 0
+        for days_before, lower, upper, statuses in _windows(now):
+            while True:
+                rows = await rq.get_due_reminders(
+                    days_before,
+                    lower,
+                    upper,
+                    statuses,
+                    skip_email_prefixes=CUSTOM_EMAIL_PREFIXES,
+                    limit=REMINDER_BATCH_SIZE,
+                )
+                if not rows:
+                    break
+                # Сначала запись, потом отправка: напоминание не уйдёт дважды
+                await rq.log_reminders(
+                    [(row.id, days_before, row.expires_at) for row in rows]
+                )
+                for row in rows:
+                    delivered += await self._send(bot, row, days_before)
+
+        # Сроки, вышедшие из всех окон, больше не выбираются — записи не нужны
+        await rq.purge_reminders(now - timedelta(seconds=REMINDER_EXPIRED_WINDOW))
+        if delivered:
+            logger.info(f"Отправлено напоминаний о сроке подписки: {delivered}")
+        return delivered
+
+
+reminders = ReminderSender()
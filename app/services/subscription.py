@@ -7,21 +7,22 @@ import logging
 import re
 import uuid as uuid_module
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Optional, Tuple
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.three_x_ui import ThreeXUIClient
+from app.api.inbounds import inbound_catalogue
+from app.api.pool import client_pool
+from app.database.catalogue import catalogue
 from app.database.models import Server, Plan, Subscription
 from app.database import requests as rq
-from app.utils import (
-    generate_vless_link,
-    get_subscription_link,
-    get_port_from_stream,
-    extract_base_host,
-)
+from app.database.unit_of_work import on_commit, on_rollback
+from app.services.placement import server_load
+from app.utils import get_subscription_link, extract_base_host
 
 logger = logging.getLogger(__name__)
 
@@ -86,18 +87,33 @@ def _generate_safe_email(
     return email
 
 
+async def _delete_old_client(server_id: int, inbound_id: int, client_uuid: str) -> None:
+    """Удалить клиента заменённой подписки с панели его сервера."""
+    server = await catalogue.get_server(server_id)
+    client = await client_pool.acquire(server) if server else None
+    if client:
+        await client.delete_client(inbound_id, client_uuid)
+
+
 class SubscriptionService:
     """Сервис для управления подписками."""
 
     @staticmethod
     async def issue_subscription(
-        tg_id: int, plan: Plan, server: Server, bot: Bot, replace_existing: bool = True
+        tg_id: int,
+        plan: Plan,
+        server: Server,
+        bot: Bot,
+        replace_existing: bool = True,
+        session: Optional[AsyncSession] = None,
     ) -> Tuple[bool, Optional[Subscription]]:
         """
         Выдача подписки пользователю.
 
         Если у пользователя есть активная подписка, она будет обновлена
-        (вместо создания новой).
+        (вместо создания новой) и переедет на server. Место на server
+        резервирует вызывающий (server_load), место старой подписки
+        освобождается здесь.
 
         Args:
             tg_id: Telegram ID пользователя
@@ -105,6 +121,7 @@ class SubscriptionService:
             server: Сервер для подключения
             bot: Экземпляр бота
             replace_existing: Если True - обновлять существующую подписку
+            session: Сессия БД апдейта (опционально)
 
         Returns:
             (success, subscription) - кортеж успеха и подписки
@@ -112,29 +129,20 @@ class SubscriptionService:
         # Проверяем существующую подписку
         existing_sub = None
         if replace_existing:
-            existing_sub = await rq.get_user_subscription(tg_id)
+            existing_sub = await rq.get_user_subscription(tg_id, session=session)
 
-        client = ThreeXUIClient(server.api_url, server.username, server.password)
+        client = await client_pool.acquire(server)
 
-        if not await client.login():
+        if not client:
             logger.error(f"Не удалось подключиться к серверу {server.name}")
-            await client.close()
-            return False, None
-
-        inbounds_resp = await client.get_inbounds()
-        if not inbounds_resp.get("success"):
-            logger.error(f"Не удалось получить inbounds: {inbounds_resp}")
-            await client.close()
+            server_load.mark_failed(server.id)
             return False, None
 
-        inbounds = inbounds_resp.get("obj", [])
-        if not inbounds:
-            logger.error("Нет доступных inbounds на сервере")
-            await client.close()
+        target_inbound = await inbound_catalogue.get_default_inbound(server)
+        if not target_inbound:
+            logger.error(f"Нет доступных inbounds на сервере {server.name}")
             return False, None
 
-        target_inbound = inbounds[0]
-
         # Генерируем безопасный email для подписки (только латиница)
         email = _generate_safe_email(tg_id, plan)
         expiry_time = int(
@@ -142,7 +150,7 @@ class SubscriptionService:
         )
 
         success, _, uuid = await client.add_client(
-            inbound_id=target_inbound["id"],
+            inbound_id=target_inbound.id,
             email=email,
             total_gb=plan.data_limit_gb,
             expiry_time=expiry_time,
@@ -151,33 +159,35 @@ class SubscriptionService:
 
         if not success:
             logger.error(f"Не удалось добавить клиента: {email}")
-            await client.close()
+            server_load.mark_failed(server.id)
             return False, None
+        server_load.mark_ok(server.id)
+        # Если записи апдейта откатятся, новый клиент никому не принадлежит
+        on_rollback(partial(client.delete_client, target_inbound.id, uuid), session)
 
-        # Генерация ссылок
-        base_host = extract_base_host(server.api_url)
-        port = get_port_from_stream(
-            target_inbound.get("streamSettings", "{}"), default_port=443
-        )
-        vless_link = generate_vless_link(
-            uuid, base_host, port, email, target_inbound.get("streamSettings")
-        )
+        # Генерация ссылки по предвычисленному шаблону inbound'а
+        vless_link = target_inbound.link_template.render(uuid, email)
 
         subscription = None
 
         if existing_sub and replace_existing:
-            # Обновляем существующую подписку
-            # Сначала удаляем старого клиента из 3x-ui
-            await client.delete_client(existing_sub.inbound_id, existing_sub.uuid)
+            # Обновляем существующую подписку. Старый клиент удаляется только
+            # после фиксации записей: сверка (app.services.reconcile) не должна
+            # застать подписку со старым uuid без клиента на панели, а откат
+            # апдейта оставляет пользователю рабочий старый ключ
+            old_server_id = existing_sub.server_id
+            old_inbound_id, old_uuid = existing_sub.inbound_id, existing_sub.uuid
 
-            # Обновляем запись в БД
             await rq.update_subscription_email(
                 subscription_id=existing_sub.id,
                 new_email=email,
                 new_uuid=uuid,
                 new_key_url=vless_link,
-                new_inbound_id=target_inbound["id"],
+                new_inbound_id=target_inbound.id,
+                new_server_id=server.id,
+                session=session,
             )
+            server_load.release(old_server_id)
 
             # Обновляем план и срок
             await rq.update_subscription_plan(
@@ -185,10 +195,17 @@ class SubscriptionService:
                 plan_id=plan.id,
                 duration_days=plan.duration_days,
                 data_limit_gb=plan.data_limit_gb,
+                session=session,
+            )
+
+            # Удаляем старого клиента из 3x-ui на его сервере
+            await on_commit(
+                partial(_delete_old_client, old_server_id, old_inbound_id, old_uuid),
+                session,
             )
 
             # Получаем обновлённую подписку
-            subscription = await rq.get_user_subscription(tg_id)
+            subscription = await rq.get_user_subscription(tg_id, session=session)
 
             logger.info(f"Подписка обновлена для пользователя {tg_id}")
         else:
@@ -199,12 +216,12 @@ class SubscriptionService:
                 plan_id=plan.id,
                 uuid=uuid,
                 email=email,
-                inbound_id=target_inbound["id"],
+                inbound_id=target_inbound.id,
                 key_url=vless_link,
+                session=session,
             )
             logger.info(f"Создана новая подписка для пользователя {tg_id}")
 
-        await client.close()
         return True, subscription
 
     @staticmethod
@@ -236,7 +253,10 @@ class SubscriptionService:
 
     @staticmethod
     async def activate_trial(
-        tg_id: int, trial_plan: Plan, server: Server
+        tg_id: int,
+        trial_plan: Plan,
+        server: Server,
+        session: Optional[AsyncSession] = None,
     ) -> Tuple[bool, Optional[str]]:
         """
         Активация пробной подписки.
@@ -245,34 +265,27 @@ class SubscriptionService:
             tg_id: Telegram ID пользователя
             trial_plan: Тариф trial
             server: Сервер для подключения
+            session: Сессия БД апдейта (опционально)
 
         Returns:
             (success, subscription_link) - кортеж успеха и ссылки на подписку
         """
-        client = ThreeXUIClient(server.api_url, server.username, server.password)
-
-        if not await client.login():
-            await client.close()
-            return False, None
+        client = await client_pool.acquire(server)
 
-        inbounds_resp = await client.get_inbounds()
-        if not inbounds_resp.get("success"):
-            await client.close()
+        if not client:
+            server_load.mark_failed(server.id)
             return False, None
 
-        inbounds = inbounds_resp.get("obj", [])
-        if not inbounds:
-            await client.close()
+        target_inbound = await inbound_catalogue.get_default_inbound(server)
+        if not target_inbound:
             return False, None
 
-        target_inbound = inbounds[0]
-
         # Генерируем безопасный email для trial подписки
         email = _generate_safe_email(tg_id, trial_plan, suffix="trial")
         expiry_time = int((datetime.now() + timedelta(days=7)).timestamp() * 1000)
 
         success, _, uuid = await client.add_client(
-            inbound_id=target_inbound["id"],
+            inbound_id=target_inbound.id,
             email=email,
             total_gb=trial_plan.data_limit_gb,
             expiry_time=expiry_time,
@@ -280,16 +293,13 @@ class SubscriptionService:
         )
 
         if not success:
-            await client.close()
+            server_load.mark_failed(server.id)
             return False, None
+        server_load.mark_ok(server.id)
+        on_rollback(partial(client.delete_client, target_inbound.id, uuid), session)
 
         base_host = extract_base_host(server.api_url)
-        port = get_port_from_stream(
-            target_inbound.get("streamSettings", "{}"), default_port=443
-        )
-        vless_link = generate_vless_link(
-            uuid, base_host, port, email, target_inbound.get("streamSettings")
-        )
+        vless_link = target_inbound.link_template.render(uuid, email)
 
         await rq.create_subscription(
             user_id=tg_id,
@@ -297,13 +307,13 @@ class SubscriptionService:
             plan_id=trial_plan.id,
             uuid=uuid,
             email=email,
-            inbound_id=target_inbound["id"],
+            inbound_id=target_inbound.id,
             key_url=vless_link,
             is_trial=True,
+            session=session,
         )
 
         sub_link = get_subscription_link(base_host, email)
-        await client.close()
 
         return True, sub_link
 
@@ -314,6 +324,7 @@ class SubscriptionService:
         server: Server,
         subscription: Subscription,
         plan: Optional[Plan] = None,
+        session: Optional[AsyncSession] = None,
     ) -> bool:
         """
         Продление подписки пользователя.
@@ -324,14 +335,14 @@ class SubscriptionService:
             server: Сервер
             subscription: Подписка для продления
             plan: План (опционально, для обновления лимитов)
+            session: Сессия БД апдейта (опционально)
 
         Returns:
             True если успешно
         """
-        client = ThreeXUIClient(server.api_url, server.username, server.password)
+        client = await client_pool.acquire(server)
 
-        if not await client.login():
-            await client.close()
+        if not client:
             return False
 
         new_expires_at = subscription.expires_at + timedelta(days=days)
@@ -348,7 +359,6 @@ class SubscriptionService:
         )
 
         if updated:
-            await rq.extend_subscription(subscription.id, days)
+            await rq.extend_subscription(subscription.id, days, session=session)
 
-        await client.close()
         return updated
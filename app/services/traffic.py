@@ -0,0 +1,139 @@
+"""
+Сбор расхода трафика клиентов с панелей 3x-ui.
+
+Фоновая задача пользовательского бота раз в TRAFFIC_INTERVAL секунд
+забирает clientStats со всех серверов — один запрос списка inbound'ов на
+сервер, где счётчики всех клиентов уже есть, вместо запроса на клиента;
+серверы опрашиваются параллельно (не более TRAFFIC_CONCURRENCY).
+
+Счётчики пишутся в traffic_snapshots строкой на подписку и интервал
+TRAFFIC_BUCKET секунд: повторный опрос в том же интервале обновляет
+строку. Клиенты, счётчики которых с прошлой записи не изменились, не
+пишутся, поэтому простаивающие подписки почти не занимают места: их
+снимок повторяется раз в половину срока хранения, чтобы не пропасть при
+удалении снимков старше TRAFFIC_RETENTION_DAYS.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.api.pool import client_pool
+from app.database import requests as rq
+from app.database.catalogue import catalogue
+from app.database.models import Server
+
+logger = logging.getLogger(__name__)
+
+# Период опроса панелей (с), 0 — отключить
+TRAFFIC_INTERVAL = float(os.getenv("TRAFFIC_INTERVAL", "600"))
+# Длина интервала снимка (с)
+TRAFFIC_BUCKET = int(os.getenv("TRAFFIC_BUCKET", "3600"))
+# Сколько хранить снимки (дни)
+TRAFFIC_RETENTION_DAYS = float(os.getenv("TRAFFIC_RETENTION_DAYS", "30"))
+# Сколько серверов опрашивается одновременно
+TRAFFIC_CONCURRENCY = int(os.getenv("TRAFFIC_CONCURRENCY", "4"))
+
+GB = 1024 * 1024 * 1024
+
+
+def format_traffic(used: Optional[int], limit: Optional[int]) -> Optional[str]:
+    """
+    Строка расхода трафика для профиля и карточки пользователя.
+
+    Args:
+        used: Использовано байт (None — данных ещё нет)
+        limit: Лимит в байтах, 0 — без лимита
+
+    Returns:
+        «использовано X из Y ГБ» или None, если данных нет
+    """
+    if used is None:
+        return None
+    if not limit:
+        return f"использовано {used / GB:.2f} ГБ (без лимита)"
+    return f"использовано {used / GB:.2f} из {limit / GB:.0f} ГБ"
+
+
+def bucket_start(moment: datetime) -> datetime:
+    """Начало интервала снимка, в который попадает moment."""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = int((moment - day).total_seconds())
+    return day + timedelta(seconds=seconds - seconds % TRAFFIC_BUCKET)
+
+
+class TrafficCollector:
+    """Периодический сбор clientStats с панелей."""
+
+    def __init__(self) -> None:
+        # subscription_id -> ((up, down, total), интервал) последней записи
+        self._written: Dict[int, Tuple[Tuple[int, ...], datetime]] = {}
+
+    def _is_stale(self, snapshot: Tuple[int, int, int, int], refresh: datetime) -> bool:
+        written = self._written.get(snapshot[0])
+        return written is None or written[0] != snapshot[1:] or written[1] < refresh
+
+    async def _collect_server(self, server: Server) -> List[Tuple[int, int, int, int]]:
+        client = await client_pool.acquire(server)
+        resp = await client.get_inbounds() if client else {}
+        if not resp.get("success"):
+            logger.error(f"Трафик: нет данных с {server.name}")
+            return []
+
+        subscriptions = await rq.get_subscription_ids_by_email(server.id)
+        snapshots = []
+        for inbound in resp.get("obj") or []:
+            for stats in inbound.get("clientStats") or []:
+                subscription_id = subscriptions.get(stats.get("email"))
+                if subscription_id is None:
+                    continue
+                snapshots.append(
+                    (
+                        subscription_id,
+                        stats.get("up") or 0,
+                        stats.get("down") or 0,
+                        stats.get("total") or 0,
+                    )
+                )
+        return snapshots
+
+    async def run(self) -> int:
+        """
+        Опросить панели и записать изменившиеся счётчики.
+
+        Returns:
+            Количество записанных снимков
+        """
+        semaphore = asyncio.Semaphore(max(TRAFFIC_CONCURRENCY, 1))
+
+        async def _run(server: Server) -> List[Tuple[int, int, int, int]]:
+            async with semaphore:
+                try:
+                    return await self._collect_server(server)
+                except Exception as e:
+                    logger.error(f"Трафик: опрос {server.name} прерван: {e}")
+                    return []
+
+        now = datetime.now()
+        bucket = bucket_start(now)
+        retention = timedelta(days=TRAFFIC_RETENTION_DAYS)
+        servers = await catalogue.get_servers()
+        changed = [
+            snapshot
+            for snapshots in await asyncio.gather(*(_run(s) for s in servers))
+            for snapshot in snapshots
+            if self._is_stale(snapshot, now - retention / 2)
+        ]
+
+        await rq.save_traffic_snapshots(bucket, changed)
+        for subscription_id, *counters in changed:
+            self._written[subscription_id] = (tuple(counters), bucket)
+
+        await rq.purge_traffic_snapshots(now - retention)
+        logger.debug(f"Трафик: записано снимков {len(changed)}")
+        return len(changed)
+
+
+traffic_collector = TrafficCollector()
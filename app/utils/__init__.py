@@ -7,10 +7,13 @@ from app.utils.vpn import (
     get_subscription_link,
     extract_base_host,
     get_port_from_stream,
+    VlessLinkTemplate,
 )
+from app.utils.locations import location_flag
 from app.utils.messages import (
     delete_message_safe,
     delete_messages_safe,
+    delete_later,
     edit_or_delete_safe,
     MessageCleaner,
 )
@@ -21,9 +24,12 @@ __all__ = [
     "get_subscription_link",
     "extract_base_host",
     "get_port_from_stream",
+    "VlessLinkTemplate",
+    "location_flag",
     # Утилиты сообщений
     "delete_message_safe",
     "delete_messages_safe",
+    "delete_later",
     "edit_or_delete_safe",
     "MessageCleaner",
 ]
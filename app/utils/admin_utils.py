@@ -3,9 +3,12 @@
 """
 
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
 
+from app.database.models import SubscriptionStatus
+
 
 def format_datetime(dt: Optional[datetime]) -> str:
     """Форматировать дату в читаемый формат."""
@@ -80,3 +83,44 @@ def parse_traffic_input(traffic_str: str) -> int:
         return int(value)
     except ValueError:
         return 0
+
+
+# Короткие коды статусов подписки для callback_data
+SUBSCRIPTION_STATUS_CODES = {
+    "a": SubscriptionStatus.ACTIVE,
+    "e": SubscriptionStatus.EXPIRED,
+    "p": SubscriptionStatus.PENDING,
+    "b": SubscriptionStatus.BANNED,
+}
+
+
+@dataclass(frozen=True)
+class SubscriptionFilter:
+    """Фильтр списка подписок в админке."""
+
+    status: Optional[SubscriptionStatus] = None
+    server_id: Optional[int] = None
+    # Истекают в ближайшие N дней
+    expires_within_days: Optional[int] = None
+
+    def pack(self) -> str:
+        """Упаковать в callback_data: {статус}_{сервер}_{дни}, 0/- — без фильтра."""
+        code = next(
+            (c for c, s in SUBSCRIPTION_STATUS_CODES.items() if s == self.status), "-"
+        )
+        return f"{code}_{self.server_id or 0}_{self.expires_within_days or 0}"
+
+    @classmethod
+    def unpack(cls, packed: str) -> "SubscriptionFilter":
+        """
+        Распаковать фильтр из callback_data.
+
+        Raises:
+            ValueError: Строка не в формате pack()
+        """
+        code, server_id, days = packed.split("_")
+        return cls(
+            status=SUBSCRIPTION_STATUS_CODES.get(code),
+            server_id=int(server_id) or None,
+            expires_within_days=int(days) or None,
+        )
@@ -0,0 +1,52 @@
+"""
+Флаги стран для локаций серверов.
+"""
+
+# Порядок важен: берётся первый ключ, входящий в название локации
+LOCATION_FLAGS = (
+    ("germany", "🇩🇪"),
+    ("german", "🇩🇪"),
+    ("de", "🇩🇪"),
+    ("france", "🇫🇷"),
+    ("french", "🇫🇷"),
+    ("fr", "🇫🇷"),
+    ("netherlands", "🇳🇱"),
+    ("nl", "🇳🇱"),
+    ("usa", "🇺🇸"),
+    ("united states", "🇺🇸"),
+    ("uk", "🇬🇧"),
+    ("united kingdom", "🇬🇧"),
+    ("poland", "🇵🇱"),
+    ("pl", "🇵🇱"),
+    ("spain", "🇪🇸"),
+    ("es", "🇪🇸"),
+    ("italy", "🇮🇹"),
+    ("it", "🇮🇹"),
+    ("turkey", "🇹🇷"),
+    ("tr", "🇹🇷"),
+    ("russia", "🇷🇺"),
+    ("ru", "🇷🇺"),
+    ("kazakhstan", "🇰🇿"),
+    ("kz", "🇰🇿"),
+    ("ukraine", "🇺🇦"),
+    ("ua", "🇺🇦"),
+)
+
+DEFAULT_FLAG = "🌍"
+
+
+def location_flag(location: str) -> str:
+    """
+    Получить флаг страны по названию локации.
+
+    Args:
+        location: Название локации
+
+    Returns:
+        Эмодзи флага
+    """
+    location_lower = (location or "").lower()
+    for key, flag in LOCATION_FLAGS:
+        if key in location_lower:
+            return flag
+    return DEFAULT_FLAG
@@ -4,11 +4,14 @@
 """
 
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
+from aiogram import Bot
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
 
+from app.utils.sender import chunked_ids, outbound
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,19 +47,42 @@ async def delete_messages_safe(messages: List[Message]) -> int:
     """
     Безопасное удаление списка сообщений.
 
+    Сообщения одного чата удаляются пачками через deleteMessages.
+
     Args:
         messages: Список сообщений для удаления
 
     Returns:
         Количество успешно удалённых сообщений
     """
-    deleted_count = 0
+    by_chat: Dict[Tuple[int, int], Tuple[Bot, List[int]]] = {}
     for msg in messages:
-        if await delete_message_safe(msg):
-            deleted_count += 1
+        key = (msg.bot.id, msg.chat.id)
+        by_chat.setdefault(key, (msg.bot, []))[1].append(msg.message_id)
+
+    deleted_count = 0
+    for (_, chat_id), (bot, message_ids) in by_chat.items():
+        for chunk in chunked_ids(message_ids):
+            try:
+                await bot.delete_messages(chat_id, chunk)
+                deleted_count += len(chunk)
+            except TelegramBadRequest as e:
+                logger.debug(f"Сообщения уже удалены или не могут быть удалены: {e}")
+            except Exception as e:
+                logger.warning(f"Неожиданная ошибка при удалении сообщений: {e}")
     return deleted_count
 
 
+def delete_later(message: Message) -> None:
+    """
+    Удалить сообщение в фоне, вместе с другими удалениями этого чата.
+
+    Args:
+        message: Сообщение для удаления
+    """
+    outbound.delete_later(message.bot, message.chat.id, message.message_id)
+
+
 async def edit_or_delete_safe(message: Message, new_text: str, **kwargs) -> bool:
     """
     Попытка отредактировать сообщение, а при неудаче - удалить его.
@@ -128,7 +154,7 @@ class MessageCleaner:
             keep_last: Сколько последних сообщений сохранить
 
         Returns:
-            Количество удалённых сообщений
+            Количество сообщений, поставленных в очередь на удаление
         """
         if user_id not in cls._storage:
             return 0
@@ -142,12 +168,10 @@ class MessageCleaner:
             cls._storage[user_id][-keep_last:] if keep_last > 0 else []
         )
 
-        deleted_count = 0
         for msg in messages_to_delete:
-            if await delete_message_safe(msg):
-                deleted_count += 1
+            delete_later(msg)
 
-        return deleted_count
+        return len(messages_to_delete)
 
     @classmethod
     async def clear_old_messages(cls, user_id: int, max_messages: int = 3) -> int:
@@ -159,7 +183,7 @@ class MessageCleaner:
             max_messages: Максимальное количество сообщений для хранения
 
         Returns:
-            Количество удалённых сообщений
+            Количество сообщений, поставленных в очередь на удаление
         """
         if user_id not in cls._storage or len(cls._storage[user_id]) <= max_messages:
             return 0
@@ -167,12 +191,10 @@ class MessageCleaner:
         messages_to_delete = cls._storage[user_id][:-max_messages]
         cls._storage[user_id] = cls._storage[user_id][-max_messages:]
 
-        deleted_count = 0
         for msg in messages_to_delete:
-            if await delete_message_safe(msg):
-                deleted_count += 1
+            delete_later(msg)
 
-        return deleted_count
+        return len(messages_to_delete)
 
     @classmethod
     def get_last_message(cls, user_id: int) -> Optional[Message]:
@@ -0,0 +1,347 @@
+"""
+Планировщик исходящих запросов к Telegram.
+
+Подключается к сессии бота как request-middleware, поэтому через него
+проходят все message.answer, bot.send_message, правки и удаления без
+изменения хендлеров. Запросы к чатам ограничиваются token bucket'ами:
+общим на бота (SEND_GLOBAL_RATE в секунду) и отдельным на каждый чат
+для новых сообщений (SEND_CHAT_RATE для личных чатов, SEND_GROUP_RATE в
+минуту для групп). Не более SEND_CONCURRENCY запросов выполняются
+одновременно. На TelegramRetryAfter планировщик приостанавливает все
+запросы бота на retry_after секунд и повторяет запрос.
+
+Удаления, поставленные через delete_later, копятся SEND_DELETE_DELAY
+секунд и уходят одним deleteMessages на чат (до 100 сообщений).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Запросов к чатам в секунду на бота
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+# Новых сообщений в секунду в личный чат и допустимый всплеск
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+# Новых сообщений в минуту в группу
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", "20"))
+# Одновременно выполняемых запросов к чатам
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "8"))
+# Повторов после TelegramRetryAfter
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+# Сколько копить удаления перед отправкой пачкой (с)
+SEND_DELETE_DELAY = float(os.getenv("SEND_DELETE_DELAY", "0.5"))
+# Период записи метрик в лог (с), 0 — отключить
+SEND_STATS_INTERVAL = float(os.getenv("SEND_STATS_INTERVAL", "300"))
+
+# Методы, создающие сообщения: на них действует лимит чата
+MESSAGE_METHOD_PREFIXES = ("send", "copy", "forward")
+# Лимит deleteMessages
+DELETE_BATCH_SIZE = 100
+# Сколько бакетов чатов держать до очистки простаивающих
+CHAT_BUCKETS_LIMIT = 10000
+
+
+class TokenBucket:
+    """Token bucket с резервированием: каждый вызов забирает один токен."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """
+        Инициализация бакета.
+
+        Args:
+            rate: Пополнение, токенов в секунду
+            capacity: Максимальный запас токенов (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Забрать токен.
+
+        Returns:
+            Сколько секунд подождать, прежде чем им воспользоваться
+        """
+        self._refill()
+        self._tokens -= 1
+        return max(-self._tokens / self.rate, 0.0)
+
+    def set_rate(self, rate: float, capacity: float) -> None:
+        """Сменить скорость и запас, не сбрасывая накопленный долг."""
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = min(self._tokens, capacity)
+
+    def is_idle(self) -> bool:
+        """Бакет полон: его можно удалить без потери лимита."""
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Rate limiting, обработка flood control и пакетные удаления."""
+
+    def __init__(self) -> None:
+        self.global_rate = SEND_GLOBAL_RATE
+        # Процессов, делящих лимит бота, и доля лимита, отданная рассылке
+        self._parts = 1
+        self._reserved = 0.0
+        self._global: Dict[int, TokenBucket] = {}
+        self._chats: Dict[Tuple[int, int], TokenBucket] = {}
+        self._paused_until: Dict[int, float] = {}
+        self._semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+        # (bot_id, chat_id) -> (бот, id сообщений к удалению)
+        self._deletes: Dict[Tuple[int, int], Tuple[Bot, Set[int]]] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        self._queued = 0
+        self._in_flight = 0
+        self._counters: Dict[str, int] = {
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "deleted": 0,
+            "delete_batches": 0,
+        }
+        self._logged: Dict[str, int] = {}
+
+    def share_global_limit(self, parts: int) -> None:
+        """
+        Поделить общий лимит бота между parts процессами.
+
+        Args:
+            parts: Количество процессов, отправляющих от имени бота
+        """
+        self._parts = max(parts, 1)
+        self._apply_global_limit()
+
+    def reserve_global_rate(self, rate: float) -> None:
+        """
+        Отдать часть общего лимита бота отправителю в другом процессе.
+
+        Рассылку админ-бот шлёт токеном пользовательского бота, поэтому на
+        время рассылки пользовательский бот уменьшает свой лимит на её
+        скорость, и в сумме запросов не больше SEND_GLOBAL_RATE.
+
+        Args:
+            rate: Запросов в секунду, отданных другому процессу (0 — вернуть)
+        """
+        if rate != self._reserved:
+            self._reserved = rate
+            self._apply_global_limit()
+            logger.info(
+                f"Лимит отправки: {self.global_rate:g}/с на процесс, "
+                f"отдано рассылке {rate:g}/с"
+            )
+
+    def _apply_global_limit(self) -> None:
+        # Не меньше запроса в секунду на бота, даже если рассылка забрала всё
+        rate = max(SEND_GLOBAL_RATE - self._reserved, 1.0)
+        self.global_rate = rate / self._parts
+        for bucket in self._global.values():
+            bucket.set_rate(self.global_rate, max(self.global_rate, 1))
+
+    # --- Лимиты --------------------------------------------------------------
+
+    def _global_bucket(self, bot_id: int) -> TokenBucket:
+        bucket = self._global.get(bot_id)
+        if bucket is None:
+            bucket = TokenBucket(self.global_rate, max(self.global_rate, 1))
+            self._global[bot_id] = bucket
+        return bucket
+
+    def _chat_bucket(self, bot_id: int, chat_id: int) -> TokenBucket:
+        key = (bot_id, chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_LIMIT:
+                self._chats = {k: b for k, b in self._chats.items() if not b.is_idle()}
+            if chat_id < 0:
+                bucket = TokenBucket(SEND_GROUP_RATE / 60, SEND_CHAT_BURST)
+            else:
+                bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+            self._chats[key] = bucket
+        return bucket
+
+    async def _wait_pause(self, bot_id: int) -> None:
+        while True:
+            pause = self._paused_until.get(bot_id, 0) - time.monotonic()
+            if pause <= 0:
+                return
+            await asyncio.sleep(pause)
+
+    async def _wait_turn(self, bot_id: int, chat_id: int, api_method: str) -> None:
+        await self._wait_pause(bot_id)
+        delay = self._global_bucket(bot_id).reserve()
+        if api_method.startswith(MESSAGE_METHOD_PREFIXES):
+            delay = max(delay, self._chat_bucket(bot_id, chat_id).reserve())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Пока ждали токен, Telegram мог попросить паузу
+        await self._wait_pause(bot_id)
+
+    def _pause(self, bot_id: int, retry_after: float) -> None:
+        until = time.monotonic() + retry_after
+        if until > self._paused_until.get(bot_id, 0):
+            self._paused_until[bot_id] = until
+
+    # --- Middleware ----------------------------------------------------------
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int):
+            # getUpdates, answerCallbackQuery, inline-сообщения и т.п.
+            return await make_request(bot, method)
+
+        api_method = method.__api_method__
+        attempt = 0
+        while True:
+            self._queued += 1
+            try:
+                await self._wait_turn(bot.id, chat_id, api_method)
+            finally:
+                self._queued -= 1
+
+            async with self._semaphore:
+                self._in_flight += 1
+                try:
+                    response = await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    if attempt == SEND_MAX_RETRIES:
+                        self._counters["failed"] += 1
+                        raise
+                    attempt += 1
+                    self._counters["retried"] += 1
+                    self._pause(bot.id, e.retry_after)
+                    logger.warning(
+                        f"Flood control: {api_method} в чат {chat_id}, "
+                        f"пауза {e.retry_after} с"
+                    )
+                    continue
+                finally:
+                    self._in_flight -= 1
+
+            self._counters["sent"] += 1
+            return response
+
+    # --- Пакетные удаления ---------------------------------------------------
+
+    def delete_later(self, bot: Bot, chat_id: int, message_id: int) -> None:
+        """
+        Поставить сообщение в очередь на удаление.
+
+        Удаления одного чата копятся SEND_DELETE_DELAY секунд и
+        выполняются одним запросом. Ошибки удаления только логируются.
+
+        Args:
+            bot: Бот, отправивший сообщение
+            chat_id: ID чата
+            message_id: ID сообщения
+        """
+        key = (bot.id, chat_id)
+        pending = self._deletes.get(key)
+        if pending is None:
+            pending = (bot, set())
+            self._deletes[key] = pending
+            task = asyncio.create_task(self._flush_later(key))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        pending[1].add(message_id)
+
+    async def _flush_later(self, key: Tuple[int, int]) -> None:
+        await asyncio.sleep(SEND_DELETE_DELAY)
+        await self._flush(key)
+
+    async def _flush(self, key: Tuple[int, int]) -> None:
+        pending = self._deletes.pop(key, None)
+        if pending is None:
+            return
+        bot, message_ids = pending
+        chat_id = key[1]
+        for chunk in chunked_ids(message_ids):
+            try:
+                await bot.delete_messages(chat_id, chunk)
+                self._counters["deleted"] += len(chunk)
+            except TelegramBadRequest as e:
+                logger.debug(f"Сообщения чата {chat_id} не удалены: {e}")
+            except Exception as e:
+                logger.warning(f"Ошибка при удалении сообщений чата {chat_id}: {e}")
+            self._counters["delete_batches"] += 1
+
+    async def close(self) -> None:
+        """Выполнить накопленные удаления (при остановке бота)."""
+        for task in list(self._flushes):
+            task.cancel()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        for key in list(self._deletes):
+            await self._flush(key)
+
+    # --- Метрики -------------------------------------------------------------
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Текущее состояние планировщика.
+
+        Returns:
+            queued — ждут токена или паузы, in_flight — выполняются,
+            pending_deletes — сообщений в очереди на удаление, а также
+            накопительные счётчики sent, retried, failed, deleted,
+            delete_batches
+        """
+        return {
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "pending_deletes": sum(len(ids) for _, ids in self._deletes.values()),
+            "chats": len(self._chats),
+            **self._counters,
+        }
+
+    async def log_stats(self) -> None:
+        """Записать метрики в лог, если с прошлого раза была активность."""
+        stats = self.stats()
+        if stats["queued"] == 0 and self._counters == self._logged:
+            return
+        self._logged = dict(self._counters)
+        logger.info(
+            "Исходящие: "
+            + ", ".join(f"{name}={value}" for name, value in stats.items())
+        )
+
+
+def chunked_ids(message_ids: Iterable[int]) -> List[List[int]]:
+    """Разбить id сообщений на пачки для deleteMessages."""
+    ids = sorted(set(message_ids))
+    return [
+        ids[i : i + DELETE_BATCH_SIZE] for i in range(0, len(ids), DELETE_BATCH_SIZE)
+    ]
+
+
+outbound = OutboundScheduler()
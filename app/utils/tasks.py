@@ -0,0 +1,55 @@
+"""
+Фоновые периодические задачи бота.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+
+async def run_periodic(
+    func: Callable[[], Awaitable[object]], interval: float, name: str
+) -> None:
+    """
+    Выполнять func каждые interval секунд до отмены задачи.
+
+    Ошибка одного запуска логируется и не останавливает цикл.
+    """
+    while True:
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Фоновая задача {name} завершилась с ошибкой: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_periodic(
+    func: Callable[[], Awaitable[object]], interval: float, name: str
+) -> None:
+    """
+    Запустить периодическую задачу в текущем event loop.
+
+    Args:
+        func: Корутинная функция без аргументов
+        interval: Период в секундах (0 или меньше — задача отключена)
+        name: Имя задачи для логов
+    """
+    if interval <= 0:
+        logger.info(f"Фоновая задача {name} отключена")
+        return
+    _tasks.append(asyncio.create_task(run_periodic(func, interval, name), name=name))
+    logger.info(f"Фоновая задача {name} запущена, период {interval:.0f} с")
+
+
+async def stop_background_tasks() -> None:
+    """Отменить все запущенные фоновые задачи."""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
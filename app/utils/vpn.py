@@ -4,6 +4,112 @@
 
 import json
 import urllib.parse
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+# Префикс имени ключа в клиенте (до email)
+LINK_NAME_PREFIX = urllib.parse.quote("🇩🇪 reality-")
+
+
+def _quote(value: Any) -> str:
+    """URL-кодирование параметра ссылки ('/' оставляем как есть)."""
+    return urllib.parse.quote(str(value), safe="/")
+
+
+def _parse_stream_settings(stream_settings: Union[str, Dict[str, Any], None]) -> dict:
+    if isinstance(stream_settings, dict):
+        return stream_settings
+    return json.loads(stream_settings or "{}")
+
+
+def _port_from_settings(stream_settings: Dict[str, Any], default_port: int) -> int:
+    external_proxies = stream_settings.get("externalProxy", [])
+    if external_proxies:
+        return external_proxies[0].get("port", default_port)
+    return default_port
+
+
+@dataclass(frozen=True)
+class VlessLinkTemplate:
+    """
+    Предвычисленный шаблон VLESS Reality ссылки для одного inbound'а.
+
+    Параметры Reality извлекаются и кодируются один раз, после чего
+    ссылка для клиента собирается только форматированием строки.
+    """
+
+    host: str
+    port: int
+    pbk: str
+    sid: str
+    fp: str
+    spx: str
+    sni: str
+    # "@host:port?...#<префикс имени>" — всё, кроме uuid и email
+    tail: str
+
+    @classmethod
+    def build(
+        cls,
+        base_host: str,
+        stream_settings: Union[str, Dict[str, Any], None],
+        default_port: int = 443,
+    ) -> "VlessLinkTemplate":
+        """
+        Собрать шаблон из настроек stream inbound'а.
+
+        Args:
+            base_host: Хост сервера
+            stream_settings: JSON-строка или уже разобранный dict streamSettings
+            default_port: Порт, если в настройках нет externalProxy
+
+        Returns:
+            VlessLinkTemplate
+        """
+        settings = _parse_stream_settings(stream_settings)
+        reality_settings = settings.get("realitySettings", {})
+        reality_client = reality_settings.get("settings", {})
+
+        port = _port_from_settings(settings, default_port)
+        pbk = _quote(reality_client.get("publicKey", ""))
+        sid = _quote((reality_settings.get("shortIds") or [""])[0])
+        fp = _quote(reality_client.get("fingerprint", "random"))
+        spx = _quote(reality_client.get("spiderX", "/"))
+        sni = _quote((reality_settings.get("serverNames") or [""])[0])
+
+        tail = (
+            f"@{base_host}:{port}?"
+            f"type=tcp&encryption=none&security=reality&pbk={pbk}&fp={fp}&sni={sni}&sid={sid}&spx={spx}&flow=xtls-rprx-vision"
+            f"#{LINK_NAME_PREFIX}"
+        )
+        return cls(
+            host=base_host,
+            port=port,
+            pbk=pbk,
+            sid=sid,
+            fp=fp,
+            spx=spx,
+            sni=sni,
+            tail=tail,
+        )
+
+    def render(self, uuid: str, email: str) -> str:
+        """Ссылка для клиента с заданными uuid и email."""
+        return f"vless://{uuid}{self.tail}{urllib.parse.quote(email)}"
+
+    def render_many(self, clients: Iterable[Tuple[str, str]]) -> List[str]:
+        """
+        Пакетная генерация ссылок (для перегенерации ключей).
+
+        Args:
+            clients: Пары (uuid, email)
+
+        Returns:
+            Список ссылок в том же порядке
+        """
+        tail = self.tail
+        quote = urllib.parse.quote
+        return [f"vless://{uuid}{tail}{quote(email)}" for uuid, email in clients]
 
 
 def generate_vless_link(
@@ -12,6 +118,8 @@ def generate_vless_link(
     """
     Генерация VLESS Reality ссылки.
 
+    Для массовой генерации используйте VlessLinkTemplate.
+
     Args:
         uuid: UUID клиента
         base_host: Хост сервера
@@ -22,20 +130,11 @@ def generate_vless_link(
     Returns:
         VLESS ссылка для подключения
     """
-    stream_settings = json.loads(stream_settings_str or "{}")
-    reality_settings = stream_settings.get("realitySettings", {})
-    pbk = reality_settings.get("settings", {}).get("publicKey", "")
-    sid = reality_settings.get("shortIds", [""])[0]
-    fp = reality_settings.get("settings", {}).get("fingerprint", "random")
-    spx = reality_settings.get("settings", {}).get("spiderX", "/")
-    sni = reality_settings.get("serverNames", [""])[0]
-
-    name_encoded = urllib.parse.quote(f"🇩🇪 reality-{email}")
-
-    return (
-        f"vless://{uuid}@{base_host}:{port}?"
-        f"type=tcp&encryption=none&security=reality&pbk={pbk}&fp={fp}&sni={sni}&sid={sid}&spx={spx}&flow=xtls-rprx-vision"
-        f"#{name_encoded}"
+    settings = _parse_stream_settings(stream_settings_str)
+    # Порт передан явно — не даём шаблону подменить его значением из externalProxy
+    settings = {k: v for k, v in settings.items() if k != "externalProxy"}
+    return VlessLinkTemplate.build(base_host, settings, default_port=port).render(
+        uuid, email
     )
 
 
@@ -80,10 +179,4 @@ def get_port_from_stream(stream_settings_str: str, default_port: int = 443) -> i
     if not stream_settings_str:
         return default_port
 
-    stream_settings = json.loads(stream_settings_str)
-    external_proxies = stream_settings.get("externalProxy", [])
-
-    if external_proxies:
-        return external_proxies[0].get("port", default_port)
-
-    return default_port
+    return _port_from_settings(json.loads(stream_settings_str), default_port)
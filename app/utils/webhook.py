@@ -0,0 +1,229 @@
+"""
+Режим webhook: приём апдейтов по HTTP и обработка в нескольких процессах.
+
+Основной процесс поднимает aiohttp-сервер на WEBHOOK_PORT, регистрирует
+webhook в Telegram и раскладывает апдейты по WEBHOOK_WORKERS процессам
+по хэшу from_user.id: все апдейты пользователя попадают в один процесс и
+обрабатываются там строго по очереди, разные пользователи — параллельно.
+
+По SIGTERM/SIGINT сервер перестаёт принимать запросы, воркеры дорабатывают
+очередь и начатые хендлеры, выполняют shutdown диспетчера и завершаются.
+Недоставленные апдейты Telegram повторит сам, когда бот снова поднимется.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# polling — один процесс с getUpdates, webhook — этот модуль
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Публичный адрес бота (https://bot.example.com) и путь webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Количество процессов-обработчиков
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+# Одновременно обрабатываемых апдейтов в одном процессе
+WEBHOOK_WORKER_TASKS = int(os.getenv("WEBHOOK_WORKER_TASKS", "100"))
+# Сколько ждать завершения воркеров при остановке (с)
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_owner(update: Dict[str, Any]) -> Optional[int]:
+    """
+    ID пользователя (или чата), которому принадлежит апдейт.
+
+    Args:
+        update: Апдейт Telegram в виде словаря
+
+    Returns:
+        from.id, user.id или chat.id первого объекта апдейта; None, если их нет
+    """
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        sender = event.get("from") or event.get("user") or event.get("chat")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return None
+
+
+def worker_index(update: Dict[str, Any], workers: int) -> int:
+    """Номер процесса, обрабатывающего апдейт."""
+    owner = update_owner(update)
+    key = owner if owner is not None else update.get("update_id", 0)
+    return hash(key) % workers
+
+
+# --- Процесс-обработчик ----------------------------------------------------
+
+
+async def run_worker(bot: Bot, dp: Dispatcher, queue: Queue, index: int) -> None:
+    """
+    Обрабатывать апдейты из очереди до получения None.
+
+    Апдейты одного пользователя выполняются последовательно, не более
+    WEBHOOK_WORKER_TASKS апдейтов одновременно.
+
+    Args:
+        bot: Бот процесса
+        dp: Диспетчер процесса
+        queue: Очередь апдейтов от основного процесса
+        index: Номер воркера (фоновые задачи запускает только нулевой)
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(WEBHOOK_WORKER_TASKS)
+    # owner -> последний апдейт пользователя в обработке
+    tails: Dict[int, asyncio.Task] = {}
+    running: Set[asyncio.Task] = set()
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    async def process(update: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await dp.feed_raw_update(bot, update, **workflow_data)
+        except Exception:
+            logger.exception(f"Ошибка обработки апдейта {update.get('update_id')}")
+        finally:
+            semaphore.release()
+
+    def forget(owner: int, task: asyncio.Task) -> None:
+        running.discard(task)
+        if tails.get(owner) is task:
+            del tails[owner]
+
+    await dp.emit_startup(bot=bot, background_tasks=index == 0, **workflow_data)
+    logger.info(f"Воркер {index} запущен (pid {os.getpid()})")
+
+    while True:
+        update = await loop.run_in_executor(None, queue.get)
+        if update is None:
+            break
+
+        await semaphore.acquire()
+        owner = update_owner(update)
+        task = asyncio.create_task(process(update, tails.get(owner)))
+        running.add(task)
+        if owner is None:
+            task.add_done_callback(running.discard)
+        else:
+            tails[owner] = task
+            task.add_done_callback(lambda t, owner=owner: forget(owner, t))
+
+    logger.info(f"Воркер {index}: дорабатываем {len(running)} апдейтов")
+    if running:
+        await asyncio.wait(list(running))
+
+    await dp.emit_shutdown(bot=bot, **workflow_data)
+    await bot.session.close()
+    logger.info(f"Воркер {index} остановлен")
+
+
+def ignore_termination_signals() -> None:
+    """Остановкой воркера управляет основной процесс, а не сигналы."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+# --- Основной процесс ------------------------------------------------------
+
+
+def _join(processes: List[BaseProcess], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(deadline - time.monotonic(), 0))
+    for process in processes:
+        if process.is_alive():
+            logger.warning(f"{process.name} не завершился за {timeout:.0f} с")
+            process.terminate()
+
+
+async def serve_webhook(
+    bot: Bot, dp: Dispatcher, worker_target: Callable[[int, Queue], None]
+) -> None:
+    """
+    Принимать апдейты по webhook и раздавать их процессам-обработчикам.
+
+    Args:
+        bot: Бот основного процесса (регистрирует webhook)
+        dp: Диспетчер (нужен для списка используемых типов апдейтов)
+        worker_target: Функция уровня модуля, запускающая воркер:
+            worker_target(index, queue)
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_URL")
+
+    workers = max(WEBHOOK_WORKERS, 1)
+    ctx = multiprocessing.get_context("spawn")
+    queues: List[Queue] = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(
+            target=worker_target,
+            args=(index, queue),
+            name=f"webhook-worker-{index}",
+            daemon=True,
+        )
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        queues[worker_index(update, workers)].put_nowait(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(
+        f"Webhook {WEBHOOK_PATH} слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}, "
+        f"воркеров: {workers}"
+    )
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    # Сначала перестаём принимать апдейты, затем дорабатываем очереди
+    logger.info("Остановка: приём апдейтов закрыт, ждём воркеры")
+    await runner.cleanup()
+    for queue in queues:
+        queue.put(None)
+    await loop.run_in_executor(None, _join, processes, WEBHOOK_DRAIN_TIMEOUT)
+    await bot.session.close()
+    logger.info("Webhook остановлен")
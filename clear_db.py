@@ -1,58 +1,130 @@
+"""
+Очистка БД и удаление клиентов подписок с панелей 3x-ui.
+Запуск: python clear_db.py [--concurrency N]
+"""
+import argparse
 import asyncio
-from typing import Dict, List
+import time
+from typing import Optional, Set
 
-from sqlalchemy import select, delete
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, delete, func
 
+from app.api.pool import client_pool
 from app.database.models import async_session, Subscription, Server, User, Payment
-from app.api.three_x_ui import ThreeXUIClient
+from app.services.cleanup import CLEANUP_CONCURRENCY, PurgeReport, purge_server_clients
 
+# Подписок, читаемых из БД за одну выборку
+STREAM_BATCH_SIZE = 1000
+# Период вывода прогресса (с)
+PROGRESS_INTERVAL = 5
 
-async def remove_subscriptions_from_3xui() -> None:
+
+class Progress:
+    """Счётчик обработанных клиентов со скоростью обработки."""
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+
+    def add(self, count: int) -> None:
+        self.done += count
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        return (
+            f"  … обработано {self.done} из {self.total} клиентов "
+            f"({rate:.0f}/с, прошло {elapsed:.0f} с)"
+        )
+
+
+async def _print_progress(progress: Progress) -> None:
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        print(progress.line())
+
+
+async def remove_subscriptions_from_3xui(concurrency: int = CLEANUP_CONCURRENCY) -> PurgeReport:
     """
-    Проходит по всем подпискам в БД и пытается удалить
-    соответствующих клиентов из панелей 3x-ui.
+    Удаляет из панелей 3x-ui клиентов всех подписок БД.
+
+    Подписки читаются потоком, упорядоченными по серверу: очистка сервера
+    начинается, как только прочитаны все его подписки, и идёт параллельно
+    с остальными (не более concurrency серверов одновременно).
     """
     async with async_session() as session:
-        result = await session.execute(
-            select(Subscription).options(selectinload(Subscription.server))
+        servers = {server.id: server for server in (await session.scalars(select(Server))).all()}
+        total = await session.scalar(select(func.count(Subscription.id))) or 0
+
+    report = PurgeReport()
+    if not total:
+        print("В БД нет подписок для удаления из 3x-ui.")
+        return report
+
+    print(f"Подписок: {total}, серверов: {len(servers)}, одновременно: {concurrency}")
+    progress = Progress(total)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    tasks = []
+
+    async def _purge(server: Server, uuids: Set[str]) -> None:
+        nonlocal report
+        started = time.monotonic()
+        try:
+            print(f"\nОбработка сервера {server.name} ({server.api_url}), клиентов: {len(uuids)}")
+            try:
+                result = await purge_server_clients(server, uuids, progress.add)
+            except Exception as e:
+                print(f"❌ Ошибка при очистке сервера {server.name}: {e}")
+                result = PurgeReport(failed=len(uuids))
+        finally:
+            semaphore.release()
+
+        report += result
+        elapsed = time.monotonic() - started
+        mark = "⚠️" if result.failed else "✅"
+        print(
+            f"  {mark} {server.name}: удалено {result.removed}, уже отсутствовали {result.absent}, "
+            f"ошибок {result.failed} за {elapsed:.1f} с ({len(uuids) / max(elapsed, 0.001):.0f}/с)"
         )
-        subscriptions: List[Subscription] = result.scalars().all()
 
-        if not subscriptions:
-            print("В БД нет подписок для удаления из 3x-ui.")
+    async def _dispatch(server_id: Optional[int], uuids: Set[str]) -> None:
+        server = servers.get(server_id)
+        if server is None:
+            # Сервер удалён из БД — клиентов негде искать
+            print(f"\nПропускаю {len(uuids)} подписок без сервера (server_id={server_id}).")
+            progress.add(len(uuids))
             return
-
-        # Группируем подписки по серверу, чтобы переиспользовать соединение
-        subs_by_server: Dict[int, List[Subscription]] = {}
-        for sub in subscriptions:
-            if not sub.server:
-                # На всякий случай пропускаем, если у подписки нет связанного сервера
-                continue
-            subs_by_server.setdefault(sub.server.id, []).append(sub)
-
-        for server_id, subs in subs_by_server.items():
-            server: Server = subs[0].server
-            print(f"\nОбработка сервера {server.name} ({server.api_url}), подписок: {len(subs)}")
-
-            client = ThreeXUIClient(server.api_url, server.username, server.password)
-            logged_in = await client.login()
-            if not logged_in:
-                print(f"❌ Не удалось авторизоваться в 3x-ui для сервера {server.name}, пропускаю его подписки.")
-                await client.close()
-                continue
-
-            for sub in subs:
-                try:
-                    ok = await client.delete_client(sub.inbound_id, sub.uuid)
-                    if ok:
-                        print(f"  ✅ Удалён клиент из 3x-ui: user_id={sub.user_id}, uuid={sub.uuid}")
-                    else:
-                        print(f"  ⚠️ Не удалось удалить клиента в 3x-ui: user_id={sub.user_id}, uuid={sub.uuid}")
-                except Exception as e:
-                    print(f"  ⚠️ Ошибка при удалении клиента в 3x-ui (uuid={sub.uuid}): {e}")
-
-            await client.close()
+        # Ждём свободный слот до чтения следующего сервера: в памяти не больше
+        # concurrency наборов uuid
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(_purge(server, uuids)))
+
+    reporter = asyncio.create_task(_print_progress(progress))
+    try:
+        async with async_session() as session:
+            result = await session.stream(
+                select(Subscription.server_id, Subscription.uuid)
+                .order_by(Subscription.server_id)
+                .execution_options(yield_per=STREAM_BATCH_SIZE)
+            )
+            current_id, uuids = None, set()
+            async for server_id, uuid in result:
+                if server_id != current_id and uuids:
+                    await _dispatch(current_id, uuids)
+                    uuids = set()
+                current_id = server_id
+                uuids.add(uuid)
+            if uuids:
+                await _dispatch(current_id, uuids)
+
+        await asyncio.gather(*tasks)
+    finally:
+        reporter.cancel()
+        await client_pool.close_all()
+
+    print(progress.line())
+    return report
 
 
 async def clear_database() -> None:
@@ -74,11 +146,15 @@ async def clear_database() -> None:
     print("\nБаза данных очищена (users, payments, subscriptions).")
 
 
-async def main() -> None:
+async def main(args: argparse.Namespace) -> None:
     print("⚠️ ВНИМАНИЕ: будет выполнена очистка БД и попытка удалить все подписки из 3x-ui.")
 
     # 1. Удаляем клиентов из 3x-ui
-    await remove_subscriptions_from_3xui()
+    report = await remove_subscriptions_from_3xui(args.concurrency)
+    print(
+        f"\nКлиенты 3x-ui: удалено {report.removed}, уже отсутствовали {report.absent}, "
+        f"ошибок {report.failed}"
+    )
 
     # 2. Очищаем БД
     await clear_database()
@@ -87,5 +163,6 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
-
+    parser = argparse.ArgumentParser(description="Clear the DB and remove its clients from 3x-ui panels")
+    parser.add_argument("--concurrency", type=int, default=CLEANUP_CONCURRENCY, help="servers processed in parallel")
+    asyncio.run(main(parser.parse_args()))
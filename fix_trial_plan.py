@@ -7,6 +7,7 @@ from sqlalchemy import select
 sys.path.append(os.getcwd())
 load_dotenv()
 
+from app.database.catalogue import bump_catalogue_version
 from app.database.models import async_session, Plan
 
 async def fix_trial():
@@ -20,6 +21,7 @@ async def fix_trial():
             print(f"Updating trial plan {trial.name} (ID: {trial.id})")
             trial.data_limit_gb = 15
             trial.duration_days = 7
+            await bump_catalogue_version(session)
             await session.commit()
             print("Trial plan updated to 15GB, 7 days.")
         else:
@@ -32,6 +34,7 @@ async def fix_trial():
                 data_limit_gb=15
             )
             session.add(new_trial)
+            await bump_catalogue_version(session)
             await session.commit()
             print("New Trial plan created.")
 
@@ -12,7 +12,9 @@ from dotenv import load_dotenv
 # Добавляем корень проекта в path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database.models import create_tables, Plan, Admin, Server, async_session
+from app.database.catalogue import bump_catalogue_version
+from app.database.migrations import migrate
+from app.database.models import Plan, Admin, Server, async_session
 from sqlalchemy import select, delete
 
 load_dotenv()
@@ -56,6 +58,7 @@ async def _update_plans(session):
         plan = Plan(**plan_data)
         session.add(plan)
     
+    await bump_catalogue_version(session)
     await session.commit()
     logger.info(f"Обновлено {len(EXPECTED_PLANS)} тарифов.")
 
@@ -64,7 +67,7 @@ async def init_database():
     """Инициализация базы данных."""
 
     logger.info("Создание таблиц...")
-    await create_tables()
+    await migrate()
     logger.info("Таблицы созданы успешно.")
 
     # Проверка и обновление тарифов
@@ -107,6 +110,7 @@ async def init_database():
                 max_clients=max_clients
             )
             session.add(server)
+            await bump_catalogue_version(session)
             await session.commit()
             logger.info(f"Добавлен сервер: {server_name} ({location})")
         elif existing_servers:
@@ -1,21 +1,40 @@
-import sqlite3
+"""
+Миграция базы до текущей версии схемы.
+Работает с той же базой, что и боты (DATABASE_URL): SQLite или PostgreSQL.
+Запуск: python migrate_db.py [status]
+"""
+import asyncio
+import logging
 import os
+import sys
 
-db_path = 'db.sqlite3'
-
-if os.path.exists(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("ALTER TABLE users ADD COLUMN received_bonus BOOLEAN DEFAULT 0")
-        conn.commit()
-        print("Successfully added received_bonus column to users table.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower():
-            print("Column received_bonus already exists.")
-        else:
-            print(f"Error: {e}")
-    finally:
-        conn.close()
-else:
-    print("Database file not found.")
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+load_dotenv()
+
+from app.database.migrations import MIGRATIONS, SCHEMA_VERSION, get_schema_version, migrate
+from app.database.models import engine
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+async def status() -> None:
+    current = await get_schema_version()
+    print(f"Schema version: {current} (latest: {SCHEMA_VERSION})")
+    for migration in MIGRATIONS:
+        mark = "x" if migration.version <= current else " "
+        print(f"  [{mark}] {migration.version:>3} {migration.name}")
+
+
+async def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        await status()
+    else:
+        applied = await migrate()
+        print(f"Applied {applied} migration(s), schema version {SCHEMA_VERSION}.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
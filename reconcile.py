@@ -0,0 +1,44 @@
+"""
+Сверка подписок из БД с клиентами на панелях 3x-ui.
+Запуск: python reconcile.py [--dry-run] [--delete-orphans] [--concurrency N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+load_dotenv()
+
+from app.api.pool import client_pool
+from app.services.reconcile import RECONCILE_CONCURRENCY, reconcile_all
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        report = await reconcile_all(
+            delete_orphans=args.delete_orphans,
+            dry_run=args.dry_run,
+            concurrency=args.concurrency,
+        )
+    finally:
+        await client_pool.close_all()
+
+    print(f"In sync:  {report.in_sync}")
+    print(f"Updated:  {report.updated}")
+    print(f"Created:  {report.created}")
+    print(f"Orphaned: {report.orphaned} (deleted: {report.deleted})")
+    print(f"Failed:   {report.failed} (unreachable servers: {report.servers_failed})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile subscriptions with 3x-ui panels")
+    parser.add_argument("--dry-run", action="store_true", help="only report the differences")
+    parser.add_argument("--delete-orphans", action="store_true", help="remove panel clients that have no subscription")
+    parser.add_argument("--concurrency", type=int, default=RECONCILE_CONCURRENCY, help="servers processed in parallel")
+    asyncio.run(main(parser.parse_args()))
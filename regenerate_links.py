@@ -0,0 +1,99 @@
+"""
+Перегенерация VLESS-ключей (key_url) всех подписок.
+
+Нужна после смены Reality-ключей, SNI или порта на inbound'е: ссылки
+собираются пакетно по шаблону inbound'а и записываются в БД пачками.
+"""
+import asyncio
+import logging
+import os
+import sys
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+load_dotenv()
+
+from app.api.inbounds import inbound_catalogue
+from app.api.pool import client_pool
+from app.database.models import async_session, Server, Subscription
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+async def regenerate_server(server: Server) -> int:
+    """Перегенерировать ссылки подписок одного сервера."""
+    inbounds = await inbound_catalogue.get_inbounds(server, force=True)
+    if inbounds is None:
+        logger.error(f"Сервер {server.name}: не удалось получить inbounds, пропускаю.")
+        return 0
+
+    templates = {inbound.id: inbound.link_template for inbound in inbounds}
+    updated = 0
+    skipped = 0
+
+    last_id = 0
+    async with async_session() as session:
+        while True:
+            # Keyset-пагинация по id: пачка читается и записывается в одной сессии
+            rows = (
+                await session.execute(
+                    select(
+                        Subscription.id,
+                        Subscription.uuid,
+                        Subscription.email,
+                        Subscription.inbound_id,
+                    )
+                    .where(Subscription.server_id == server.id, Subscription.id > last_id)
+                    .order_by(Subscription.id)
+                    .limit(BATCH_SIZE)
+                )
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Группируем пачку по inbound, чтобы рендерить одним вызовом
+            by_inbound: Dict[int, List] = {}
+            for row in rows:
+                by_inbound.setdefault(row.inbound_id, []).append(row)
+
+            params = []
+            for inbound_id, inbound_rows in by_inbound.items():
+                template = templates.get(inbound_id)
+                if not template:
+                    skipped += len(inbound_rows)
+                    continue
+                links = template.render_many((r.uuid, r.email) for r in inbound_rows)
+                params.extend(
+                    {"id": r.id, "key_url": link} for r, link in zip(inbound_rows, links)
+                )
+
+            if params:
+                await session.execute(update(Subscription), params)
+                await session.commit()
+                updated += len(params)
+
+    logger.info(f"Сервер {server.name}: обновлено {updated}, inbound не найден у {skipped}.")
+    return updated
+
+
+async def main() -> None:
+    async with async_session() as session:
+        servers = (await session.scalars(select(Server))).all()
+
+    total = 0
+    for server in servers:
+        total += await regenerate_server(server)
+
+    await client_pool.close_all()
+    logger.info(f"Готово. Всего обновлено ссылок: {total}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
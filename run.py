@@ -6,13 +6,35 @@ import asyncio
 import logging
 import os
 import sys
+from functools import partial
 
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
 
-from app.database.models import create_tables
+from app.api.pool import client_pool
+from app.database.fsm_storage import (
+    FSM_PURGE_INTERVAL,
+    DatabaseStorage,
+    create_fsm_storage,
+)
+from app.database.migrations import ensure_schema
 from app.handlers import router
-from app.middlewares import CleanMessageMiddleware
+from app.middlewares import CleanMessageMiddleware, DbSessionMiddleware
+from app.services.broadcast import BROADCAST_LIMIT_INTERVAL, sync_send_limit
+from app.services.expiry import EXPIRY_INTERVAL, expiry_reaper
+from app.services.placement import PLACEMENT_ONLINE_INTERVAL, server_load
+from app.services.reconcile import RECONCILE_INTERVAL, reconcile_all
+from app.services.reminders import REMINDER_INTERVAL, reminders
+from app.services.traffic import TRAFFIC_INTERVAL, traffic_collector
+from app.utils.sender import SEND_STATS_INTERVAL, outbound
+from app.utils.tasks import start_periodic, stop_background_tasks
+from app.utils.webhook import (
+    BOT_MODE,
+    WEBHOOK_WORKERS,
+    ignore_termination_signals,
+    run_worker,
+    serve_webhook,
+)
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -26,7 +48,13 @@ if not TOKEN:
 
 # Инициализация бота и диспетчера
 bot = Bot(token=TOKEN)
-dp = Dispatcher()
+# Все запросы к Telegram проходят через планировщик с лимитами
+bot.session.middleware(outbound)
+fsm_storage = create_fsm_storage()
+dp = Dispatcher(storage=fsm_storage)
+
+# Одна сессия БД на апдейт
+dp.update.outer_middleware(DbSessionMiddleware())
 
 # Подключение middleware для очистки сообщений
 dp.message.middleware(CleanMessageMiddleware(max_messages=3))
@@ -36,20 +64,66 @@ dp.callback_query.middleware(CleanMessageMiddleware(max_messages=3))
 dp.include_router(router)
 
 
-async def main() -> None:
-    """Основная функция запуска бота."""
-    # Настройка логирования
+async def on_startup(background_tasks: bool = True) -> None:
+    """
+    Запуск фоновых задач.
+
+    Args:
+        background_tasks: False для воркеров webhook, кроме первого
+    """
+    start_periodic(outbound.log_stats, SEND_STATS_INTERVAL, "send_stats")
+    # Таблица нагрузки своя в каждом процессе
+    start_periodic(server_load.poll_online, PLACEMENT_ONLINE_INTERVAL, "online")
+    # Лимит отправки свой в каждом процессе: рассылка забирает долю у всех
+    start_periodic(sync_send_limit, BROADCAST_LIMIT_INTERVAL, "send_limit")
+    if not background_tasks:
+        return
+    start_periodic(expiry_reaper.run, EXPIRY_INTERVAL, "expiry")
+    start_periodic(partial(reminders.run, bot), REMINDER_INTERVAL, "reminders")
+    start_periodic(traffic_collector.run, TRAFFIC_INTERVAL, "traffic")
+    start_periodic(reconcile_all, RECONCILE_INTERVAL, "reconcile")
+    if isinstance(fsm_storage, DatabaseStorage):
+        start_periodic(fsm_storage.purge_expired, FSM_PURGE_INTERVAL, "fsm_purge")
+
+
+dp.startup.register(on_startup)
+
+# Остановка фоновых задач, отложенные удаления и закрытие сессий 3x-ui
+dp.shutdown.register(stop_background_tasks)
+dp.shutdown.register(outbound.close)
+dp.shutdown.register(client_pool.close_all)
+
+
+def setup_logging() -> None:
+    """Настройка логирования."""
     logging.basicConfig(
         level=getattr(logging, LOG_LEVEL, logging.INFO),
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         handlers=[logging.StreamHandler(sys.stdout)],
     )
 
+
+def webhook_worker(index: int, queue) -> None:
+    """Процесс-обработчик апдейтов в режиме webhook."""
+    ignore_termination_signals()
+    setup_logging()
+    # Воркеры отправляют от имени одного бота
+    outbound.share_global_limit(WEBHOOK_WORKERS)
+    asyncio.run(run_worker(bot, dp, queue, index))
+
+
+async def main() -> None:
+    """Основная функция запуска бота."""
+    setup_logging()
+
     logging.info("Starting VPN User Bot...")
     logging.info(f"Log level: {LOG_LEVEL}")
 
-    await create_tables()
-    await dp.start_polling(bot)
+    await ensure_schema()
+    if BOT_MODE == "webhook":
+        await serve_webhook(bot, dp, webhook_worker)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
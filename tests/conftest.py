@@ -0,0 +1,28 @@
+"""
+Общие фикстуры тестов.
+
+Переменные окружения выставляются до импорта модулей app: движок БД и
+секреты читаются при импорте. База — временный файл SQLite.
+"""
+
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/bot.db"
+os.environ["BOT_TOKEN"] = "123456:test-token"
+os.environ["INVOICE_SECRET"] = "test-secret"
+
+import pytest_asyncio  # noqa: E402
+
+from app.database.models import Base, engine  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def db():
+    """Пустая схема по моделям на время теста."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from app.database.models import Broadcast, BroadcastStatus
+from app.services import broadcast as broadcast_module
+from app.services.broadcast import BLOCKED, DELIVERED, FAILED, BroadcastRun
+from app.utils.sender import TokenBucket
+
+
+def make_run(last_user_id=0, sender=None):
+    broadcast = Broadcast(
+        id=1,
+        text="Привет",
+        status=BroadcastStatus.RUNNING,
+        admin_chat_id=1,
+        status_message_id=None,
+        total=5,
+        last_user_id=last_user_id,
+        delivered=0,
+        blocked=0,
+        failed=0,
+    )
+    return BroadcastRun(broadcast, sender, None, TokenBucket(1000, 1000))
+
+
+def test_watermark_advances_only_over_contiguous_sends():
+    run = make_run()
+    run._order.extend([1, 2, 3, 4])
+
+    run._complete(2, DELIVERED)
+    run._complete(4, BLOCKED)
+    assert run.watermark == 0
+    assert sum(run.counts.values()) == 0
+
+    run._complete(1, DELIVERED)
+    assert run.watermark == 2
+    assert run.counts == {DELIVERED: 2, BLOCKED: 0, FAILED: 0}
+
+    run._complete(3, FAILED)
+    assert run.watermark == 4
+    assert run.counts == {DELIVERED: 2, BLOCKED: 1, FAILED: 1}
+    assert not run._order and not run._outcomes
+
+
+class FakeSender:
+    """Отвечает с задержкой по убыванию id: отправки завершаются не по порядку."""
+
+    def __init__(self, blocked):
+        self.blocked = blocked
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        await asyncio.sleep((1000 - chat_id) / 100000)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(
+                SendMessage(chat_id=chat_id, text=text), "bot was blocked"
+            )
+        self.sent.append(chat_id)
+
+
+@pytest.mark.asyncio
+async def test_run_resumes_after_cursor_and_saves_it(monkeypatch):
+    users = [(user_id, 900 + user_id) for user_id in range(1, 6)]
+    checkpoints = []
+
+    async def get_page(after_id, limit):
+        return [user for user in users if user[0] > after_id][:2]
+
+    async def update_broadcast(broadcast_id, **values):
+        checkpoints.append(values)
+
+    monkeypatch.setattr(broadcast_module, "BROADCAST_LIMIT_INTERVAL", 0)
+    monkeypatch.setattr(broadcast_module.rq, "get_user_tg_ids_page", get_page)
+    monkeypatch.setattr(broadcast_module.rq, "update_broadcast", update_broadcast)
+    sender = FakeSender(blocked={904})
+
+    await make_run(last_user_id=1, sender=sender).run()
+
+    assert sorted(sender.sent) == [902, 903, 905]
+    assert checkpoints[-1] == {
+        "last_user_id": 5,
+        "delivered": 3,
+        "blocked": 1,
+        "failed": 0,
+        "status": BroadcastStatus.DONE,
+        "finished_at": checkpoints[-1]["finished_at"],
+    }
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+import pytest
+
+from app.services.invoice import (
+    InvoicePayload,
+    build_invoice_payload,
+    check_invoice,
+    parse_invoice_payload,
+)
+
+
+def test_payload_round_trip():
+    payload = build_invoice_payload(3, 7, 123456789, Decimal("12.34"), 42)
+
+    assert payload.startswith("v2:3:7:123456789:1234:42:")
+    assert len(payload.encode()) <= 128
+    assert parse_invoice_payload(payload) == InvoicePayload(
+        plan_id=3,
+        tg_id=123456789,
+        balance_used=Decimal("12.34"),
+        server_id=7,
+        catalogue_version=42,
+    )
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [(1, "4"), (2, "8"), (3, "987654321"), (4, "0"), (5, "43")],
+)
+def test_tampered_payload_is_rejected(field, value):
+    parts = build_invoice_payload(3, 7, 123456789, Decimal("12.34"), 42).split(":")
+    parts[field] = value
+
+    assert parse_invoice_payload(":".join(parts)) is None
+
+
+def test_payload_signed_with_other_secret_is_rejected(monkeypatch):
+    payload = build_invoice_payload(3, 7, 123456789, Decimal(0), 42)
+    monkeypatch.setattr("app.services.invoice.INVOICE_SECRET", "other-secret")
+
+    assert parse_invoice_payload(payload) is None
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        (
+            "vpn_payment:3:123456789",
+            InvoicePayload(plan_id=3, tg_id=123456789, balance_used=Decimal(0)),
+        ),
+        (
+            "vpn_payment:3:123456789:50.5",
+            InvoicePayload(plan_id=3, tg_id=123456789, balance_used=Decimal("50.5")),
+        ),
+    ],
+)
+def test_legacy_payload(payload, expected):
+    assert parse_invoice_payload(payload) == expected
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        "",
+        "garbage",
+        "vpn_payment:3",
+        "vpn_payment:x:123456789",
+        "vpn_payment:3:123456789:abc",
+        "v2:3:7:123456789:1234:42",
+    ],
+)
+def test_unknown_payload(payload):
+    assert parse_invoice_payload(payload) is None
+
+
+@pytest.mark.asyncio
+async def test_check_invoice_rejects_foreign_or_unparsed_order():
+    invoice = parse_invoice_payload(
+        build_invoice_payload(3, 7, 123456789, Decimal(0), 42)
+    )
+
+    assert await check_invoice(invoice, 111, 19900) is not None
+    assert await check_invoice(None, 123456789, 19900) is not None
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import migrations
+from app.database.migrations import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    ensure_schema,
+    get_schema_version,
+    migrate,
+)
+from app.database.models import Base
+
+# Схема, которую создавал create_all до появления миграций
+BASELINE_SCHEMA = [
+    """CREATE TABLE admins (
+        id INTEGER NOT NULL, tg_id BIGINT NOT NULL, username VARCHAR(255),
+        is_active BOOLEAN NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        PRIMARY KEY (id))""",
+    "CREATE UNIQUE INDEX ix_admins_tg_id ON admins (tg_id)",
+    """CREATE TABLE plans (
+        id INTEGER NOT NULL, name VARCHAR(100) NOT NULL,
+        price DECIMAL(10, 2) NOT NULL, duration_days INTEGER NOT NULL,
+        data_limit_gb INTEGER NOT NULL, is_active BOOLEAN NOT NULL,
+        PRIMARY KEY (id))""",
+    """CREATE TABLE servers (
+        id INTEGER NOT NULL, name VARCHAR(100) NOT NULL,
+        api_url VARCHAR(255) NOT NULL, username VARCHAR(100) NOT NULL,
+        password VARCHAR(100) NOT NULL, location VARCHAR(100) NOT NULL,
+        is_active BOOLEAN NOT NULL, max_clients INTEGER,
+        PRIMARY KEY (id), UNIQUE (name))""",
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, tg_id BIGINT NOT NULL, username VARCHAR(255),
+        full_name VARCHAR(255) NOT NULL, balance DECIMAL(10, 2) NOT NULL,
+        referrer_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(referrer_id) REFERENCES users (id))""",
+    "CREATE UNIQUE INDEX ix_users_tg_id ON users (tg_id)",
+    """CREATE TABLE payments (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+        amount DECIMAL(10, 2) NOT NULL, currency VARCHAR(10) NOT NULL,
+        status VARCHAR(20) NOT NULL, provider_id VARCHAR(255),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE subscriptions (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL,
+        server_id INTEGER NOT NULL, plan_id INTEGER NOT NULL,
+        uuid VARCHAR(36) NOT NULL, email VARCHAR(100) NOT NULL,
+        inbound_id INTEGER NOT NULL, key_url VARCHAR,
+        status VARCHAR(20) NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+        expires_at DATETIME NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(server_id) REFERENCES servers (id),
+        FOREIGN KEY(plan_id) REFERENCES plans (id),
+        UNIQUE (uuid), UNIQUE (email))""",
+    "INSERT INTO users (id, tg_id, full_name, balance) VALUES (1, 42, 'Old', 10)",
+]
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path, monkeypatch):
+    """Отдельная база для раннера миграций."""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/migrate.db", connect_args={"timeout": 30}
+    )
+    monkeypatch.setattr(migrations, "engine", engine)
+    yield engine
+    await engine.dispose()
+
+
+async def schema(engine):
+    def read(sync_conn):
+        inspector = inspect(sync_conn)
+        return {
+            table: (
+                {column["name"] for column in inspector.get_columns(table)},
+                {index["name"] for index in inspector.get_indexes(table)},
+            )
+            for table in inspector.get_table_names()
+        }
+
+    async with engine.connect() as conn:
+        return await conn.run_sync(read)
+
+
+async def applied(engine):
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT version FROM schema_migrations ORDER BY version")
+        )
+        return [version for (version,) in result]
+
+
+@pytest.mark.asyncio
+async def test_fresh_database(engine):
+    assert await get_schema_version() == 0
+
+    assert await migrate() == len(MIGRATIONS)
+
+    assert await get_schema_version() == SCHEMA_VERSION
+    assert await applied(engine) == [m.version for m in MIGRATIONS]
+    tables = await schema(engine)
+    assert set(Base.metadata.tables) <= set(tables)
+    assert await migrate() == 0
+
+
+@pytest.mark.asyncio
+async def test_baseline_database_is_upgraded_in_place(engine):
+    async with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            await conn.execute(text(statement))
+
+    await ensure_schema()
+
+    assert await applied(engine) == [m.version for m in MIGRATIONS]
+    tables = await schema(engine)
+    for table in Base.metadata.sorted_tables:
+        columns, indexes = tables[table.name]
+        assert {column.name for column in table.columns} <= columns, table.name
+        # *_pattern создаются только в PostgreSQL
+        expected = {
+            index.name for index in table.indexes if not index.name.endswith("_pattern")
+        }
+        assert expected <= indexes, table.name
+
+    async with engine.connect() as conn:
+        user = (
+            await conn.execute(text("SELECT tg_id, balance, received_bonus FROM users"))
+        ).one()
+        catalogue = await conn.scalar(
+            text("SELECT version FROM cache_versions WHERE name = 'catalogue'")
+        )
+    assert (user.tg_id, user.balance, bool(user.received_bonus)) == (42, 10, False)
+    assert catalogue == 0
+
+
+@pytest.mark.asyncio
+async def test_ensure_schema_skips_current_database(engine, monkeypatch):
+    await migrate()
+
+    async def fail():
+        raise AssertionError("migrate() on a current schema")
+
+    monkeypatch.setattr(migrations, "migrate", fail)
+    await ensure_schema()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_runs_apply_each_revision_once(engine):
+    results = await asyncio.gather(migrate(), migrate())
+
+    assert sorted(results) == [0, len(MIGRATIONS)]
+    assert await applied(engine) == [m.version for m in MIGRATIONS]
+
+
+@pytest.mark.asyncio
+async def test_failed_run_leaves_no_partial_schema(engine, monkeypatch):
+    async def broken(conn):
+        raise RuntimeError("broken revision")
+
+    monkeypatch.setattr(
+        migrations,
+        "MIGRATIONS",
+        [MIGRATIONS[0], migrations.Migration(2, "users_received_bonus", broken)],
+    )
+
+    with pytest.raises(RuntimeError):
+        await migrate()
+
+    assert await schema(engine) == {}
@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import placement
+from app.services.placement import ServerLoad
+
+
+def server(server_id, max_clients=None, is_active=True):
+    return SimpleNamespace(
+        id=server_id,
+        name=f"srv-{server_id}",
+        max_clients=max_clients,
+        is_active=is_active,
+    )
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    """Серверы каталога и счётчики подписок в БД."""
+    state = SimpleNamespace(servers=[], counts={}, syncs=0)
+
+    async def get_active_servers():
+        return [s for s in state.servers if s.is_active]
+
+    async def get_counts():
+        state.syncs += 1
+        return dict(state.counts)
+
+    monkeypatch.setattr(placement.catalogue, "get_active_servers", get_active_servers)
+    monkeypatch.setattr(placement.rq, "get_server_subscription_counts", get_counts)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_choose_least_filled_server(cluster):
+    cluster.servers = [server(1, max_clients=10), server(2, max_clients=100)]
+    cluster.counts = {1: 5, 2: 20}
+
+    assert (await ServerLoad().choose()).id == 2
+
+
+@pytest.mark.asyncio
+async def test_full_and_disabled_servers_are_skipped(cluster):
+    cluster.servers = [server(1, max_clients=5), server(2, is_active=False)]
+    cluster.counts = {1: 5}
+
+    assert await ServerLoad().choose() is None
+
+
+@pytest.mark.asyncio
+async def test_place_reserves_and_release_frees(cluster):
+    cluster.servers = [server(1, max_clients=2), server(2, max_clients=2)]
+    load = ServerLoad()
+
+    placed = [(await load.place()).id for _ in range(4)]
+    assert sorted(placed) == [1, 1, 2, 2]
+    assert await load.place() is None
+
+    load.release(2)
+    assert (await load.place()).id == 2
+
+
+def test_release_never_goes_negative():
+    load = ServerLoad()
+    load.reserve(1)
+
+    load.release(1, count=3)
+    load.release(None)
+
+    assert load.load(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_counts_resync_after_interval(cluster, monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(placement.time, "monotonic", lambda: clock.now)
+    cluster.servers = [server(1, max_clients=10)]
+    load = ServerLoad(sync_interval=60)
+
+    await load.place()
+    await load.place()
+    assert (await load.get_counts(), cluster.syncs) == ({1: 2}, 1)
+
+    # Подписки, выданные другим процессом, подхватываются при сверке
+    cluster.counts = {1: 7}
+    clock.now += 60
+    assert (await load.get_counts(), cluster.syncs) == ({1: 7}, 2)
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_server_is_avoided(cluster):
+    cluster.servers = [server(1), server(2)]
+    cluster.counts = {2: 10}
+    load = ServerLoad()
+
+    load.mark_failed(1)
+    assert (await load.choose()).id == 2
+
+    load.mark_failed(2)
+    assert (await load.choose()).id == 1
+
+    load.mark_ok(2)
+    assert (await load.choose()).id == 2
+
+
+@pytest.mark.asyncio
+async def test_equal_fill_prefers_fewer_online(cluster):
+    cluster.servers = [server(1, max_clients=10), server(2, max_clients=10)]
+    cluster.counts = {1: 3, 2: 3}
+    load = ServerLoad()
+    assert (await load.choose()).id == 1
+
+    load._online = {1: 5, 2: 1}
+    assert (await load.choose()).id == 2
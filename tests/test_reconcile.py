@@ -0,0 +1,257 @@
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.three_x_ui import ClientResult
+from app.database.models import (
+    Plan,
+    Server,
+    Subscription,
+    SubscriptionStatus,
+    User,
+    async_session,
+)
+from app.services import reconcile
+from app.services.reconcile import GB, _desired_patch, _expiry_ms, reconcile_server
+
+NOW = datetime(2026, 3, 1, 12, 0)
+EXPIRES = NOW + timedelta(days=10)
+
+
+def row(**values):
+    defaults = dict(
+        uuid="u1",
+        email="user_1",
+        status=SubscriptionStatus.ACTIVE,
+        expires_at=EXPIRES,
+        data_limit_gb=50,
+    )
+    return SimpleNamespace(**{**defaults, **values})
+
+
+def panel_client(**values):
+    defaults = dict(
+        id="u1",
+        email="user_1",
+        expiryTime=_expiry_ms(EXPIRES),
+        totalGB=50 * GB,
+        enable=True,
+    )
+    return {**defaults, **values}
+
+
+def test_patch_empty_when_in_sync():
+    assert _desired_patch(row(), panel_client(), None, NOW) == {}
+
+
+def test_patch_tolerates_sub_second_expiry_drift():
+    client = panel_client(expiryTime=_expiry_ms(EXPIRES) + 500)
+
+    assert _desired_patch(row(), client, None, NOW) == {}
+
+
+def test_patch_fixes_expiry_and_limit():
+    client = panel_client(expiryTime=0, totalGB=0)
+
+    assert _desired_patch(row(), client, None, NOW) == {
+        "expiryTime": _expiry_ms(EXPIRES),
+        "totalGB": 50 * GB,
+    }
+
+
+def test_patch_keeps_limit_of_custom_clients():
+    client = panel_client(email="gift_1", totalGB=0)
+
+    assert _desired_patch(row(email="gift_1"), client, None, NOW) == {}
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"expires_at": NOW - timedelta(days=1)},
+        {"status": SubscriptionStatus.EXPIRED},
+    ],
+)
+def test_patch_disables_inactive_subscription(values):
+    subscription = row(**values)
+    client = panel_client(expiryTime=_expiry_ms(subscription.expires_at))
+
+    assert _desired_patch(subscription, client, None, NOW) == {"enable": False}
+
+
+def test_patch_does_not_enable_client_out_of_traffic():
+    client = panel_client(enable=False)
+    depleted = {"up": 30 * GB, "down": 20 * GB, "total": 50 * GB}
+
+    assert _desired_patch(row(), client, depleted, NOW) == {}
+    assert _desired_patch(row(), client, None, NOW) == {"enable": True}
+
+
+class FakePanel:
+    """Клиент 3x-ui с одним inbound'ом в памяти."""
+
+    def __init__(self, clients):
+        self.clients = {client["id"]: client for client in clients}
+        self.updated, self.added, self.deleted = [], [], []
+
+    async def get_inbounds(self):
+        settings = json.dumps({"clients": list(self.clients.values())})
+        return {
+            "success": True,
+            "obj": [{"id": 1, "settings": settings, "clientStats": []}],
+        }
+
+    async def update_client_data(self, inbound_id, client_data):
+        self.updated.append(client_data["id"])
+        return True
+
+    async def add_clients(self, inbound_id, specs):
+        self.added.extend(spec.uuid for spec in specs)
+        return [ClientResult(spec.email, spec.uuid, True) for spec in specs]
+
+    async def delete_client(self, inbound_id, client_uuid):
+        self.deleted.append(client_uuid)
+        return True
+
+
+async def seed(subscriptions):
+    expires = datetime.now() + timedelta(days=10)
+    async with async_session() as session:
+        server = Server(
+            name="de-1",
+            api_url="https://panel.example:2053/path",
+            username="admin",
+            password="secret",
+            location="Germany",
+        )
+        plan = Plan(name="Месяц", price=199, duration_days=30, data_limit_gb=0)
+        user = User(tg_id=1, full_name="Test")
+        session.add_all([server, plan, user])
+        await session.flush()
+        for uuid, status in subscriptions:
+            session.add(
+                Subscription(
+                    user_id=user.id,
+                    server_id=server.id,
+                    plan_id=plan.id,
+                    uuid=uuid,
+                    email=f"user_{uuid}",
+                    inbound_id=1,
+                    status=status,
+                    expires_at=expires,
+                )
+            )
+        await session.commit()
+        return server, expires
+
+
+def synced(uuid, expires):
+    return {
+        "id": uuid,
+        "email": f"user_{uuid}",
+        "expiryTime": _expiry_ms(expires),
+        "totalGB": 0,
+        "enable": True,
+    }
+
+
+def use_panel(monkeypatch, panel):
+    async def acquire(server):
+        return panel
+
+    monkeypatch.setattr(reconcile.client_pool, "acquire", acquire)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_sends_only_differences(db, monkeypatch):
+    server, expires = await seed(
+        [
+            ("ok", SubscriptionStatus.ACTIVE),
+            ("stale", SubscriptionStatus.ACTIVE),
+            ("lost", SubscriptionStatus.ACTIVE),
+            ("gone", SubscriptionStatus.EXPIRED),
+        ]
+    )
+    panel = FakePanel(
+        [
+            synced("ok", expires),
+            {**synced("stale", expires), "expiryTime": 0},
+            synced("orphan", expires),
+        ]
+    )
+    use_panel(monkeypatch, panel)
+
+    report = await reconcile_server(server, delete_orphans=True)
+
+    assert (panel.updated, panel.added, panel.deleted) == (
+        ["stale"],
+        ["lost"],
+        ["orphan"],
+    )
+    assert (report.in_sync, report.updated, report.created) == (2, 1, 1)
+    assert (report.orphaned, report.deleted, report.failed) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_dry_run_changes_nothing(db, monkeypatch):
+    server, expires = await seed([("lost", SubscriptionStatus.ACTIVE)])
+    panel = FakePanel([synced("orphan", expires)])
+    use_panel(monkeypatch, panel)
+
+    report = await reconcile_server(server, delete_orphans=True, dry_run=True)
+
+    assert (report.created, report.orphaned) == (1, 1)
+    assert (panel.updated, panel.added, panel.deleted) == ([], [], [])
+
+
+@pytest.mark.asyncio
+async def test_reconcile_rechecks_key_replaced_during_run(db, monkeypatch):
+    # Сверка прочитала подписки до того, как ключ заменили: в выборке старый
+    # uuid, на панели уже новый клиент, а в БД — новый uuid
+    server, expires = await seed([("new", SubscriptionStatus.ACTIVE)])
+    snapshot = [
+        SimpleNamespace(
+            uuid="old",
+            email="user_old",
+            inbound_id=1,
+            status=SubscriptionStatus.ACTIVE,
+            expires_at=expires,
+            data_limit_gb=0,
+        )
+    ]
+
+    async def load_subscriptions(server_id):
+        return snapshot
+
+    monkeypatch.setattr(reconcile, "_load_subscriptions", load_subscriptions)
+    panel = FakePanel([synced("new", expires)])
+    use_panel(monkeypatch, panel)
+
+    report = await reconcile_server(server, delete_orphans=True)
+
+    assert panel.added == [] and panel.deleted == []
+    assert (report.in_sync, report.created, report.orphaned) == (1, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_skips_update_of_row_changed_during_run(db, monkeypatch):
+    # Подписку продлили после того, как сверка прочитала её строку
+    server, expires = await seed([("renewed", SubscriptionStatus.ACTIVE)])
+    fresh = (await reconcile._load_subscriptions(server.id))[0]
+    snapshot = [
+        SimpleNamespace(**{**fresh._asdict(), "expires_at": expires - timedelta(30)})
+    ]
+
+    async def load_subscriptions(server_id):
+        return snapshot
+
+    monkeypatch.setattr(reconcile, "_load_subscriptions", load_subscriptions)
+    panel = FakePanel([synced("renewed", expires)])
+    use_panel(monkeypatch, panel)
+
+    report = await reconcile_server(server)
+
+    assert panel.updated == []
+    assert (report.in_sync, report.updated, report.failed) == (1, 0, 0)
@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from app.utils import sender
+from app.utils.sender import OutboundScheduler, TokenBucket, chunked_ids
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sender.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    """asyncio.sleep планировщика: записывает паузы и двигает часы."""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        clock.now += delay
+
+    monkeypatch.setattr(sender.asyncio, "sleep", sleep)
+    return delays
+
+
+BOT = SimpleNamespace(id=1)
+
+
+def test_bucket_allows_burst_then_spaces_requests(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert [bucket.reserve() for _ in range(3)] == [0.5, 1.0, 1.5]
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.reserve()
+
+    clock.now += 1
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0.5]
+
+    clock.now += 60
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0, 0.5]
+
+
+def test_bucket_is_idle_only_when_full(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.is_idle()
+
+    bucket.reserve()
+    assert not bucket.is_idle()
+
+    clock.now += 1
+    assert bucket.is_idle()
+
+
+def test_set_rate_keeps_debt(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    for _ in range(15):
+        bucket.reserve()
+
+    bucket.set_rate(5, 5)
+
+    assert bucket.reserve() == pytest.approx(1.2)
+
+
+def test_broadcast_rate_comes_out_of_global_limit(clock, monkeypatch):
+    monkeypatch.setattr(sender, "SEND_GLOBAL_RATE", 25)
+    scheduler = OutboundScheduler()
+    scheduler.share_global_limit(2)
+    bucket = scheduler._global_bucket(BOT.id)
+    assert bucket.rate == 12.5
+
+    scheduler.reserve_global_rate(10)
+    assert scheduler.global_rate == bucket.rate == 7.5
+
+    scheduler.reserve_global_rate(0)
+    assert scheduler.global_rate == bucket.rate == 12.5
+
+
+def test_reserved_rate_leaves_minimal_limit(monkeypatch):
+    monkeypatch.setattr(sender, "SEND_GLOBAL_RATE", 25)
+    scheduler = OutboundScheduler()
+
+    scheduler.reserve_global_rate(40)
+
+    assert scheduler.global_rate == 1.0
+
+
+def test_chunked_ids():
+    chunks = list(chunked_ids(set(range(250, 0, -1))))
+
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert chunks[0][:3] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_messages_per_chat(sleeps):
+    scheduler = OutboundScheduler()
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.chat_id)
+        return True
+
+    for chat_id in (10, 10, 10, 10, 20):
+        await scheduler(make_request, BOT, SendMessage(chat_id=chat_id, text="x"))
+
+    assert sent == [10, 10, 10, 10, 20]
+    # Четвёртое сообщение в чат 10 ждёт токен, чат 20 — нет
+    assert sleeps == [pytest.approx(1 / sender.SEND_CHAT_RATE)]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_skips_methods_without_chat(sleeps):
+    scheduler = OutboundScheduler()
+
+    async def make_request(bot, method):
+        return "me"
+
+    for _ in range(100):
+        assert await scheduler(make_request, BOT, GetMe()) == "me"
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_scheduler_pauses_and_retries_on_retry_after(sleeps):
+    scheduler = OutboundScheduler()
+    method = SendMessage(chat_id=10, text="x")
+    attempts = []
+
+    async def make_request(bot, method):
+        attempts.append(method)
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=7)
+        return "ok"
+
+    assert await scheduler(make_request, BOT, method) == "ok"
+    assert len(attempts) == 2
+    assert sleeps == [7]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_gives_up_after_max_retries(sleeps, monkeypatch):
+    monkeypatch.setattr(sender, "SEND_MAX_RETRIES", 2)
+    scheduler = OutboundScheduler()
+    method = SendMessage(chat_id=10, text="x")
+
+    async def make_request(bot, method):
+        raise TelegramRetryAfter(method, "Too Many Requests", retry_after=1)
+
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler(make_request, BOT, method)
+    assert sleeps == [1, 1]
@@ -0,0 +1,128 @@
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select
+
+from app.database import requests as rq
+from app.database.fsm_storage import DatabaseStorage
+from app.database.models import FsmRecord, User, async_session
+from app.database.unit_of_work import commit_update, on_commit, on_rollback
+from app.middlewares.db_session import DbSessionMiddleware
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+async def stored_users():
+    async with async_session() as session:
+        return set(await session.scalars(select(User.tg_id)))
+
+
+async def stored_state():
+    async with async_session() as session:
+        return await session.scalar(select(FsmRecord.state))
+
+
+async def run_update(handler):
+    return await DbSessionMiddleware()(handler, object(), {})
+
+
+@pytest.mark.asyncio
+async def test_handler_error_rolls_back_update_writes(db):
+    events = []
+
+    async def handler(event, data):
+        session = data["session"]
+        await rq.add_user(1, "Ann", None, "ann", session=session)
+        await rq.add_balance(1, 100, session=session)
+        await on_commit(lambda: _record(events, "commit"), session)
+        on_rollback(lambda: _record(events, "rollback"), session)
+        raise RuntimeError("panel down")
+
+    with pytest.raises(RuntimeError):
+        await run_update(handler)
+
+    assert await stored_users() == set()
+    assert events == ["rollback"]
+
+
+@pytest.mark.asyncio
+async def test_update_writes_commit_after_handler(db):
+    events = []
+
+    async def handler(event, data):
+        session = data["session"]
+        await rq.add_user(1, "Ann", None, "ann", session=session)
+        # До конца апдейта записи не видны другим соединениям
+        events.append(await stored_users())
+
+        async def after_commit():
+            events.append(await stored_users())
+
+        await on_commit(after_commit, session)
+        on_rollback(lambda: _record(events, "rollback"), session)
+        return "done"
+
+    assert await run_update(handler) == "done"
+    assert events == [set(), {1}]
+
+
+@pytest.mark.asyncio
+async def test_explicit_commit_point_keeps_earlier_writes(db):
+    async def handler(event, data):
+        session = data["session"]
+        await rq.add_user(1, "Ann", None, "ann", session=session)
+        await commit_update(session)
+        await rq.add_user(2, "Bob", None, "bob", session=session)
+        raise RuntimeError("send failed")
+
+    with pytest.raises(RuntimeError):
+        await run_update(handler)
+
+    assert await stored_users() == {1}
+
+
+@pytest.mark.asyncio
+async def test_repository_without_session_commits_immediately(db):
+    events = []
+
+    await rq.add_user(1, "Ann", None, "ann")
+    await on_commit(lambda: _record(events, "commit"), None)
+
+    assert await stored_users() == {1}
+    assert events == ["commit"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fails", [False, True])
+async def test_fsm_writes_after_update_transaction(db, fails):
+    storage = DatabaseStorage()
+    seen = []
+
+    async def handler(event, data):
+        await rq.add_user(1, "Ann", None, "ann", session=data["session"])
+        await storage.set_state(KEY, "buy:plan")
+        await storage.set_data(KEY, {"plan_id": 3})
+        seen.append(
+            (
+                await storage.get_state(KEY),
+                await storage.get_data(KEY),
+                await stored_state(),
+            )
+        )
+        if fails:
+            raise RuntimeError("handler failed")
+
+    if fails:
+        with pytest.raises(RuntimeError):
+            await run_update(handler)
+    else:
+        await run_update(handler)
+
+    # Хендлер видит своё состояние, база — только после транзакции апдейта
+    assert seen == [("buy:plan", {"plan_id": 3}, None)]
+    assert await storage.get_state(KEY) == "buy:plan"
+    assert await storage.get_data(KEY) == {"plan_id": 3}
+    assert await stored_users() == (set() if fails else {1})
+
+
+async def _record(events, name):
+    events.append(name)